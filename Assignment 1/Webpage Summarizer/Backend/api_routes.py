@@ -1,19 +1,109 @@
-from flask import jsonify, request
+from flask import Response, jsonify, request, stream_with_context
+import itertools
+import json
 import logging
+import math
+from backend_common.admission import AdmissionRejected, admission
+from backend_common.circuit_breaker import CircuitOpen, breakers
+from backend_common.metrics import CONTENT_TYPE, register_cache, register_upstream, registry, track_requests
+from backend_common.tracing import slow_requests, span, trace_requests
+from backend_common.upstream_client import upstream
+from chunked_summarizer import CHUNK_TOKENS, MAX_CHUNK_TOKENS, MIN_CHUNK_TOKENS, chunked_summarizer
+from extractive import EXTRACTIVE_TOKEN_BUDGET, condense, extract
+from job_manager import job_manager
+from keywords import KEYWORDS_MAX_DOCUMENTS, KEYWORDS_MAX_TOP, keyword_extractor
 from llm_service import llm_service
-from markdown import markdown
+from markdown_renderer import markdown_renderer
+from response_cache import RESPONSE_CACHE_TTL, response_cache, response_key
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+register_cache('response', response_cache)
+register_upstream(upstream)
+registry.collector('generate_coalesced_total', 'Generate requests that joined an in-flight generation',
+                   'counter', (), lambda: {(): llm_service.flights.stats()['coalesced']})
+registry.collector('generate_in_flight', 'Upstream generations running', 'gauge', (),
+                   lambda: {(): llm_service.flights.stats()['in_flight']})
+registry.collector('ui_jobs', 'Web UI generation jobs by state', 'gauge', ('state',),
+                   lambda: {(state,): job_manager.stats()[state] for state in ('queued', 'running')})
+
+def _error_response(result):
+    """Return a failed generation as 400, or with Retry-After as 429 if it was
+    shed or 503 if a circuit breaker failed it fast"""
+    if 'retry_after' in result:
+        response = jsonify(result)
+        response.headers['Retry-After'] = str(result['retry_after'])
+        return response, 503 if 'circuit' in result else 429
+    return jsonify(result), 400
+
+def _bounded_int(value, low, high=None):
+    """``value`` as an integer from ``low`` to ``high``, or None if it isn't one"""
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if number < low or (high is not None and number > high):
+        return None
+    return number
+
+def _invalid_token_budget(data):
+    """A 400 response if the request's text comes with a token_budget that
+    isn't a positive integer, else None"""
+    if data.get('text') and _bounded_int(data.get('token_budget', EXTRACTIVE_TOKEN_BUDGET), 1) is None:
+        return jsonify({'status': 'error', 'message': 'token_budget must be a positive integer'}), 400
+    return None
+
+def _invalid_temperature(data):
+    """A 400 response if the request's temperature isn't a non-negative
+    number, else None"""
+    try:
+        temperature = float(data.get('temperature', 0.7))
+    except (TypeError, ValueError):
+        temperature = None
+    if temperature is None or not math.isfinite(temperature) or temperature < 0:
+        return jsonify({'status': 'error', 'message': 'temperature must be a non-negative number'}), 400
+    return None
+
+def _build_prompt(data):
+    """Append the request's page text to its prompt, condensed to the token budget.
+
+    Returns the prompt, a report of the condensing and the ``(instruction,
+    text)`` pair the semantic cache compares. The report is None when the
+    request carries its text inside the prompt, which is then compared whole.
+    """
+    if not data.get('text'):
+        return data['prompt'], None, ('', data['prompt'])
+    condensed = condense(data['text'], _bounded_int(data.get('token_budget', EXTRACTIVE_TOKEN_BUDGET), 1))
+    text = condensed.pop('text')
+    return f"{data['prompt']}\n\n{text}", condensed, (data['prompt'], text)
+
+def _sse_event(event, payload):
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
 def register_routes(app):
     """Register API routes with the Flask app"""
+    track_requests(app)
+    trace_requests(app)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus metrics for this process"""
+        return Response(registry.render(), content_type=CONTENT_TYPE)
     
     @app.route('/api/models', methods=['GET'])
     def list_models():
         """API endpoint to list available models"""
         try:
             logger.info("API: Fetching models list")
+            if request.args.get('refresh'):
+                result = llm_service.refresh_models()
+                return jsonify({
+                    'status': result['status'],
+                    'models': result['models'],
+                    'refreshed': result['status'] == 'success'
+                })
             models, _ = llm_service.get_available_models()
             response = jsonify({
                 'status': 'success',
@@ -27,6 +117,73 @@ def register_routes(app):
                 'message': str(e)
             }), 500
 
+    @app.route('/api/upstream/stats', methods=['GET'])
+    def upstream_stats():
+        """API endpoint to report upstream connection pool usage"""
+        return jsonify({
+            'status': 'success',
+            'hosts': upstream.stats()
+        })
+
+    @app.route('/api/generate/stats', methods=['GET'])
+    def generate_stats():
+        """API endpoint to report coalescing and web UI job queue usage"""
+        return jsonify({
+            'status': 'success',
+            'coalescing': llm_service.flights.stats(),
+            'jobs': job_manager.stats()
+        })
+
+    @app.route('/api/admission/stats', methods=['GET'])
+    def admission_stats():
+        """API endpoint to report per-model concurrency, queue depth and wait times"""
+        return jsonify({
+            'status': 'success',
+            'admission': admission.stats()
+        })
+
+    @app.route('/api/warmup/stats', methods=['GET'])
+    def warmup_stats():
+        """API endpoint to report resident models and per-model cold and warm latency"""
+        return jsonify({
+            'status': 'success',
+            'warmup': llm_service.warmer.stats()
+        })
+
+    @app.route('/api/pool/stats', methods=['GET'])
+    def pool_stats():
+        """API endpoint to report load, latency, health and loaded models per Ollama host"""
+        return jsonify({
+            'status': 'success',
+            'hosts': llm_service.pool.stats()
+        })
+
+    @app.route('/api/breakers/stats', methods=['GET'])
+    def breaker_stats():
+        """API endpoint to report the state of every circuit breaker"""
+        return jsonify({
+            'status': 'success',
+            'breakers': breakers.stats()
+        })
+
+    @app.route('/api/traces/slow', methods=['GET'])
+    def slow_traces():
+        """API endpoint to report per-phase breakdowns of recent slow requests"""
+        return jsonify({
+            'status': 'success',
+            'traces': slow_requests.stats()
+        })
+
+    @app.route('/api/cache/stats', methods=['GET'])
+    def cache_stats():
+        """API endpoint to report response cache usage"""
+        semantic_cache = llm_service.semantic_cache
+        return jsonify({
+            'status': 'success',
+            'cache': response_cache.stats(),
+            'semantic': semantic_cache.stats() if semantic_cache is not None else None
+        })
+
     @app.route('/api/generate', methods=['POST'])
     def generate():
         """API endpoint to generate response from a model"""
@@ -43,45 +200,313 @@ def register_routes(app):
                 return jsonify({'status': 'error', 'message': 'No model selected'}), 400
             
             # Log the request
-            logger.info(f"API: Generate request using model: {data['model']}")
+            logger.info("API: Generate request using model: %s", data['model'])
             
+            invalid = _invalid_token_budget(data) or _invalid_temperature(data)
+            if invalid is not None:
+                return invalid
+
             temperature = data.get('temperature', 0.7)
             output_format = data.get('format', 'markdown')  # Default to markdown
+            with span('prompt'):
+                prompt, extractive, semantic = _build_prompt(data)
             
-            # Generate response using LLM service
-            result = llm_service.generate_response(data['model'], data['prompt'], temperature)
-            
-            if result['status'] == 'success':
-                response = result['response']
-                
-                # Convert markdown to HTML if requested
-                if output_format == 'html':
+            # Fresh output only differs from a cached answer when sampling is random
+            fresh = bool(data.get('fresh')) and float(temperature) > 0
+            key = response_key(data['model'], prompt, temperature)
+            with span('cache'):
+                entry, tier = (None, None) if fresh else response_cache.get(key)
+
+            if entry is not None:
+                cache_info = {'status': 'hit', 'tier': tier}
+                timing = None
+                store = False
+            else:
+                # Generate response using LLM service, reusing the answer for
+                # a near-duplicate page when the semantic cache is enabled
+                with span('provider'):
+                    result = llm_service.generate_response(
+                        data['model'], prompt, temperature,
+                        semantic=None if fresh or not data.get('semantic', True) else semantic)
+                if result['status'] != 'success':
+                    return _error_response(result)
+                entry = {'markdown': result['response']}
+                cache_info = {'status': 'bypass' if fresh else 'miss'}
+                if result.get('semantic', {}).get('status') == 'hit':
+                    cache_info = {'status': 'semantic', 'similarity': result['semantic']['similarity']}
+                elif 'semantic' in result:
+                    cache_info['similarity'] = result['semantic']['similarity']
+                timing = result['timing']
+                store = True
+
+            response = entry['markdown']
+
+            # Convert markdown to HTML if requested, reusing a cached rendering
+            if output_format == 'html':
+                if 'html' in entry:
+                    response = entry['html']
+                else:
                     try:
-                        logger.debug("Converting markdown to HTML...")
-                        logger.debug(f"Input markdown: {response[:200]}...")
-                        
-                        response = markdown(response, 
-                                         extensions=['extra', 'nl2br', 'sane_lists'],
-                                         output_format='html5')
-                        
-                        logger.debug(f"Converted HTML: {response[:200]}...")
+                        with span('render'):
+                            response = markdown_renderer.render(response)
+                        entry = {**entry, 'html': response}
+                        store = True
                     except Exception as e:
                         logger.error(f"Error converting markdown to HTML: {str(e)}")
-                        logger.debug(f"Problematic markdown content: {response[:500]}")
+                        # Previews are only built when debug logging is on
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"Problematic markdown content: {response[:500]}")
                         # Return original response if conversion fails
                         logger.debug("Falling back to original markdown response")
+
+            if store:
+                response_cache.set(key, entry, RESPONSE_CACHE_TTL)
+
+            body = {
+                'status': 'success',
+                'response': response,
+                'format': output_format,
+                'cache': cache_info,
+                'timing': timing
+            }
+            if extractive is not None:
+                body['extractive'] = extractive
+            with span('serialize'):
+                return jsonify(body)
                 
-                return jsonify({
+        except Exception as e:
+            logger.error(f"Error in generate endpoint: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+
+    @app.route('/api/generate/stream', methods=['POST'])
+    def generate_stream():
+        """API endpoint to stream a model response as Server-Sent Events"""
+        data = request.get_json(silent=True)
+
+        if not data:
+            return jsonify({'status': 'error', 'message': 'No data provided'}), 400
+        if 'prompt' not in data:
+            return jsonify({'status': 'error', 'message': 'No prompt provided'}), 400
+        if 'model' not in data:
+            return jsonify({'status': 'error', 'message': 'No model selected'}), 400
+
+        invalid = _invalid_token_budget(data) or _invalid_temperature(data)
+        if invalid is not None:
+            return invalid
+
+        logger.info("API: Stream request using model: %s", data['model'])
+
+        model = data['model']
+        with span('prompt'):
+            prompt, _, _ = _build_prompt(data)
+        temperature = data.get('temperature', 0.7)
+        output_format = data.get('format', 'markdown')
+
+        # Wait for the first token before answering, so a shed request
+        # still gets a 429 (503 with Ollama down) instead of an error event
+        tokens = llm_service.stream_response(model, prompt, temperature)
+        try:
+            with span('first_token'):
+                first = [next(tokens)]
+        except StopIteration:
+            first = []
+        except AdmissionRejected as e:
+            return _error_response({'status': 'error', 'message': str(e), 'retry_after': e.retry_after})
+        except CircuitOpen as e:
+            return _error_response({'status': 'error', 'message': 'Ollama is unavailable, please try again shortly',
+                                    'retry_after': e.retry_after, 'circuit': e.name})
+        except Exception as e:
+            logger.error(f"Error in generate stream: {str(e)}")
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        def events():
+            parts = []
+            renderer = markdown_renderer.incremental() if output_format == 'html' else None
+            try:
+                for token in itertools.chain(first, tokens):
+                    parts.append(token)
+                    payload = {'token': token}
+                    # Re-render on line breaks so the client can swap in
+                    # complete blocks instead of half-parsed markdown
+                    if renderer is not None:
+                        html = renderer.feed(token)
+                        if html is not None:
+                            payload['html'] = html
+                    yield _sse_event('token', payload)
+
+                text = ''.join(parts)
+                response = text
+                if output_format == 'html':
+                    try:
+                        response = markdown_renderer.render(text)
+                    except Exception as e:
+                        logger.error(f"Error converting markdown to HTML: {str(e)}")
+                yield _sse_event('done', {
                     'status': 'success',
                     'response': response,
-                    'format': output_format
+                    'format': output_format,
+                    'timing': tokens.result
                 })
-            else:
-                return jsonify(result), 400
-                
+            except Exception as e:
+                logger.error(f"Error in generate stream: {str(e)}")
+                yield _sse_event('error', {'status': 'error', 'message': str(e)})
+            finally:
+                tokens.close()
+
+        response = Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # The first token already holds a slot and a host lease; give them back
+        # even if the client leaves before the body is read
+        response.call_on_close(tokens.close)
+        return response
+
+    @app.route('/api/summarize/extractive', methods=['POST'])
+    def summarize_extractive():
+        """API endpoint to pick a page's key sentences without an LLM"""
+        try:
+            data = request.get_json()
+
+            if not data:
+                return jsonify({'status': 'error', 'message': 'No data provided'}), 400
+            if not data.get('text'):
+                return jsonify({'status': 'error', 'message': 'No text provided'}), 400
+
+            # A missing or null token_budget means no budget
+            token_budget = data.get('token_budget')
+            if token_budget is not None:
+                token_budget = _bounded_int(token_budget, 1)
+                if token_budget is None:
+                    return jsonify({'status': 'error', 'message': 'token_budget must be a positive integer'}), 400
+            sentences = _bounded_int(data.get('sentences', 8), 1)
+            if sentences is None:
+                return jsonify({'status': 'error', 'message': 'sentences must be a positive integer'}), 400
+
+            result = extract(data['text'], token_budget, sentences)
+            return jsonify({
+                'status': 'success',
+                'response': result['text'],
+                'sentences': result['sentences'],
+                'sentences_total': result['sentences_total'],
+                'tokens_before': result['tokens_before'],
+                'tokens_after': result['tokens_after']
+            })
+
         except Exception as e:
-            logger.error(f"Error in generate endpoint: {str(e)}")
+            logger.error(f"Error in summarize_extractive endpoint: {str(e)}")
             return jsonify({
                 'status': 'error',
                 'message': str(e)
-            }), 500 
\ No newline at end of file
+            }), 500
+
+    @app.route('/api/keywords', methods=['POST'])
+    def keywords():
+        """API endpoint to extract keyphrases from one text or a batch of texts"""
+        try:
+            data = request.get_json()
+
+            if not data:
+                return jsonify({'status': 'error', 'message': 'No data provided'}), 400
+            batch = 'documents' in data
+            texts = data['documents'] if batch else [data.get('text')]
+            if not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t for t in texts):
+                return jsonify({'status': 'error', 'message': 'No text provided'}), 400
+            if len(texts) > KEYWORDS_MAX_DOCUMENTS:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'At most {KEYWORDS_MAX_DOCUMENTS} documents per request'
+                }), 400
+            top = _bounded_int(data.get('top', 8), 1, KEYWORDS_MAX_TOP)
+            if top is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'top must be an integer between 1 and {KEYWORDS_MAX_TOP}'
+                }), 400
+
+            results = keyword_extractor.extract_batch(texts, top, bool(data.get('learn')))
+            if batch:
+                return jsonify({'status': 'success', 'results': [{'keywords': r} for r in results]})
+            return jsonify({'status': 'success', 'keywords': results[0]})
+
+        except Exception as e:
+            logger.error(f"Error in keywords endpoint: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+
+    @app.route('/api/keywords/stats', methods=['GET'])
+    def keyword_stats():
+        """API endpoint to report the size of the corpus IDF table"""
+        return jsonify({
+            'status': 'success',
+            'idf_table': keyword_extractor.stats()
+        })
+
+    @app.route('/api/summarize/long', methods=['POST'])
+    def summarize_long():
+        """API endpoint to summarize long documents chunk by chunk"""
+        try:
+            data = request.get_json()
+
+            if not data:
+                return jsonify({'status': 'error', 'message': 'No data provided'}), 400
+            if not data.get('text'):
+                return jsonify({'status': 'error', 'message': 'No text provided'}), 400
+            if 'model' not in data:
+                return jsonify({'status': 'error', 'message': 'No model selected'}), 400
+            try:
+                chunk_tokens = int(data.get('chunk_tokens', CHUNK_TOKENS))
+            except (TypeError, ValueError):
+                chunk_tokens = None
+            if chunk_tokens is None or not MIN_CHUNK_TOKENS <= chunk_tokens <= MAX_CHUNK_TOKENS:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'chunk_tokens must be an integer between {MIN_CHUNK_TOKENS} and {MAX_CHUNK_TOKENS}'
+                }), 400
+            invalid = _invalid_temperature(data)
+            if invalid is not None:
+                return invalid
+
+            logger.info("API: Long summary request using model: %s", data['model'])
+
+            output_format = data.get('format', 'markdown')
+            with span('provider'):
+                result = chunked_summarizer.summarize(
+                    data['model'],
+                    data['text'],
+                    data.get('temperature', 0.7),
+                    chunk_tokens
+                )
+
+            if result['status'] != 'success':
+                return _error_response(result)
+
+            response = result['response']
+            if output_format == 'html':
+                try:
+                    with span('render'):
+                        response = markdown_renderer.render(response)
+                except Exception as e:
+                    logger.error(f"Error converting markdown to HTML: {str(e)}")
+
+            return jsonify({
+                'status': 'success',
+                'response': response,
+                'format': output_format,
+                'chunks': result['chunks'],
+                'levels': result['levels'],
+                'failed_chunks': result['failed_chunks']
+            })
+
+        except Exception as e:
+            logger.error(f"Error in summarize_long endpoint: {str(e)}")
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
@@ -0,0 +1,56 @@
+"""Flask server with the REST API only.
+
+app.py mounts the Dash UI on this server. Run this module directly for a
+fast-start, API-only backend that never imports dash or the UI libraries.
+"""
+import time
+
+# Taken before the heavy imports so cold-start time includes them
+STARTED_AT = time.perf_counter()
+
+from flask import Flask, jsonify
+from flask_cors import CORS
+import logging
+
+from api_routes import register_routes
+from llm_service import llm_service
+from backend_common.tracing import setup_logging
+
+# Set up logging with a cleaner format, written by a background thread
+setup_logging('%(asctime)s - %(levelname)s: [%(request_id)s] %(message)s', datefmt='%H:%M:%S')
+logger = logging.getLogger(__name__)
+
+# Seconds from process start until startup finished and the first request was served
+startup = {'ready': None, 'first_request': None}
+
+# Create Flask server
+server = Flask(__name__)
+
+# Enable CORS for all routes
+CORS(server)
+
+# Register API routes
+register_routes(server)
+
+def mark_ready(mode):
+    """Record startup time and start model list, host health and warm-up work in the background"""
+    llm_service.model_catalog.warm()
+    llm_service.pool.start()
+    llm_service.warmer.start()
+    startup['ready'] = round(time.perf_counter() - STARTED_AT, 3)
+    logger.info(f"Started ({mode}) in {startup['ready']:.3f}s")
+
+@server.before_request
+def record_first_request():
+    if startup['first_request'] is None:
+        startup['first_request'] = round(time.perf_counter() - STARTED_AT, 3)
+        logger.info(f"First request served {startup['first_request']:.3f}s after start")
+
+@server.route('/api/startup/stats', methods=['GET'])
+def startup_stats():
+    """Cold-start timings for this process"""
+    return jsonify({'status': 'success', **startup})
+
+if __name__ == '__main__':
+    mark_ready('api only')
+    server.run(port=8050)
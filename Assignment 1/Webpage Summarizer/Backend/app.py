@@ -1,36 +1,24 @@
+# The API server is imported first so its startup clock covers the UI imports
+from api_server import mark_ready, server
+
 import dash
 from dash import callback, Input, Output, State, ClientsideFunction
-from flask import Flask
-from flask_cors import CORS
+from flask import request
 import logging
+import os
 
 # Import our modules
+from job_manager import job_manager
 from llm_service import llm_service
 from ui_components import create_layout, get_keyboard_js
-from api_routes import register_routes
 
-# Set up logging with a cleaner format
-logging.basicConfig(
-    level=logging.INFO,  # Set to INFO in production
-    format='%(asctime)s - %(levelname)s: %(message)s',
-    datefmt='%H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
-# Create Flask server
-server = Flask(__name__)
-
-# Enable CORS for all routes
-CORS(server)
-
 # Initialize Dash app with the Flask server
 app = dash.Dash(__name__, server=server)
 
-# Register API routes
-register_routes(server)
-
-# Set up the layout
-app.layout = create_layout()
+# Build the layout per page load from the cached catalogue, never waiting on Ollama
+app.layout = create_layout
 
 # Add keyboard shortcuts JavaScript
 app.index_string = f'''
@@ -81,18 +69,30 @@ def toggle_theme(n_clicks, current_theme):
 
 @callback(
     [Output('model-dropdown', 'data'),
-     Output('model-dropdown', 'value')],
+     Output('model-dropdown', 'value'),
+     Output('model-dropdown', 'placeholder')],
     Input('refresh-models', 'n_clicks'),
-    prevent_initial_call=True
+    State('model-dropdown', 'value')
 )
-def refresh_models(n_clicks):
-    models, default_model = llm_service.get_available_models()
-    return models, default_model
+def refresh_models(n_clicks, current):
+    # Runs once on page load to fill the dropdown; clicks force a refresh
+    if n_clicks:
+        result = llm_service.refresh_models()
+        options, default = result['options'], result['default']
+    else:
+        options, default = llm_service.get_available_models()
+    if not options:
+        return dash.no_update, dash.no_update, "No models available"
+    if current in [option['value'] for option in options]:
+        default = current
+    return options, default, "Select a model"
 
 @callback(
     [Output('response-output', 'children'),
      Output('submit-button', 'loading'),
-     Output('submit-button', 'disabled')],
+     Output('submit-button', 'disabled'),
+     Output('job-id', 'data'),
+     Output('job-interval', 'disabled')],
     Input('submit-button', 'n_clicks'),
     [State('model-dropdown', 'value'),
      State('query-input', 'value'),
@@ -101,34 +101,49 @@ def refresh_models(n_clicks):
 )
 def generate_response(n_clicks, model, query, temperature):
     if not model or not query:
-        return "Please select a model and enter a query.", False, False
-    
+        return "Please select a model and enter a query.", False, False, None, True
+
     try:
-        # Set loading state
-        ctx = dash.callback_context
-        if not ctx.triggered:
-            return dash.no_update, dash.no_update, dash.no_update
-            
-        # Generate response using LLM service
-        result = llm_service.generate_response(model, query, temperature)
-        
-        if result['status'] == 'success':
-            return result['response'], False, False
-        else:
-            return f"Error: {result['message']}", False, False
-            
+        # Queue the generation; its progress is picked up by poll_response
+        job_id = job_manager.submit(request.remote_addr, model, query, temperature)
+        return "_Queued..._", True, True, job_id, False
     except Exception as e:
-        return f"Error: {str(e)}", False, False
+        return f"Error: {str(e)}", False, False, None, True
 
-# Add a callback to set initial loading state
 @callback(
-    [Output('submit-button', 'loading', allow_duplicate=True),
-     Output('submit-button', 'disabled', allow_duplicate=True)],
-    Input('submit-button', 'n_clicks'),
+    [Output('response-output', 'children', allow_duplicate=True),
+     Output('submit-button', 'loading', allow_duplicate=True),
+     Output('submit-button', 'disabled', allow_duplicate=True),
+     Output('cancel-button', 'disabled'),
+     Output('job-interval', 'disabled', allow_duplicate=True)],
+    Input('job-interval', 'n_intervals'),
+    State('job-id', 'data'),
+    prevent_initial_call=True
+)
+def poll_response(n_intervals, job_id):
+    job = job_manager.poll(job_id)
+    if job is None:
+        return dash.no_update, False, False, True, True
+    if job['status'] == 'queued':
+        return f"_Queued (position {job['position']})..._", True, True, False, False
+    if job['status'] == 'running':
+        return job['text'], True, True, False, False
+    if job['status'] == 'error':
+        return f"Error: {job['error']}", False, False, True, True
+    if job['status'] == 'cancelled':
+        return (job['text'] + "\n\n_Cancelled._").strip(), False, False, True, True
+    return job['text'], False, False, True, True
+
+@callback(
+    Output('cancel-button', 'disabled', allow_duplicate=True),
+    Input('cancel-button', 'n_clicks'),
+    State('job-id', 'data'),
     prevent_initial_call=True
 )
-def set_loading_state(n_clicks):
-    return True, True
+def cancel_response(n_clicks, job_id):
+    # The next poll reports the job as cancelled and resets the buttons
+    job_manager.cancel(job_id)
+    return True
 
 @callback(
     Output('temperature-slider', 'value'),
@@ -138,5 +153,10 @@ def set_loading_state(n_clicks):
 def format_temperature(value):
     return round(value, 1)
 
+# debug=True also runs this module in the reloader's watcher process;
+# only the serving child loads models and checks hosts
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    mark_ready('with UI')
+
 if __name__ == '__main__':
     app.run_server(debug=True) 
\ No newline at end of file
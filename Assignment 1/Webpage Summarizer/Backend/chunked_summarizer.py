@@ -0,0 +1,176 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_common.admission import BULK, AdmissionRejected
+from backend_common.circuit_breaker import CircuitOpen
+from backend_common.tracing import bind
+from llm_service import llm_service
+from token_estimate import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CHUNK_TOKENS = int(os.environ.get('LONG_SUMMARY_CHUNK_TOKENS', '1500'))
+# Chunk sizes a request may ask for; smaller chunks summarize to more text than they hold
+MIN_CHUNK_TOKENS = int(os.environ.get('LONG_SUMMARY_MIN_CHUNK_TOKENS', '256'))
+MAX_CHUNK_TOKENS = int(os.environ.get('LONG_SUMMARY_MAX_CHUNK_TOKENS', '8000'))
+# Model calls one long summary may make across all levels
+MAX_CALLS = int(os.environ.get('LONG_SUMMARY_MAX_CALLS', '200'))
+# Concurrent chunk summaries across all requests, so Ollama isn't flooded
+MAP_WORKERS = int(os.environ.get('LONG_SUMMARY_WORKERS', '4'))
+MAX_LEVELS = 4
+
+SUMMARY_PROMPT = """Summarize the following document, including key points and important details. Use markdown.
+
+{text}"""
+
+MAP_PROMPT = """Summarize the following part of a longer document. Keep the key points, names, numbers and dates. Respond with the summary only.
+
+{text}"""
+
+REDUCE_PROMPT = """The following are summaries of consecutive parts of one document. Combine them into a single summary of the whole document, including key points and important details. Use markdown.
+
+{text}"""
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+def _pieces(text, max_tokens):
+    """Split text into paragraphs, then sentences, then words, until each piece fits"""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if estimate_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+            words = sentence.split()
+            step = max(1, max_tokens * CHARS_PER_TOKEN // 6)
+            for i in range(0, len(words), step):
+                yield ' '.join(words[i:i + step])
+
+def split_chunks(text, max_tokens=CHUNK_TOKENS):
+    """Pack text into chunks of at most max_tokens along paragraph and sentence boundaries"""
+    chunks = []
+    current = []
+    size = 0
+    for piece in _pieces(text, max_tokens):
+        tokens = estimate_tokens(piece)
+        if current and size + tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+class ChunkedSummarizer:
+    """Map-reduce summarization of documents too long for one model call"""
+
+    def __init__(self, service, max_workers=MAP_WORKERS):
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summarize')
+
+    def _generate(self, model, prompt, temperature):
+        # Long summaries queue behind interactive requests for the same model
+        result = self.service.generate_response(model, prompt, temperature, BULK)
+        if 'circuit' in result:
+            raise CircuitOpen(result['circuit'], result['retry_after'])
+        if 'retry_after' in result:
+            raise AdmissionRejected(result['message'], result['retry_after'])
+        if result['status'] != 'success':
+            raise RuntimeError(result['message'])
+        return result['response'].strip()
+
+    def _map(self, model, chunks, temperature):
+        """Summarize chunks in parallel, dropping any that fail.
+
+        Also returns the longest Retry-After of chunks that were shed or
+        failed fast, and the circuit of the last that failed fast.
+        """
+        futures = [
+            self.executor.submit(bind(self._generate, model, MAP_PROMPT.format(text=chunk), temperature))
+            for chunk in chunks
+        ]
+        summaries, failed, retry_after, circuit = [], 0, None, None
+        for future in futures:
+            try:
+                summaries.append(future.result())
+            except (AdmissionRejected, CircuitOpen) as e:
+                failed += 1
+                retry_after = max(retry_after or 0, e.retry_after)
+                if isinstance(e, CircuitOpen):
+                    circuit = e.name
+            except Exception as e:
+                logger.error(f"Chunk summary failed: {str(e)}")
+                failed += 1
+        return summaries, failed, retry_after, circuit
+
+    def summarize(self, model, text, temperature=0.7, chunk_tokens=CHUNK_TOKENS):
+        """Summarize text of any length, reducing hierarchically when needed.
+
+        Each level must shrink the text and the whole summary may make at
+        most MAX_CALLS model calls, so a long document can't fan out without
+        bound.
+        """
+        if not MIN_CHUNK_TOKENS <= chunk_tokens <= MAX_CHUNK_TOKENS:
+            raise ValueError(f'chunk_tokens must be between {MIN_CHUNK_TOKENS} and {MAX_CHUNK_TOKENS}')
+        chunks = split_chunks(text, chunk_tokens)
+        if not chunks:
+            return {'status': 'error', 'message': 'No text provided'}
+        stats = {'chunks': len(chunks), 'levels': 0, 'failed_chunks': 0}
+
+        if len(chunks) == 1:
+            result = self.service.generate_response(
+                model, SUMMARY_PROMPT.format(text=chunks[0]), temperature, BULK)
+            return {**result, **stats}
+
+        # Map chunk summaries until they fit in a single reduce prompt
+        calls = 0
+        tokens = estimate_tokens(text)
+        while len(chunks) > 1:
+            # Leave room for the final reduce call
+            if stats['levels'] == MAX_LEVELS or calls + len(chunks) + 1 > MAX_CALLS:
+                return {'status': 'error',
+                        'message': f'Document needs more than {MAX_LEVELS} levels or {MAX_CALLS} model calls '
+                                   f'at {chunk_tokens} tokens per chunk', **stats}
+            stats['levels'] += 1
+            calls += len(chunks)
+            logger.info("Summarizing %d chunks (level %d)", len(chunks), stats['levels'])
+            summaries, failed, retry_after, circuit = self._map(model, chunks, temperature)
+            stats['failed_chunks'] += failed
+            if not summaries:
+                if circuit is not None:
+                    # Ollama is down, not busy; answered as 503
+                    return {'status': 'error', 'message': 'Ollama is unavailable, please try again shortly',
+                            'retry_after': retry_after, 'circuit': circuit, **stats}
+                if retry_after is not None:
+                    # Shed rather than broken; tell the client when to retry
+                    return {'status': 'error', 'message': 'Model is busy, please try again later',
+                            'retry_after': retry_after, **stats}
+                return {'status': 'error', 'message': 'All chunk summaries failed', **stats}
+            combined = '\n\n'.join(summaries)
+            combined_tokens = estimate_tokens(combined)
+            if combined_tokens <= chunk_tokens:
+                chunks = [combined]
+                break
+            if combined_tokens >= tokens:
+                # Another level would only fan out further
+                return {'status': 'error',
+                        'message': f'Chunk summaries did not shorten the text at level {stats["levels"]}',
+                        **stats}
+            tokens = combined_tokens
+            chunks = split_chunks(combined, chunk_tokens)
+
+        result = self.service.generate_response(
+            model, REDUCE_PROMPT.format(text='\n\n'.join(chunks)), temperature, BULK)
+        return {**result, **stats}
+
+# Create a global instance
+chunked_summarizer = ChunkedSummarizer(llm_service)
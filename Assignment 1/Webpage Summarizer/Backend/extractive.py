@@ -0,0 +1,153 @@
+import logging
+import os
+import re
+
+import numpy as np
+
+from token_estimate import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Estimated tokens of page text passed on to the LLM
+EXTRACTIVE_TOKEN_BUDGET = int(os.environ.get('EXTRACTIVE_TOKEN_BUDGET', '2000'))
+# Sentences ranked at most; later ones are dropped before ranking
+EXTRACTIVE_MAX_SENTENCES = int(os.environ.get('EXTRACTIVE_MAX_SENTENCES', '1500'))
+
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+# Shorter fragments are usually navigation, captions or buttons
+MIN_WORDS = 4
+
+STOPWORDS = frozenset("""
+a about above after again against all almost also although always am among an and another any anyone
+anything are aren't around as at be became because become been before being below between both but by
+can can't cannot could couldn't did didn't do does doesn't doing don't done down during each either else
+enough etc even ever every few for from further get gets getting given go goes going got had hadn't has
+hasn't have haven't having he he'd he'll he's her here here's hers herself him himself his how how's however
+i i'd i'll i'm i've if in into is isn't it it's its itself just least less let's like likely made make makes
+many may me might more most mostly much must mustn't my myself near neither never no nor not now of off
+often on once one only onto or other others otherwise ought our ours ourselves out over own per perhaps
+rather really said same say says see seen shall shan't she she'd she'll she's should shouldn't since so
+some something such than that that's the their theirs them themselves then there there's these they
+they'd they'll they're they've this those though through thus to too toward towards under until up upon
+us use used uses using very via was wasn't we we'd we'll we're we've well were weren't what what's when
+when's where where's whether which while who who's whom whose why why's will with within without won't
+would wouldn't yet you you'd you'll you're you've your yours yourself yourselves
+""".split())
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+_WORD = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+
+def tokenize(text):
+    """Lowercase words and numbers, keeping inner apostrophes and hyphens"""
+    return _WORD.findall(text.lower())
+
+def split_sentences(text):
+    """Split text on sentence ends and line breaks, dropping short fragments"""
+    sentences = []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        sentence = ' '.join(sentence.split())
+        if len(sentence.split()) >= MIN_WORDS:
+            sentences.append(sentence)
+    return sentences
+
+def rank_sentences(sentences):
+    """TextRank scores over the TF-IDF cosine similarity of sentences"""
+    n = len(sentences)
+    if n < 3:
+        return np.ones(n, dtype=np.float32)
+
+    vocabulary = {}
+    rows, cols = [], []
+    for i, sentence in enumerate(sentences):
+        for word in tokenize(sentence):
+            if word not in STOPWORDS:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+    if not rows:
+        return np.ones(n, dtype=np.float32)
+
+    # Count (sentence, term) pairs and document frequencies
+    pairs, counts = np.unique(np.asarray(rows, dtype=np.int64) * len(vocabulary) + cols, return_counts=True)
+    pair_rows, pair_cols = np.divmod(pairs, len(vocabulary))
+    df = np.bincount(pair_cols, minlength=len(vocabulary))
+    idf = np.log((1 + n) / (1 + df)) + 1
+    weights = (1 + np.log(counts)) * idf[pair_cols]
+    norms = np.sqrt(np.bincount(pair_rows, weights ** 2, minlength=n))
+    norms[norms == 0] = 1
+
+    # Terms found in one sentence never add to similarity, so the dense
+    # matrix only needs columns for shared terms
+    shared = np.flatnonzero(df > 1)
+    if shared.size == 0:
+        return np.ones(n, dtype=np.float32)
+    column = np.full(len(vocabulary), -1)
+    column[shared] = np.arange(shared.size)
+    keep = column[pair_cols] >= 0
+    matrix = np.zeros((n, shared.size), dtype=np.float32)
+    matrix[pair_rows[keep], column[pair_cols[keep]]] = weights[keep] / norms[pair_rows[keep]]
+
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    # Sentences similar to nothing spread their score evenly
+    transition = np.where(out_weight > 0, similarity / np.where(out_weight > 0, out_weight, 1), 1.0 / n)
+
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / n + DAMPING * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < TOLERANCE:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+def extract(text, token_budget=None, max_sentences=None):
+    """Pick the top-ranked sentences that fit the budget, in document order.
+
+    Either limit may be None. Returns the condensed text, the chosen
+    sentences with their scores and before/after sizes.
+    """
+    sentences = split_sentences(text)
+    # Pages repeat boilerplate; rank each sentence once
+    sentences = list(dict.fromkeys(sentences))[:EXTRACTIVE_MAX_SENTENCES]
+    scores = rank_sentences(sentences)
+
+    chosen, used = [], 0
+    for index in np.argsort(-scores, kind='stable'):
+        if max_sentences is not None and len(chosen) >= max_sentences:
+            break
+        tokens = estimate_tokens(sentences[index])
+        if token_budget is not None and used + tokens > token_budget:
+            continue
+        chosen.append(int(index))
+        used += tokens
+    chosen.sort()
+
+    return {
+        'text': ' '.join(sentences[i] for i in chosen),
+        'sentences': [{'index': i, 'text': sentences[i], 'score': round(float(scores[i]), 5)} for i in chosen],
+        'sentences_total': len(sentences),
+        'tokens_before': estimate_tokens(text),
+        'tokens_after': used
+    }
+
+def condense(text, token_budget=EXTRACTIVE_TOKEN_BUDGET):
+    """Shrink text to the token budget, leaving text that already fits untouched"""
+    tokens = estimate_tokens(text)
+    if tokens <= token_budget:
+        return {'text': text, 'condensed': False, 'tokens_before': tokens, 'tokens_after': tokens}
+    result = extract(text, token_budget)
+    if not result['sentences']:
+        # Nothing sentence-like to rank (a table, a list of links); cut it instead
+        text = text[:token_budget * CHARS_PER_TOKEN]
+        return {'text': text, 'condensed': True, 'tokens_before': tokens, 'tokens_after': estimate_tokens(text)}
+    logger.info(f"Condensed page text from ~{tokens} to ~{result['tokens_after']} tokens "
+                f"({len(result['sentences'])}/{result['sentences_total']} sentences)")
+    return {
+        'text': result['text'],
+        'condensed': True,
+        'tokens_before': tokens,
+        'tokens_after': result['tokens_after']
+    }
@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_common.tracing import bind
+from llm_service import llm_service
+
+logger = logging.getLogger(__name__)
+
+# Generations streaming at once; the rest wait in the queue
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '8'))
+# Jobs waiting for a worker before new submissions are refused
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '64'))
+# Queued plus running jobs allowed per client
+JOB_USER_LIMIT = int(os.environ.get('JOB_USER_LIMIT', '3'))
+# Seconds a finished job is kept for a client that has not polled it yet
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', '300'))
+
+FINISHED = ('done', 'error', 'cancelled')
+
+class JobRejected(Exception):
+    """Raised when the queue or the client's job limit is full"""
+
+class Job:
+    """One generation request and the text it has produced so far"""
+
+    def __init__(self, owner, model, prompt, temperature):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.model = model
+        self.prompt = prompt
+        self.temperature = temperature
+        self.status = 'queued'
+        self.parts = []
+        self.error = None
+        self.cancel_requested = False
+        # Token stream of a running job, closed by cancel()
+        self.stream = None
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+
+class JobManager:
+    """Run generations on a bounded worker pool and expose their progress.
+
+    Callers submit a job and poll it by id for the partial text. Cancelling
+    a running job closes its token stream from the cancelling thread, which
+    stops the upstream Ollama call, or takes it out of the admission queue,
+    once no other caller shares it, even before its first token.
+    """
+
+    def __init__(self, service, max_workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE,
+                 per_user=JOB_USER_LIMIT, retention=JOB_RETENTION):
+        self.service = service
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.retention = retention
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._queued = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def submit(self, owner, model, prompt, temperature=0.7):
+        """Queue a generation and return its job id"""
+        with self._lock:
+            self._expire()
+            if len(self._queued) >= self.max_queued:
+                self._counters['rejected'] += 1
+                raise JobRejected('Too many queued requests, please try again shortly')
+            active = sum(1 for job in self._jobs.values()
+                         if job.owner == owner and job.status not in FINISHED)
+            if active >= self.per_user:
+                self._counters['rejected'] += 1
+                raise JobRejected(f'At most {self.per_user} requests may run at once')
+            job = Job(owner, model, prompt, temperature)
+            self._jobs[job.id] = job
+            self._queued[job.id] = job
+            self._counters['submitted'] += 1
+        self.executor.submit(bind(self._run, job))
+        return job.id
+
+    def _run(self, job):
+        with self._lock:
+            if job.status in FINISHED:
+                # Cancelled while still queued
+                return
+            self._queued.pop(job.id, None)
+            job.status = 'running'
+            job.started = time.monotonic()
+
+        tokens = self.service.stream_response(job.model, job.prompt, job.temperature)
+        with self._lock:
+            job.stream = tokens
+            cancelled = job.cancel_requested
+        if cancelled:
+            # Cancelled between starting and subscribing
+            tokens.close()
+        status = 'done'
+        try:
+            for token in tokens:
+                if job.cancel_requested:
+                    break
+                with self._lock:
+                    job.parts.append(token)
+            if job.cancel_requested:
+                status = 'cancelled'
+        except Exception as e:
+            if job.cancel_requested:
+                status = 'cancelled'
+            else:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                status = 'error'
+                job.error = str(e)
+        finally:
+            # Unsubscribing lets the shared flight stop the upstream stream
+            tokens.close()
+            with self._lock:
+                job.stream = None
+                self._finish(job, status)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.monotonic()
+        key = {'done': 'completed', 'error': 'failed', 'cancelled': 'cancelled'}[status]
+        self._counters[key] += 1
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def poll(self, job_id):
+        """Return a snapshot of the job; finished jobs are released once polled"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = {
+                'id': job.id,
+                'status': job.status,
+                'text': ''.join(job.parts),
+                'error': job.error,
+                'position': (list(self._queued).index(job_id) + 1
+                             if job_id in self._queued else None)
+            }
+            if job.status in FINISHED:
+                del self._jobs[job_id]
+            return snapshot
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; returns False for unknown jobs"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            job.cancel_requested = True
+            if job.status == 'queued':
+                self._queued.pop(job_id, None)
+                self._finish(job, 'cancelled')
+            elif job.stream is not None:
+                # Wakes the worker even while it waits for the first token
+                job.stream.close()
+            return True
+
+    def stats(self):
+        """Report job counters, queue depth and running jobs"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['queued'] = len(self._queued)
+            stats['running'] = sum(1 for job in self._jobs.values() if job.status == 'running')
+            stats['max_queued'] = self.max_queued
+            stats['per_user'] = self.per_user
+            return stats
+
+# Create a global instance
+job_manager = JobManager(llm_service)
@@ -0,0 +1,235 @@
+import atexit
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from extractive import STOPWORDS, split_sentences, tokenize
+
+logger = logging.getLogger(__name__)
+
+# .npz file with corpus document frequencies; empty scores against each request alone
+KEYWORDS_IDF_PATH = os.environ.get('KEYWORDS_IDF_PATH', '')
+# Documents the corpus table needs before it is used instead of per-request IDF
+KEYWORDS_MIN_CORPUS = int(os.environ.get('KEYWORDS_MIN_CORPUS', '20'))
+# Documents accepted per request
+KEYWORDS_MAX_DOCUMENTS = int(os.environ.get('KEYWORDS_MAX_DOCUMENTS', '100'))
+# Keyphrases a request may ask for per text
+KEYWORDS_MAX_TOP = int(os.environ.get('KEYWORDS_MAX_TOP', '50'))
+# Seconds learned documents are batched for before the table is written out
+KEYWORDS_SAVE_DELAY = float(os.environ.get('KEYWORDS_SAVE_DELAY', '5'))
+
+MAX_NGRAM = 3
+MIN_WORD_LENGTH = 2
+
+# Punctuation ends a phrase just like a stopword does
+_PHRASE_BREAK = re.compile(r"[^\w\s'\-]+|\s['\-]+|['\-]+\s|_+")
+
+def phrases(text):
+    """Runs of content words between stopwords and punctuation (RAKE candidates)"""
+    runs = []
+    for fragment in _PHRASE_BREAK.split(text.lower()):
+        run = []
+        for word in tokenize(fragment):
+            if word in STOPWORDS or word.isdigit() or len(word) < MIN_WORD_LENGTH:
+                if run:
+                    runs.append(run)
+                run = []
+            else:
+                run.append(word)
+        if run:
+            runs.append(run)
+    return runs
+
+class IdfTable:
+    """Corpus document frequencies of words, persisted as an .npz file.
+
+    Updates only touch memory; a background thread writes the table out
+    at most once per ``save_delay`` seconds, so learning stays off disk
+    on the request path.
+    """
+
+    def __init__(self, path, save_delay=KEYWORDS_SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self.docs = 0
+        self._df = {}
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._save_lock = threading.Lock()
+        self._saver = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                self.docs = int(data['docs'])
+                self._df = dict(zip(data['terms'].tolist(), data['df'].tolist()))
+            logger.info(f"Loaded IDF table with {len(self._df)} terms from {self.docs} documents")
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable IDF table: {str(e)}")
+
+    def ready(self):
+        return self.docs >= KEYWORDS_MIN_CORPUS
+
+    def idf(self, words):
+        """IDF of each word; words never seen get the highest value"""
+        with self._lock:
+            df = np.fromiter((self._df.get(word, 0) for word in words), dtype=np.float64, count=len(words))
+            docs = self.docs
+        return np.log((1 + docs) / (1 + df)) + 1
+
+    def update(self, documents):
+        """Add documents, each given as its set of words; the table is saved soon after"""
+        with self._lock:
+            for words in documents:
+                for word in words:
+                    self._df[word] = self._df.get(word, 0) + 1
+            self.docs += len(documents)
+            if self._saver is None:
+                self._saver = threading.Thread(target=self._save_loop, name='idf-saver', daemon=True)
+                self._saver.start()
+                atexit.register(self.save)
+        self._dirty.set()
+
+    def _save_loop(self):
+        while True:
+            self._dirty.wait()
+            # Let further learns within the delay share one write
+            time.sleep(self.save_delay)
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning(f"Saving the IDF table failed: {str(e)}")
+
+    def save(self):
+        """Write the table if it changed since the last save"""
+        # One save at a time, so an older snapshot never replaces a newer one
+        with self._save_lock:
+            if not self._dirty.is_set():
+                return
+            with self._lock:
+                self._dirty.clear()
+                terms = np.array(list(self._df), dtype=str)
+                df = np.fromiter(self._df.values(), dtype=np.int64, count=len(self._df))
+                docs = self.docs
+            tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)),
+                                              prefix=f'.{os.path.basename(self.path)}.', suffix='.tmp',
+                                              delete=False)
+            try:
+                with tmp:
+                    np.savez(tmp, terms=terms, df=df, docs=docs)
+                os.replace(tmp.name, self.path)
+            except BaseException:
+                os.unlink(tmp.name)
+                self._dirty.set()
+                raise
+
+    def stats(self):
+        with self._lock:
+            return {'documents': self.docs, 'terms': len(self._df), 'ready': self.ready()}
+
+class KeywordExtractor:
+    """Keyphrase extraction with TF-IDF weighted RAKE scores.
+
+    Candidates are the 1 to MAX_NGRAM word n-grams inside runs of content
+    words. A candidate scores ``(1 + ln count) * mean IDF`` of its words
+    times its RAKE score, the sum of its words' degree/frequency, so phrases
+    that recur, use rare words and hold words that co-occur rank first. Document frequencies
+    come from the corpus table when it has enough documents, otherwise
+    from the other documents in the request, or from a single document's
+    own sentences.
+    """
+
+    def __init__(self, idf_table=None, max_ngram=MAX_NGRAM):
+        self.idf_table = idf_table
+        self.max_ngram = max_ngram
+
+    def _candidates(self, runs):
+        """Words of every candidate n-gram occurrence"""
+        for run in runs:
+            for size in range(1, min(self.max_ngram, len(run)) + 1):
+                for start in range(len(run) - size + 1):
+                    yield tuple(run[start:start + size])
+
+    def _score(self, runs, idf_of, top):
+        if not runs:
+            return []
+        vocabulary = {}
+        run_ids = [[vocabulary.setdefault(word, len(vocabulary)) for word in run] for run in runs]
+
+        # RAKE: a word's degree counts the words it shares phrases with
+        words = np.fromiter((i for run in run_ids for i in run), dtype=np.int64)
+        lengths = np.repeat([len(run) for run in run_ids], [len(run) for run in run_ids])
+        frequency = np.bincount(words, minlength=len(vocabulary))
+        degree = np.bincount(words, lengths, minlength=len(vocabulary))
+        rake = degree / frequency
+        idf = idf_of(list(vocabulary))
+
+        index = {}
+        occurrences = [index.setdefault(candidate, len(index)) for candidate in self._candidates(runs)]
+        counts = np.bincount(occurrences, minlength=len(index))
+        members = np.full((len(index), self.max_ngram), -1, dtype=np.int64)
+        for candidate, i in index.items():
+            members[i, :len(candidate)] = [vocabulary[word] for word in candidate]
+        present = members >= 0
+        size = present.sum(axis=1)
+        mean_idf = np.where(present, idf[members], 0).sum(axis=1) / size
+        rake_score = np.where(present, rake[members], 0).sum(axis=1)
+        scores = (1 + np.log(counts)) * mean_idf * rake_score
+        # A phrase seen once is usually a chance word sequence, not a keyphrase
+        scores[(size > 1) & (counts < 2)] = 0
+
+        candidates = list(index)
+        chosen = []
+        for i in np.argsort(-scores, kind='stable'):
+            phrase = ' '.join(candidates[i])
+            # Skip phrases overlapping one already chosen ("solar" vs "solar panel")
+            padded = f' {phrase} '
+            if any(f' {other} ' in padded or padded in f' {other} ' for other, _, _ in chosen):
+                continue
+            chosen.append((phrase, float(scores[i]), int(counts[i])))
+            if len(chosen) >= top:
+                break
+        return [{'keyword': phrase, 'score': round(score, 4), 'count': count} for phrase, score, count in chosen]
+
+    def _batch_idf(self, documents):
+        """IDF from the request's own documents, each given as its set of words"""
+        vocabulary = {}
+        ids = [vocabulary.setdefault(word, len(vocabulary)) for words in documents for word in words]
+        df = np.bincount(np.asarray(ids, dtype=np.int64), minlength=len(vocabulary))
+        idf = np.log((1 + len(documents)) / (1 + df)) + 1
+        return lambda words: idf[[vocabulary[word] for word in words]]
+
+    def extract_batch(self, texts, top=8, learn=False):
+        """Keyphrases for each text, best first"""
+        runs = [phrases(text) for text in texts]
+        word_sets = [{word for run in doc_runs for word in run} for doc_runs in runs]
+        if learn and self.idf_table is not None:
+            self.idf_table.update(word_sets)
+
+        if self.idf_table is not None and self.idf_table.ready():
+            return [self._score(doc_runs, self.idf_table.idf, top) for doc_runs in runs]
+        if len(texts) > 1:
+            idf_of = self._batch_idf(word_sets)
+            return [self._score(doc_runs, idf_of, top) for doc_runs in runs]
+
+        # One document and no corpus: its sentences stand in for documents
+        sentences = [{word for run in phrases(sentence) for word in run} for sentence in split_sentences(texts[0])]
+        idf_of = self._batch_idf(sentences + [word_sets[0]])
+        return [self._score(runs[0], idf_of, top)]
+
+    def extract(self, text, top=8):
+        return self.extract_batch([text], top)[0]
+
+    def stats(self):
+        return self.idf_table.stats() if self.idf_table is not None else None
+
+# Create a global instance
+keyword_extractor = KeywordExtractor(IdfTable(KEYWORDS_IDF_PATH) if KEYWORDS_IDF_PATH else None)
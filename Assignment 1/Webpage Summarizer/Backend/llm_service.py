@@ -1,74 +1,220 @@
-import requests
 import logging
 import json
+import os
+import time
+from backend_common.admission import INTERACTIVE, AdmissionRejected, admission
+from backend_common.circuit_breaker import CircuitOpen
+from backend_common.metrics import llm_duration, llm_errors, record_ollama_stats
+from backend_common.model_catalog import ModelCatalog
+from backend_common.model_warmer import ModelUsage, ModelWarmer, usage_path
+from backend_common.ollama_pool import OllamaHostError, ollama_pool
+from backend_common.tracing import setup_logging
+from backend_common.upstream_client import Interrupt, upstream
+from semantic_cache import SEMANTIC_CACHE_ENABLED, SemanticCache, scope_id
+from single_flight import FlightCancelled, SingleFlight
 
-# Set up logging with a cleaner format
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s: %(message)s',
-    datefmt='%H:%M:%S'
-)
+# Set up logging with a cleaner format, written by a background thread
+setup_logging('%(asctime)s - %(levelname)s: [%(request_id)s] %(message)s', datefmt='%H:%M:%S')
 logger = logging.getLogger(__name__)
 
+class LLMServiceError(Exception):
+    """Raised when Ollama rejects or aborts a generation"""
+
 class LLMService:
-    def __init__(self, base_url="http://localhost:11434"):
-        self.base_url = base_url
-        logger.info(f"LLM Service initialized at {base_url}")
+    def __init__(self, pool=ollama_pool):
+        self.pool = pool
+        self.model_catalog = ModelCatalog(self._fetch_models)
+        self.flights = SingleFlight()
+        self.usage = ModelUsage(path=usage_path(os.path.dirname(os.path.abspath(__file__))))
+        self.warmer = ModelWarmer(pool, self.usage)
+        self.semantic_cache = SemanticCache(pool) if SEMANTIC_CACHE_ENABLED else None
+        logger.info(f"LLM Service initialized with Ollama hosts {', '.join(pool.urls)}")
+
+    def _fetch_models(self):
+        """Fetch model names from every Ollama host, raising if none answers"""
+        logger.debug("Connecting to Ollama for models list...")
+        models = list(self.pool.fetch_models())
+        logger.debug(f"Found {len(models)} models")
+        return models
+
+    @staticmethod
+    def _as_options(models):
+        model_list = [{'label': name, 'value': name} for name in models]
+        return model_list, model_list[0]['value'] if model_list else None
 
     def get_available_models(self):
-        """Fetch available models from Ollama"""
-        try:
-            logger.debug("Connecting to Ollama for models list...")
-            response = requests.get(f'{self.base_url}/api/tags')
-            
-            if response.status_code == 200:
-                models = response.json()
-                model_list = [{'label': model['name'], 'value': model['name']} 
-                            for model in models['models']]
-                logger.debug(f"Found {len(model_list)} models")
-                return model_list, model_list[0]['value'] if model_list else None
-            logger.error(f"Ollama connection failed: {response.status_code}")
-            return [], None
-        except Exception as e:
-            logger.error(f"Ollama connection error: {str(e)}")
-            return [], None
+        """Return available models from the cached catalogue"""
+        return self._as_options(self.model_catalog.get())
 
-    def generate_response(self, model, prompt, temperature=0.7):
-        """Generate response using specified model"""
-        try:
-            logger.debug(f"Connecting to Ollama with model: {model}")
-            response = requests.post(
-                f'{self.base_url}/api/generate',
-                json={
-                    'model': model,
-                    'prompt': prompt,
-                    'temperature': temperature
-                }
-            )
-            
-            if response.status_code == 200:
-                # Parse the response
-                response_text = ""
-                for line in response.text.strip().split('\n'):
+    def cached_models(self):
+        """Return models already in the catalogue without contacting Ollama"""
+        return self._as_options(self.model_catalog.peek() or [])
+
+    def refresh_models(self):
+        """Refresh the model catalogue now and return the refresh result"""
+        result = self.model_catalog.refresh()
+        result['options'], result['default'] = self._as_options(result['models'])
+        return result
+
+    def _iter_chunks(self, model, prompt, temperature=0.7, priority=INTERACTIVE, on_cancel=None):
+        """Yield parsed NDJSON chunks from Ollama's streaming generate API.
+
+        The generation holds one of the model's admission slots until the
+        stream ends, waiting in the queue for one if they are all taken,
+        and runs on the host the pool picks for the model. Raises
+        CircuitOpen before queueing when no host's circuit lets it through.
+        Cancelling takes a queued generation out of the admission queue.
+        """
+        self.pool.require()
+        with admission.slot(model, priority, on_cancel), self.pool.lease(model) as host:
+            logger.debug("Connecting to Ollama with model: %s", model)
+            started = time.perf_counter()
+            ttft = None
+            payload = {
+                'model': model,
+                'prompt': prompt,
+                'temperature': temperature,
+                'stream': True
+            }
+            keep_alive = self.warmer.keep_alive_for(model)
+            if keep_alive is not None:
+                payload['keep_alive'] = keep_alive
+            # Cancelling aborts the request at once, even while the model is still loading
+            interrupt = Interrupt()
+            if on_cancel is not None:
+                on_cancel(interrupt)
+            try:
+                if interrupt.fired:
+                    raise FlightCancelled('Generation cancelled')
+                with upstream.post(
+                    f'{host.url}/api/generate',
+                    json=payload,
+                    stream=True,
+                    interrupt=interrupt
+                ) as response:
                     try:
-                        line_data = json.loads(line)
-                        if 'response' in line_data:
-                            response_text += line_data['response']
-                    except json.JSONDecodeError:
-                        continue
-                
-                logger.debug("Response generated successfully")
+                        if response.status_code >= 500:
+                            logger.error(f"Ollama request to {host.url} failed: {response.status_code}")
+                            raise OllamaHostError(f'Ollama API error: {response.status_code}')
+                        if response.status_code != 200:
+                            logger.error(f"Ollama request failed: {response.status_code}")
+                            raise LLMServiceError(f'Ollama API error: {response.status_code}')
+                        # Ollama sends headers with its first chunk; judge the host by that,
+                        # not by how long the generation streams
+                        host.responded()
+
+                        for line in response.iter_lines():
+                            if not line:
+                                continue
+                            try:
+                                chunk = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                            if 'error' in chunk:
+                                raise LLMServiceError(f"Ollama API error: {chunk['error']}")
+                            if ttft is None and chunk.get('response'):
+                                ttft = time.perf_counter() - started
+                            if chunk.get('done'):
+                                elapsed = time.perf_counter() - started
+                                record_ollama_stats(model, chunk, ttft)
+                                llm_duration.observe(elapsed, 'ollama', model)
+                                chunk['timing'] = self.usage.record(model, chunk, elapsed)
+                            yield chunk
+                            if chunk.get('done'):
+                                break
+                    finally:
+                        interrupt.detach()
+            except (GeneratorExit, FlightCancelled):
+                raise
+            except Exception:
+                if interrupt.fired:
+                    # The read failed because the flight was cancelled; not the host's fault
+                    raise FlightCancelled('Generation cancelled') from None
+                llm_errors.inc('ollama', model)
+                raise
+
+    def _stream_tokens(self, model, prompt, temperature=0.7, priority=INTERACTIVE, on_cancel=None):
+        """Yield response tokens and return the generation's timing metadata"""
+        timing = None
+        # The done chunk carries the timing; _iter_chunks stops right after
+        # it, which releases the host lease and admission slot
+        for chunk in self._iter_chunks(model, prompt, temperature, priority, on_cancel):
+            token = chunk.get('response')
+            if token:
+                yield token
+            if 'timing' in chunk:
+                timing = chunk['timing']
+        return timing
+
+    def stream_response(self, model, prompt, temperature=0.7, priority=INTERACTIVE):
+        """Yield response tokens from specified model as Ollama emits them.
+
+        Identical concurrent requests share a single upstream generation,
+        admitted with the priority of the first of them. Raises
+        AdmissionRejected when the model's wait queue sheds the request and
+        CircuitOpen when every Ollama host's circuit is open.
+        Once exhausted, the returned iterator's ``result`` holds the timing
+        metadata: cold or warm model, load, generation and total seconds.
+        """
+        return self.flights.stream(
+            (model, prompt, temperature),
+            lambda on_cancel: self._stream_tokens(model, prompt, temperature, priority, on_cancel)
+        )
+
+    def generate_response(self, model, prompt, temperature=0.7, priority=INTERACTIVE, semantic=None):
+        """Generate response using specified model.
+
+        ``semantic`` opts into the semantic cache as ``(instruction, text)``:
+        a response stored for a near-duplicate text with the same model,
+        instruction and temperature is returned instead of generating, and
+        ``semantic`` in the result reports the best similarity found.
+        """
+        lookup = None
+        if semantic is not None and self.semantic_cache is not None:
+            instruction, text = semantic
+            scope = scope_id(model, instruction, float(temperature))
+            cached, similarity, vector = self.semantic_cache.lookup(scope, text)
+            if cached is not None:
+                logger.info(f"Semantic cache hit at similarity {similarity}")
                 return {
                     'status': 'success',
-                    'response': response_text
-                }
-            else:
-                logger.error(f"Ollama request failed: {response.status_code}")
-                return {
-                    'status': 'error',
-                    'message': f'Ollama API error: {response.status_code}'
+                    'response': cached,
+                    'timing': None,
+                    'semantic': {'status': 'hit', 'similarity': similarity}
                 }
-                
+            if vector is not None:
+                lookup = {'status': 'miss', 'similarity': similarity}
+        try:
+            tokens = self.stream_response(model, prompt, temperature, priority)
+            response_text = ''.join(tokens)
+            logger.debug("Response generated successfully")
+            result = {
+                'status': 'success',
+                'response': response_text,
+                'timing': tokens.result
+            }
+            if lookup is not None:
+                self.semantic_cache.store(scope, vector, response_text)
+                result['semantic'] = lookup
+            return result
+        except AdmissionRejected as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'retry_after': e.retry_after
+            }
+        except CircuitOpen as e:
+            return {
+                'status': 'error',
+                'message': 'Ollama is unavailable, please try again shortly',
+                'retry_after': e.retry_after,
+                'circuit': e.name
+            }
+        except LLMServiceError as e:
+            return {
+                'status': 'error',
+                'message': str(e)
+            }
         except Exception as e:
             logger.error(f"Ollama connection error: {str(e)}")
             return {
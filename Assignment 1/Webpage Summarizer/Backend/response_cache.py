@@ -0,0 +1,30 @@
+import hashlib
+import json
+import os
+
+from backend_common.tiered_cache import LRUCache, SQLiteStore, TieredCache
+
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))
+MEMORY_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MEMORY_ENTRIES', '512'))
+MEMORY_BYTES = int(os.environ.get('RESPONSE_CACHE_MEMORY_BYTES', str(64 * 1024 * 1024)))
+DISK_ENTRIES = int(os.environ.get('RESPONSE_CACHE_DISK_ENTRIES', '20000'))
+# Empty (the default) keeps responses in memory only
+DISK_PATH = os.environ.get('RESPONSE_CACHE_PATH', '')
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so reflowed page text maps to the same entry"""
+    return ' '.join(prompt.split())
+
+def response_key(model, prompt, temperature):
+    """Content hash identifying a generation request.
+
+    Output format isn't part of the key: an entry holds the markdown and,
+    once rendered, the HTML variant side by side.
+    """
+    payload = json.dumps([model, normalize_prompt(prompt), float(temperature)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+response_cache = TieredCache(
+    LRUCache(max_entries=MEMORY_ENTRIES, max_bytes=MEMORY_BYTES),
+    SQLiteStore(DISK_PATH, max_entries=DISK_ENTRIES) if DISK_PATH else None
+)
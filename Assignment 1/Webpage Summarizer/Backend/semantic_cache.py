@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from backend_common.metrics import registry
+from backend_common.upstream_client import upstream
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to reuse summaries of near-duplicate pages
+SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', '0') == '1'
+# Ollama embedding model used to compare pages
+SEMANTIC_CACHE_MODEL = os.environ.get('SEMANTIC_CACHE_MODEL', 'nomic-embed-text')
+# Ollama URL serving the embedding model; empty uses a host of the pool
+SEMANTIC_CACHE_URL = os.environ.get('SEMANTIC_CACHE_URL', '').rstrip('/')
+# Cosine similarity a stored page needs to be reused
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.97'))
+# Summaries kept; the least recently used one is replaced when full
+SEMANTIC_CACHE_CAPACITY = int(os.environ.get('SEMANTIC_CACHE_CAPACITY', '2048'))
+
+semantic_similarity = registry.histogram(
+    'semantic_cache_similarity', 'Best similarity found by semantic cache lookups', (),
+    buckets=(0.5, 0.7, 0.8, 0.9, 0.95, 0.97, 0.98, 0.99, 1.0))
+semantic_lookups = registry.counter(
+    'semantic_cache_lookups_total', 'Semantic cache lookups by result', ('result',))
+
+def scope_id(*parts):
+    """64-bit id of what must match exactly for a summary to be reused"""
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+class SemanticCache:
+    """Reuse stored values for texts whose embeddings are nearly the same.
+
+    Vectors are L2-normalized float32 rows of a preallocated matrix, so
+    cosine similarity against every stored text is one matrix product.
+    Each row carries a scope id (model, instruction, temperature) and only
+    rows of the query's scope can match.
+
+    Embeddings keep ``model`` loaded next to the summary models on
+    whichever host serves them, unless ``url`` points at a host of its own.
+    """
+
+    def __init__(self, pool, model=SEMANTIC_CACHE_MODEL, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 capacity=SEMANTIC_CACHE_CAPACITY, url=SEMANTIC_CACHE_URL):
+        self.pool = pool
+        self.model = model
+        self.url = url
+        self.threshold = threshold
+        self.capacity = capacity
+        self._vectors = None
+        self._scopes = np.zeros(capacity, dtype=np.int64)
+        self._used = np.zeros(capacity, dtype=np.float64)
+        self._values = [None] * capacity
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'errors': 0}
+
+    def embed(self, texts):
+        """Normalized float32 embeddings of texts, one row each.
+
+        Sent to ``url``, or else to the pool's best host without a lease, so
+        embeddings neither add to the host's load nor feed its circuit breaker.
+        """
+        url = self.url or self.pool.pick(self.model).url
+        response = upstream.post(f'{url}/api/embed', json={'model': self.model, 'input': texts})
+        if response.status_code == 404 and 'embeddings' not in response.text:
+            # Ollama before 0.3.4 only has the single-text endpoint
+            rows = []
+            for text in texts:
+                legacy = upstream.post(f'{url}/api/embeddings', json={'model': self.model, 'prompt': text})
+                legacy.raise_for_status()
+                rows.append(legacy.json()['embedding'])
+        else:
+            response.raise_for_status()
+            rows = response.json()['embeddings']
+        vectors = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def search(self, vectors, scopes):
+        """Best stored row and its similarity for each query row in the batch"""
+        with self._lock:
+            return self._search(vectors, scopes)
+
+    def _search(self, vectors, scopes):
+        # Caller holds the lock; rows are only valid until it is released
+        if self._size == 0 or self._vectors is None or self._vectors.shape[1] != vectors.shape[1]:
+            return np.full(len(vectors), -1), np.zeros(len(vectors), dtype=np.float32)
+        similarity = vectors @ self._vectors[:self._size].T
+        similarity[self._scopes[:self._size][None, :] != np.asarray(scopes)[:, None]] = -np.inf
+        best = similarity.argmax(axis=1)
+        return best, similarity[np.arange(len(vectors)), best]
+
+    def lookup(self, scope, text):
+        """Return ``(value, similarity, vector)``; value is None below the threshold.
+
+        The vector is returned so a miss can be stored without embedding
+        the text again. Embedding failures are logged and count as misses
+        with no vector.
+        """
+        try:
+            vector = self.embed([text])
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup skipped, embedding failed: {str(e)}")
+            with self._lock:
+                self._counters['errors'] += 1
+            semantic_lookups.inc('error')
+            return None, None, None
+
+        # One lock for search and read, so a concurrent store can't replace the row in between
+        with self._lock:
+            rows, similarities = self._search(vector, [scope])
+            row = int(rows[0])
+            # None when nothing in the text's scope is stored yet
+            similarity = float(similarities[0]) if row >= 0 and np.isfinite(similarities[0]) else None
+            if similarity is not None and similarity >= self.threshold:
+                self._used[row] = time.monotonic()
+                self._counters['hits'] += 1
+                value = self._values[row]
+            else:
+                self._counters['misses'] += 1
+                value = None
+        if similarity is not None:
+            semantic_similarity.observe(max(similarity, 0.0))
+        semantic_lookups.inc('hit' if value is not None else 'miss')
+        return value, round(similarity, 4) if similarity is not None else None, vector[0]
+
+    def store(self, scope, vector, value):
+        """Add a value under its text's vector, replacing the least recently used row when full"""
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                # Allocated on first use, when the embedding size is known; a
+                # different embedding model starts the index over
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(self._used.argmin())
+                self._counters['evicted'] += 1
+            self._vectors[row] = vector
+            self._scopes[row] = scope
+            self._used[row] = time.monotonic()
+            self._values[row] = value
+            self._counters['stored'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = self._size
+        stats['capacity'] = self.capacity
+        stats['threshold'] = self.threshold
+        stats['model'] = self.model
+        return stats
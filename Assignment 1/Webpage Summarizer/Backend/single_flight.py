@@ -0,0 +1,192 @@
+import collections
+import logging
+import threading
+
+from backend_common.tracing import bind
+
+logger = logging.getLogger(__name__)
+
+class FlightCancelled(Exception):
+    """Raised to subscribers of a flight that was aborted"""
+
+class _Flight:
+    """One upstream generation whose tokens are replayed to every subscriber"""
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.result = None
+        self.cancelled = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+        self._on_cancel = []
+
+    def append(self, token):
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(self, error=None, result=None):
+        with self.cond:
+            self.error = error
+            self.result = result
+            self.done = True
+            self.cond.notify_all()
+
+    def on_cancel(self, func):
+        """Call ``func`` when the flight is cancelled, straight away if it already was"""
+        with self.cond:
+            if not self.cancelled:
+                self._on_cancel.append(func)
+                return
+        func()
+
+    def cancel(self):
+        with self.cond:
+            self.cancelled = True
+            callbacks, self._on_cancel = self._on_cancel, []
+        for func in callbacks:
+            try:
+                func()
+            except Exception as e:
+                logger.debug("Cancelling a flight's upstream call failed: %s", e)
+
+class Subscription:
+    """Iterator over a flight's tokens.
+
+    Once exhausted, ``result`` holds the value the producer returned.
+    Closing it, or dropping it unread, gives up its place in the flight;
+    the flight is cancelled when no subscriber is left. ``close`` may be
+    called from another thread, which ends a read blocked on the next token.
+    """
+
+    def __init__(self, owner, key, flight):
+        self._owner = owner
+        self._key = key
+        self._flight = flight
+        self._position = 0
+        self._batch = collections.deque()
+        self._closed = False
+        self.result = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._batch:
+            return self._batch.popleft()
+        if self._closed:
+            raise StopIteration
+        flight = self._flight
+        with flight.cond:
+            while self._position >= len(flight.tokens) and not flight.done and not self._closed:
+                flight.cond.wait()
+            if self._closed:
+                raise StopIteration
+            self._batch.extend(flight.tokens[self._position:])
+            self._position = len(flight.tokens)
+        if self._batch:
+            return self._batch.popleft()
+        # Done, and every token has been read
+        self.close()
+        if flight.error is not None:
+            raise flight.error
+        self.result = flight.result
+        raise StopIteration
+
+    def close(self):
+        with self._flight.cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._flight.cond.notify_all()
+        self._batch.clear()
+        self._owner._unsubscribe(self._key, self._flight)
+
+    def __del__(self):
+        self.close()
+
+class SingleFlight:
+    """Coalesce concurrent identical token streams into one upstream call.
+
+    The first caller for a key starts a producer thread; every caller,
+    including the first, reads tokens from the shared buffer, so late
+    joiners replay what was already produced. When the last subscriber
+    stops reading, the producer is cancelled: ``produce`` gets an
+    ``on_cancel`` hook to register a call that interrupts the upstream
+    request, so a cancel doesn't wait for the next token.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {'flights': 0, 'coalesced': 0, 'cancelled': 0}
+
+    def stream(self, key, produce):
+        """Iterate tokens from ``produce(on_cancel)``, shared with identical in-flight calls"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._counters['flights'] += 1
+                # The producer's log records carry the first caller's request ID
+                threading.Thread(target=bind(self._run, key, flight, produce), daemon=True).start()
+            else:
+                self._counters['coalesced'] += 1
+                logger.debug("Joined in-flight generation")
+            flight.subscribers += 1
+        return Subscription(self, key, flight)
+
+    def _run(self, key, flight, produce):
+        error = None
+        result = None
+        tokens = produce(flight.on_cancel)
+        try:
+            while True:
+                try:
+                    token = next(tokens)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                if flight.cancelled:
+                    break
+                flight.append(token)
+        except Exception as e:
+            error = e
+        finally:
+            # Closing the generator releases the upstream HTTP response
+            tokens.close()
+            if flight.cancelled:
+                error = FlightCancelled('Generation cancelled')
+            flight.finish(error, result)
+            self._forget(key, flight)
+
+    def _forget(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _unsubscribe(self, key, flight):
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers == 0 and not flight.done
+            if abandoned:
+                # Nobody is listening any more; make sure later callers
+                # start a fresh generation
+                self._counters['cancelled'] += 1
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        if abandoned:
+            # Stop the upstream call now rather than at its next token
+            flight.cancel()
+
+    def stats(self):
+        """Report how many generations ran and how many callers joined one"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._flights)
+        total = stats['flights'] + stats['coalesced']
+        stats['coalesce_ratio'] = round(stats['coalesced'] / total, 4) if total else None
+        return stats
@@ -0,0 +1,32 @@
+from chunked_summarizer import ChunkedSummarizer
+
+TEXT = '\n\n'.join(f'Paragraph {i} ' + 'word ' * 300 for i in range(4))
+
+
+class FailingService:
+    """Answers every generation with the same error result"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def generate_response(self, model, prompt, temperature, priority):
+        self.calls += 1
+        return dict(self.result)
+
+
+def test_open_circuits_are_reported_as_unavailable():
+    service = FailingService({'status': 'error', 'message': 'Ollama is unavailable, please try again shortly',
+                              'retry_after': 9, 'circuit': 'ollama'})
+    result = ChunkedSummarizer(service).summarize('m', TEXT, chunk_tokens=256)
+    assert service.calls > 1
+    assert (result['circuit'], result['retry_after']) == ('ollama', 9)
+    assert result['failed_chunks'] == service.calls
+
+
+def test_shed_chunks_are_reported_as_busy():
+    service = FailingService({'status': 'error', 'message': 'Queue full', 'retry_after': 3})
+    result = ChunkedSummarizer(service).summarize('m', TEXT, chunk_tokens=256)
+    assert result['message'] == 'Model is busy, please try again later'
+    assert result['retry_after'] == 3
+    assert 'circuit' not in result
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from job_manager import JobManager
+from single_flight import SingleFlight
+
+
+class BlockedService:
+    """Streams through SingleFlight from a producer stuck before its first token"""
+
+    def __init__(self):
+        self.flights = SingleFlight()
+        self.started = threading.Event()
+        self.aborted = threading.Event()
+
+    def stream_response(self, model, prompt, temperature):
+        def produce(on_cancel):
+            on_cancel(self.aborted.set)
+            self.started.set()
+            # Stands in for a model load or a full admission queue
+            if not self.aborted.wait(5):
+                yield 'too late'
+
+        return self.flights.stream((model, prompt, temperature), produce)
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_cancel_aborts_a_job_blocked_before_its_first_token():
+    service = BlockedService()
+    manager = JobManager(service, max_workers=1)
+    job_id = manager.submit('client', 'model', 'prompt')
+    assert service.started.wait(2)
+    wait_for(lambda: manager.stats()['running'] == 1)
+
+    started = time.monotonic()
+    assert manager.cancel(job_id)
+    assert service.aborted.wait(1)
+    wait_for(lambda: manager.stats()['cancelled'] == 1)
+    assert time.monotonic() - started < 1
+    assert manager.poll(job_id)['status'] == 'cancelled'
+    assert service.flights.stats()['in_flight'] == 0
+
+
+def test_cancel_of_a_queued_job_never_runs_it():
+    service = BlockedService()
+    manager = JobManager(service, max_workers=1)
+    running = manager.submit('client', 'model', 'first')
+    queued = manager.submit('client', 'model', 'second')
+    assert service.started.wait(2)
+
+    assert manager.cancel(queued)
+    assert manager.poll(queued)['status'] == 'cancelled'
+    manager.cancel(running)
+    wait_for(lambda: manager.stats()['cancelled'] == 2)
+    assert manager.stats()['completed'] == 0
@@ -0,0 +1,42 @@
+import random
+
+from markdown_renderer import IncrementalRenderer, MarkdownRenderer
+
+SAMPLE = (
+    "## Summary\n\nThe page covers **three** points.\n\n"
+    "```python\ndef f():\n\n    return 1\n```\n\n"
+    "- first\n- second\n\n\nLast paragraph."
+)
+
+# Fences are counted as runs of three backticks, so four open and close one
+STREAM = SAMPLE + "\n\n````\nquad ``` fence\n\n````\n\nEnd."
+
+
+def boundary(text):
+    """Last blank line outside a fence, scanning the whole text"""
+    position = text.rfind('\n\n')
+    while position != -1:
+        if text.count('```', 0, position) % 2 == 0:
+            return position + 2
+        position = text.rfind('\n\n', 0, position)
+    return 0
+
+
+def test_boundary_matches_a_full_scan_at_every_split():
+    rng = random.Random(7)
+    for _ in range(50):
+        incremental = IncrementalRenderer(MarkdownRenderer())
+        position = 0
+        while position < len(STREAM):
+            position = min(len(STREAM), position + rng.randint(1, 6))
+            text = STREAM[:position]
+            assert incremental._boundary(text) == boundary(text)
+
+
+def test_streamed_html_ends_like_the_whole_document():
+    renderer = MarkdownRenderer()
+    incremental = IncrementalRenderer(renderer)
+    for token in SAMPLE.split(' '):
+        incremental.feed(token + ' ')
+    # Blocks split on blank lines outside fences render the same either way
+    assert incremental.html().replace('\n', '') == renderer.convert(SAMPLE + ' ').replace('\n', '')
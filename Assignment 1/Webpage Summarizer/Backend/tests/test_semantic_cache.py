@@ -0,0 +1,50 @@
+import threading
+import time
+
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+VECTORS = {'page': [1.0, 0.0], 'near page': [0.99, 0.1], 'other': [0.0, 1.0]}
+
+
+class StubCache(SemanticCache):
+    """Embeds from a fixed table instead of calling Ollama"""
+
+    def embed(self, texts):
+        vectors = np.asarray([VECTORS[text] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_near_duplicates_in_the_same_scope_hit():
+    cache = StubCache(pool=None, threshold=0.95, capacity=4)
+    value, similarity, vector = cache.lookup(1, 'page')
+    assert (value, similarity) == (None, None)
+    cache.store(1, vector, 'summary')
+
+    value, similarity, _ = cache.lookup(1, 'near page')
+    assert value == 'summary' and similarity >= 0.95
+    assert cache.lookup(2, 'near page')[0] is None
+    assert cache.lookup(1, 'other')[0] is None
+
+
+def test_a_concurrent_store_cannot_swap_the_matched_row():
+    cache = StubCache(pool=None, threshold=0.95, capacity=1)
+    cache.store(1, cache.embed(['page'])[0], 'summary')
+    search = cache._search
+    storing = []
+
+    def search_then_store(vectors, scopes):
+        result = search(vectors, scopes)
+        # Replaces row 0 with another scope's value as soon as it can
+        thread = threading.Thread(target=cache.store, args=(2, cache.embed(['page'])[0], 'foreign'))
+        thread.start()
+        storing.append(thread)
+        time.sleep(0.05)
+        return result
+
+    cache._search = search_then_store
+    value, _, _ = cache.lookup(1, 'near page')
+    storing[0].join(1)
+    assert value == 'summary'
+    assert cache._values[0] == 'foreign'
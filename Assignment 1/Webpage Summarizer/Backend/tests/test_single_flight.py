@@ -0,0 +1,112 @@
+import gc
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def producer(tokens, release=None, calls=None, cancelled=None):
+    """A produce callable yielding ``tokens`` once ``release`` is set"""
+    def produce(on_cancel):
+        if calls is not None:
+            calls.append(1)
+        if cancelled is not None:
+            on_cancel(cancelled.set)
+        if release is not None:
+            release.wait(2)
+        for token in tokens:
+            yield token
+        return ''.join(tokens)
+    return produce
+
+
+def test_identical_streams_share_one_generation():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+    produce = producer(['a', 'b', 'c'], release, calls)
+    first = flights.stream('key', produce)
+    second = flights.stream('key', produce)
+    release.set()
+
+    assert list(first) == ['a', 'b', 'c']
+    assert list(second) == ['a', 'b', 'c']
+    assert first.result == second.result == 'abc'
+    assert len(calls) == 1
+    stats = flights.stats()
+    assert (stats['flights'], stats['coalesced'], stats['in_flight']) == (1, 1, 0)
+
+
+def test_late_joiners_replay_earlier_tokens():
+    more = threading.Event()
+
+    def produce(on_cancel):
+        yield 'a'
+        more.wait(2)
+        yield 'b'
+
+    flights = SingleFlight()
+    first = flights.stream('key', produce)
+    assert next(first) == 'a'
+
+    second = flights.stream('key', producer(['x']))
+    more.set()
+    assert list(second) == ['a', 'b']
+    assert list(first) == ['b']
+
+
+def test_errors_reach_every_subscriber():
+    def produce(on_cancel):
+        yield 'a'
+        raise RuntimeError('upstream failed')
+
+    flights = SingleFlight()
+    subscriptions = [flights.stream('key', produce) for _ in range(2)]
+    for subscription in subscriptions:
+        with pytest.raises(RuntimeError):
+            list(subscription)
+
+
+def test_last_subscriber_leaving_cancels_the_generation():
+    flights = SingleFlight()
+    release = threading.Event()
+    cancelled = threading.Event()
+    first = flights.stream('key', producer(['a'], release, cancelled=cancelled))
+    second = flights.stream('key', producer(['a']))
+
+    first.close()
+    assert not cancelled.is_set()
+    second.close()
+    # The upstream call is interrupted at once, not at its next token
+    assert cancelled.wait(1)
+    assert flights.stats()['cancelled'] == 1
+    release.set()
+
+    # A later caller starts a fresh generation
+    assert list(flights.stream('key', producer(['b']))) == ['b']
+
+
+def test_dropping_an_unread_subscription_releases_it():
+    flights = SingleFlight()
+    release = threading.Event()
+    cancelled = threading.Event()
+    flights.stream('key', producer(['a'], release, cancelled=cancelled))
+    gc.collect()
+
+    assert cancelled.wait(1)
+    assert flights.stats()['in_flight'] == 0
+    release.set()
+
+
+def test_subscription_close_is_idempotent():
+    flights = SingleFlight()
+    release = threading.Event()
+    cancelled = threading.Event()
+    first = flights.stream('key', producer(['a'], release, cancelled=cancelled))
+    second = flights.stream('key', producer(['a']))
+    first.close()
+    first.close()
+    assert not cancelled.is_set()
+    release.set()
+    assert list(second) == ['a']
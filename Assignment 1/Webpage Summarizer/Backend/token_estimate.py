@@ -0,0 +1,6 @@
+# Rough chars-per-token ratio for English text with common tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """Cheap token estimate; good enough for packing chunks and budgets"""
+    return len(text) // CHARS_PER_TOKEN + 1
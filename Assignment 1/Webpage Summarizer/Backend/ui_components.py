@@ -6,6 +6,8 @@ from llm_service import llm_service
 
 def create_layout():
     """Create the main application layout"""
+    # Only what is already cached; the refresh-models callback fills the rest
+    models, default_model = llm_service.cached_models()
     return dmc.MantineProvider(
         theme={
             'colorScheme': 'dark',
@@ -49,8 +51,9 @@ def create_layout():
                             dmc.Select(
                                 id='model-dropdown',
                                 label="Select Model",
-                                data=llm_service.get_available_models()[0],
-                                value=llm_service.get_available_models()[1],
+                                data=models,
+                                value=default_model,
+                                placeholder="Select a model" if models else "Loading models...",
                                 style={'width': 'calc(100% - 50px)'},
                                 clearable=False,
                             ),
@@ -115,6 +118,16 @@ def create_layout():
                                     loading=False,
                                     n_clicks=0,
                                 ),
+                                dmc.Button(
+                                    "Cancel",
+                                    id='cancel-button',
+                                    leftIcon=DashIconify(icon="radix-icons:cross-2"),
+                                    variant="outline",
+                                    color="red",
+                                    size="md",
+                                    disabled=True,
+                                    n_clicks=0,
+                                ),
                             ],
                             position="center",
                             mb=20,
@@ -138,6 +151,10 @@ def create_layout():
                             withBorder=True,
                             style={'minHeight': '150px'},
                         ),
+
+                        # Partial output polling for background generation jobs
+                        dcc.Store(id='job-id'),
+                        dcc.Interval(id='job-interval', interval=300, disabled=True),
                     ],
                     p="xl",
                     radius="md",
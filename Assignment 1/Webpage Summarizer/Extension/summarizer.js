@@ -1,58 +1,32 @@
 (function() {
   let currentModal = null;
 
-  async function getLLMKeywords(text) {
+  async function getBackendKeywords(text) {
+    // Keyphrases scored by the backend in milliseconds, without an LLM call
     try {
-      // Get settings for the model
-      const settings = await browser.storage.sync.get({
-        modelType: 'openai',
-        openaiModel: 'gpt-3.5-turbo-0125',
-        ollamaModel: 'mistral:latest',
-        apiUrl: 'https://api.openai.com/v1',
-        apiKey: ''
+      const response = await fetch('http://localhost:8050/api/keywords', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ text: text, top: 8 })
       });
-
-      const message = {
-        type: 'generate_keywords',
-        data: {
-          model: settings.modelType === 'openai' ? settings.openaiModel : settings.ollamaModel,
-          prompt: `Extract 5-8 of the most important keywords or key phrases that appear verbatim in the text. Only use words or phrases exactly as they appear in the text. Return these keywords as comma-separated values, without any additional text or formatting. Do not add any words that are not present in the original text:\n\n${text}`,
-          temperature: 0.3
-        }
-      };
-
-      const result = await browser.runtime.sendMessage(message);
-      
-      if (result.error) {
-        console.log('LLM keyword error:', result.error);
+      if (!response.ok) {
+        console.log('Keyword extraction failed with status:', response.status);
         return null;
       }
-      
-      if (!result.success || !result.keywords) {
-        console.log('Invalid response from LLM keyword generation');
+
+      const data = await response.json();
+      if (data.status !== 'success' || !data.keywords.length) {
         return null;
       }
 
-      // Log the raw response for debugging
-      console.log('Raw LLM response:', result.keywords);
-
-      // Ensure we're working with a string
-      const keywordText = String(result.keywords).trim();
-      
-      // Process comma-separated keywords
-      const keywords = keywordText
-        .split(',')
-        .map(k => k.trim())
-        .filter(k => k.length > 0)
-        .map(word => ({
-          word: word.toLowerCase(),
-          frequency: 1  // Set to 1 as we trust the LLM's selection
-        }));
-
-      console.log('Successfully generated LLM keywords:', keywords);
+      const keywords = data.keywords.map(k => ({
+        word: k.keyword,
+        frequency: k.count
+      }));
+      console.log('Backend keywords:', keywords);
       return keywords;
     } catch (error) {
-      console.error('Error getting LLM keywords:', error);
+      console.error('Error getting backend keywords:', error);
       return null;
     }
   }
@@ -79,12 +53,31 @@
       }));
   }
 
+  async function getExtractiveSentences(text) {
+    // Key sentences ranked by the backend, without an LLM call
+    try {
+      const response = await fetch('http://localhost:8050/api/summarize/extractive', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ text: text, sentences: 8 })
+      });
+      if (!response.ok) {
+        return null;
+      }
+      const data = await response.json();
+      return data.status === 'success' ? data.sentences.map(s => s.text) : null;
+    } catch (error) {
+      console.log('Extractive summary unavailable:', error);
+      return null;
+    }
+  }
+
   async function basicSummarize(text) {
     // Split text into paragraphs and sentences
     const sentences = text.match(/[^.!?]+[.!?]+/g) || [];
     
-    // Create sections for the summary
-    const mainPoints = sentences
+    // Create sections for the summary, preferring the backend's ranked sentences
+    const mainPoints = (await getExtractiveSentences(text)) || sentences
       .filter(sentence => sentence.length > 100)
       .slice(0, 8);
 
@@ -117,11 +110,11 @@
       // Show initial loading modal
       currentModal = await showSummary(null);
 
-      // First try to get LLM keywords
-      let keywords = await getLLMKeywords(text);
-      console.log('LLM keyword generation:', keywords ? 'success' : 'failed');
+      // First try the backend keyword extractor
+      let keywords = await getBackendKeywords(text);
+      console.log('Backend keyword extraction:', keywords ? 'success' : 'failed');
 
-      // If LLM keywords failed, use frequency-based keywords
+      // If the backend is unavailable, use frequency-based keywords
       if (!keywords) {
         console.log('Falling back to frequency-based keywords');
         keywords = getFrequencyKeywords(text);
@@ -409,7 +402,9 @@
               type: 'summarize',
               data: {
                 model: settings.ollamaModel,
-                prompt: `Please provide a summary of the following text, including key points and important details:\n\n${text}`,
+                prompt: 'Please provide a summary of the following text, including key points and important details:',
+                // Sent apart from the prompt so the backend can trim it to its most relevant sentences
+                text: text,
                 temperature: 0.7
               }
             };
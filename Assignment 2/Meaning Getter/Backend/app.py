@@ -1,154 +1,613 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+import collections
 import logging
 import json
-from google.generativeai import GenerativeModel  # for Gemini
-import openai  # for OpenAI
-import google.generativeai as genai
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-
-# Configure logging - only show INFO and above by default
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+import math
+import os
+import time
+from backend_common.admission import BULK, INTERACTIVE, AdmissionRejected, admission
+from backend_common.circuit_breaker import CircuitOpen, breakers
+from backend_common.metrics import (CONTENT_TYPE, llm_duration, llm_errors, register_cache, register_upstream, registry,
+                                    track_requests)
+from backend_common.model_catalog import ModelCatalog
+from backend_common.model_warmer import ModelUsage, ModelWarmer, usage_path
+from backend_common.ollama_pool import ollama_pool
+from backend_common.tracing import bind, setup_logging, slow_requests, span, trace_requests
+from backend_common.upstream_client import Interrupt, upstream
+from definition_cache import DICTIONARY_TTL, LLM_TTL, definition_cache, dictionary_key, llm_key, normalize_word
+from hedging import Cancellation, Candidate, HedgeThreads, SourceCancelled, race
+from offline_dictionary import OFFLINE_DICTIONARY_MODE, offline_dictionary
+from providers import GeminiProvider, OllamaProvider, OpenAIProvider, ProviderRegistry, fingerprint
+
+# Configure logging - only show INFO and above by default (LOG_LEVEL), written
+# by a background thread
+setup_logging('%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)
+track_requests(app)
+trace_requests(app)
+
+DICTIONARY_API_URL = os.environ.get('DICTIONARY_API_URL', 'https://api.dictionaryapi.dev/api/v2/entries/en')
+
+# Dictionary lookups should answer quickly
+SHORT_TIMEOUT = (upstream.connect_timeout, 10)
+
+# Batch lookups share one bounded pool so a large request can't flood providers
+BATCH_WORKERS = int(os.environ.get('MEANING_BATCH_WORKERS', '8'))
+BATCH_MAX_WORDS = int(os.environ.get('MEANING_BATCH_MAX_WORDS', '200'))
+BATCH_ITEM_TIMEOUT = float(os.environ.get('MEANING_BATCH_ITEM_TIMEOUT', '30'))
+# Words one batch keeps in the pool at once, so a single batch can't fill it
+BATCH_IN_FLIGHT = int(os.environ.get('MEANING_BATCH_IN_FLIGHT', str(max(1, BATCH_WORKERS // 2))))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='meaning')
+
+# Latency-budget mode: a hedge source starts HEDGE_DELAY seconds after the provider
+HEDGE_BUDGET = float(os.environ.get('MEANING_HEDGE_BUDGET', '5'))
+HEDGE_DELAY = float(os.environ.get('MEANING_HEDGE_DELAY', '0.75'))
+# Racing sources running at once, losers included; past it hedges are skipped rather than queued
+HEDGE_WORKERS = int(os.environ.get('MEANING_HEDGE_WORKERS', '64'))
+hedge_executor = HedgeThreads(HEDGE_WORKERS)
+
+register_cache('definition', definition_cache)
+register_upstream(upstream)
+# source is llm, dictionary, offline, hedge, none, shed, unavailable or error; dictionary and
+# offline answers to an llm provider are fallbacks
+meaning_lookups = registry.counter(
+    'meaning_lookups_total', 'Meaning lookups by requested provider and answering source',
+    ('provider', 'source'))
+
+def fetch_models():
+    """Fetch model names from every Ollama host, raising if none answers"""
+    return list(ollama_pool.fetch_models())
+
+# Shared by /api/models and default-model lookups in query_ollama
+model_catalog = ModelCatalog(fetch_models)
 
 def get_available_models():
     """Get list of available Ollama models"""
-    try:
-        response = requests.get('http://localhost:11434/api/tags')
-        if response.ok:
-            models = response.json()['models']
-            return [model['name'] for model in models]
-        return []
-    except Exception as e:
-        logger.error(f"Error fetching models: {str(e)}")
-        return []
+    return model_catalog.get()
 
-def query_ollama(prompt, model=None):
-    """Query Ollama model running locally"""
-    if not model:
+DEFAULT_MODELS = {'openai': 'gpt-3.5-turbo', 'gemini': 'gemini-pro'}
+
+def default_model(provider):
+    """Model used when a request doesn't name one"""
+    if provider == 'ollama':
         models = get_available_models()
-        model = models[0] if models else "mistral"
-    
-    try:
-        response = requests.post('http://localhost:11434/api/generate', 
-            json={
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            }
-        )
-        
-        if response.ok:
-            return response.json()['response']
-        else:
-            logger.error(f"Ollama API error for model {model}")
-            return None
-            
-    except Exception as e:
-        logger.error(f"Error querying Ollama: {str(e)}")
-        return None
+        return models[0] if models else "mistral"
+    return DEFAULT_MODELS.get(provider)
 
-def query_gemini(prompt, model_name, api_key):
-    """Query Gemini model with appropriate configuration"""
-    try:
-        genai.configure(api_key=api_key)
-        
-        # Initialize model with basic configuration
-        generation_config = {
-            'temperature': 0.7,
-            'top_p': 0.8,
-            'top_k': 40
-        }
-
-        model = genai.GenerativeModel(model_name=model_name,
-                                    generation_config=generation_config)
-        
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        logger.error(f"Error with Gemini API: {str(e)}")
-        return None
+def build_prompt(word):
+    """Prompt asking an LLM to define a word"""
+    return f"""Define the word '{word}' and specify its part of speech. 
+Format the response in markdown with:
+- Word as heading
+- Part of speech in *italics*
+- Definition in a clear, concise manner
+- Example usage if relevant"""
+
+# Ollama usage scores decide which models the warmer keeps loaded
+model_usage = ModelUsage(path=usage_path(os.path.dirname(os.path.abspath(__file__))))
+model_warmer = ModelWarmer(ollama_pool, model_usage)
+
+# Clients are built once per (provider, API key, model) and shared
+provider_registry = ProviderRegistry({
+    'ollama': lambda api_key, model: OllamaProvider(ollama_pool, model, model_warmer),
+    'openai': OpenAIProvider,
+    'gemini': GeminiProvider,
+})
+
+def provider_breaker(provider, api_key):
+    """Circuit breaker of a remote provider, one per API key so a bad key only trips its own"""
+    return breakers.get(f"{provider}:{fingerprint(api_key)}")
+
+def query_provider(provider, prompt, model=None, api_key=None, priority=INTERACTIVE, meta=None, on_cancel=None):
+    """Ask a provider's shared client for an answer.
+
+    Ollama calls first take one of the model's admission slots, so they
+    may wait in its queue or raise AdmissionRejected; Ollama hosts have
+    their own circuit breakers in the pool. Calls to other providers go
+    through the provider's breaker, where errors and empty answers count
+    as failures. Either raises CircuitOpen without calling out while the
+    circuit is open. Timing metadata the provider reports is added to
+    ``meta``. ``on_cancel`` registers aborts for an Ollama call's admission
+    wait and request; SDK calls can't be aborted and ignore it.
+    """
+    model = model or default_model(provider)
+    if provider == 'ollama':
+        # Fail fast rather than queue for a slot no host can serve
+        ollama_pool.require()
+    with provider_registry.lease(provider, model, api_key) as client:
+        with admission.slot(model, priority, on_cancel) if provider == 'ollama' else nullcontext():
+            started = time.perf_counter()
+            try:
+                if provider == 'ollama':
+                    return client.generate(prompt, meta, on_cancel)
+                with provider_breaker(provider, api_key).guard() as call:
+                    answer = client.generate(prompt, meta)
+                    call.failed = not answer
+                    return answer
+            finally:
+                llm_duration.observe(time.perf_counter() - started, provider, model)
 
 @app.route('/api/models', methods=['GET'])
 def list_models():
     """Endpoint to list available models"""
+    if request.args.get('refresh'):
+        result = model_catalog.refresh()
+        return jsonify({"models": result['models'], "refreshed": result['status'] == 'success'})
     models = get_available_models()
     return jsonify({"models": models})
 
-@app.route('/api/meaning/<word>', methods=['GET'])
-def get_meaning(word):
-    provider = request.args.get('provider', 'ollama')
-    model = request.args.get('model', None)
-    api_key = request.args.get('api_key', None)
-    
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this process"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """Endpoint to report upstream connection pool usage"""
+    return jsonify({"hosts": upstream.stats()})
+
+@app.route('/api/providers/stats', methods=['GET'])
+def provider_stats():
+    """Endpoint to report shared provider clients"""
+    return jsonify(provider_registry.stats())
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats():
+    """Endpoint to report per-model Ollama concurrency, queue depth and wait times"""
+    return jsonify(admission.stats())
+
+@app.route('/api/pool/stats', methods=['GET'])
+def pool_stats():
+    """Endpoint to report load, latency, health and loaded models per Ollama host"""
+    return jsonify({"hosts": ollama_pool.stats()})
+
+@app.route('/api/breakers/stats', methods=['GET'])
+def breaker_stats():
+    """Endpoint to report the state of every circuit breaker"""
+    return jsonify({"breakers": breakers.stats()})
+
+@app.route('/api/traces/slow', methods=['GET'])
+def slow_traces():
+    """Endpoint to report per-phase breakdowns of recent slow requests"""
+    return jsonify(slow_requests.stats())
+
+@app.route('/api/warmup/stats', methods=['GET'])
+def warmup_stats():
+    """Endpoint to report resident Ollama models and per-model cold and warm latency"""
+    return jsonify(model_warmer.stats())
+
+@app.route('/api/dictionary/stats', methods=['GET'])
+def dictionary_stats():
+    """Endpoint to report offline dictionary size and lookups"""
+    if offline_dictionary is None:
+        return jsonify({"available": False, "mode": OFFLINE_DICTIONARY_MODE})
+    return jsonify({**offline_dictionary.stats(), "mode": OFFLINE_DICTIONARY_MODE})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Endpoint to report definition cache usage"""
+    return jsonify(definition_cache.stats())
+
+def llm_definition(word, provider, model, api_key, priority=INTERACTIVE, on_cancel=None):
+    """Generate a definition with an LLM provider, or None if it has no usable answer"""
+    with span('prompt'):
+        prompt = build_prompt(word)
+    response = None
+    meta = {}
+
+    if provider_usable(provider, api_key):
+        logger.info(f"Using {provider} (model: {model}) for word: '{word}'")
+        try:
+            response = query_provider(provider, prompt, model, api_key, priority, meta, on_cancel)
+        except CircuitOpen as e:
+            logger.info(f"{str(e)}, skipping to the fallback for '{word}'")
+            return None
+
+    if not response or len(response) <= 10:
+        llm_errors.inc(provider, model)
+        return None
+    logger.debug("Definition generated for '%s' (%d chars)", word, len(response))
+    return {
+        "word": word,
+        "meanings": [{
+            "partOfSpeech": "definition",
+            "definitions": [{
+                "definition": response.strip()
+            }]
+        }],
+        **meta
+    }
+
+def dictionary_definition(word, on_cancel=None):
+    """Look a word up in the Dictionary API, or None if it isn't found"""
+    logger.info(f"Using Dictionary API fallback for '{word}'")
+    api_url = f"{DICTIONARY_API_URL}/{word}"
+    interrupt = Interrupt()
+    if on_cancel is not None:
+        on_cancel(interrupt)
+    started = time.perf_counter()
     try:
-        prompt = f"""Define the word '{word}' and specify its part of speech. 
-Format the response in markdown with:
-- Word as heading
-- Part of speech in *italics*
-- Definition in a clear, concise manner
-- Example usage if relevant"""
+        with breakers.get('dictionary').guard() as call:
+            try:
+                response = upstream.get(api_url, timeout=SHORT_TIMEOUT, interrupt=interrupt)
+            except requests.RequestException:
+                if interrupt.fired:
+                    # Not the API's fault; the breaker doesn't count it
+                    raise SourceCancelled('Dictionary API request cancelled') from None
+                raise
+            call.failed = response.status_code >= 500
+    finally:
+        llm_duration.observe(time.perf_counter() - started, 'dictionary', '')
+    if response.ok:
+        logger.info(f"Dictionary API definition found for '{word}'")
+        return response.json()[0]
+    return None
 
-        response = None
-        
-        if provider == 'ollama':
-            response = query_ollama(prompt, model)
-            logger.info(f"Using Ollama (model: {model or 'default'}) for word: '{word}'")
-        elif provider == 'openai' and api_key:
-            openai.api_key = api_key
-            completion = openai.ChatCompletion.create(
-                model=model or "gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            response = completion.choices[0].message.content
-            logger.info(f"Using OpenAI (model: {model or 'gpt-3.5-turbo'}) for word: '{word}'")
-        elif provider == 'gemini' and api_key:
-            response = query_gemini(prompt, model or 'gemini-pro', api_key)
-            logger.info(f"Using Gemini (model: {model or 'gemini-pro'}) for word: '{word}'")
-        
-        if response and len(response) > 10:
-            logger.info(f"Definition generated: {response.strip()}")
-            return jsonify({
-                "word": word,
-                "meanings": [{
-                    "partOfSpeech": "definition",
-                    "definitions": [{
-                        "definition": response.strip()
-                    }]
-                }]
-            })
-        else:
-            logger.warning(f"No valid response from {provider}, falling back to Dictionary API")
-        
-        # Fallback: Dictionary API
-        logger.info(f"Using Dictionary API fallback for '{word}'")
-        api_url = f"https://api.dictionaryapi.dev/api/v2/entries/en/{word}"
-        response = requests.get(api_url)
-        
-        if response.ok:
-            api_response = response.json()[0]
-            logger.info(f"Dictionary API definition found for '{word}'")
-            return jsonify(api_response)
-        else:
-            logger.error(f"No definition found for '{word}'")
-            return jsonify({
-                "error": "Word not found",
-                "message": "No definition available in both Ollama and dictionary API"
-            }), 404
+def offline_definition(word):
+    """Look a word or its base form up in the offline dictionary, or None"""
+    if offline_dictionary is None:
+        return None
+    with span('offline'):
+        entry = offline_dictionary.lookup(word)
+    if entry is None:
+        return None
+    return {**entry, "source": "offline"}
+
+def cached_definition(cache_key, ttl, use_cache, produce):
+    """Serve a definition from the cache, or produce and store it.
+
+    Timing metadata of a fresh answer is returned but not cached.
+    """
+    if use_cache:
+        cached, tier = definition_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cache": {"status": "hit", "tier": tier}}
+    result = produce()
+    if result is None:
+        return None
+    timing = result.pop("timing", None)
+    definition_cache.set(cache_key, result, ttl)
+    if timing is not None:
+        return {**result, "cache": {"status": "miss"}, "timing": timing}
+    return {**result, "cache": {"status": "miss"}}
+
+def llm_source(word, provider, model, api_key, use_cache=True, priority=INTERACTIVE, on_cancel=None):
+    with span('provider'):
+        return cached_definition(llm_key(word, provider, model), LLM_TTL, use_cache,
+                                 lambda: llm_definition(word, provider, model, api_key, priority, on_cancel))
+
+def dictionary_source(word, use_cache=True, on_cancel=None):
+    with span('fallback'):
+        # The local index answers without a network round trip, so it needs no cache
+        if OFFLINE_DICTIONARY_MODE == 'fallback':
+            body = offline_definition(word)
+            if body is not None:
+                return body
+        return cached_definition(dictionary_key(word), DICTIONARY_TTL, use_cache,
+                                 lambda: dictionary_definition(word, on_cancel))
+
+def resolve_model(provider, model):
+    """The requested model, else the provider's default"""
+    if model:
+        return model
+    with span('model'):
+        return default_model(provider)
+
+def provider_usable(provider, api_key):
+    return provider == 'ollama' or (provider in ('openai', 'gemini') and bool(api_key))
+
+def positive_seconds(value, allow_zero=False):
+    """``value`` as a finite number of seconds above zero, or None if it isn't one"""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(seconds) or seconds < 0 or (seconds == 0 and not allow_zero):
+        return None
+    return seconds
+
+def race_args(args):
+    """Keyword arguments for race_meaning from a query string, or None and an error body"""
+    budget = positive_seconds(args['budget'])
+    if budget is None:
+        return None, {"error": "Invalid request", "message": "'budget' must be a positive number of seconds"}
+    hedge_after = positive_seconds(args.get('hedge_after', HEDGE_DELAY), allow_zero=True)
+    if hedge_after is None:
+        return None, {"error": "Invalid request",
+                      "message": "'hedge_after' must be a non-negative number of seconds"}
+    return {
+        "budget": budget,
+        "hedge": args.get('hedge', 'dictionary'),
+        "hedge_model": args.get('hedge_model', None),
+        "hedge_after": hedge_after
+    }, None
 
+def duplicate_hedge_response(provider, model):
+    """Body and status for a hedge that would race the primary source against itself"""
+    return {
+        "error": "Invalid request",
+        "message": f"The hedge must differ from the primary source ({provider}, model {model})"
+    }, 400
+
+def shed_response(error):
+    """Body and status for a lookup shed by admission control"""
+    return {
+        "error": "Too many requests",
+        "message": str(error),
+        "retry_after": error.retry_after
+    }, 429
+
+def unavailable_response(error):
+    """Body and status for a lookup failed fast by an open circuit breaker"""
+    return {
+        "error": "Service unavailable",
+        "message": f"{str(error)}, please try again shortly",
+        "retry_after": error.retry_after
+    }, 503
+
+def meaning_response(body, status):
+    """JSON response for a lookup, with Retry-After when it was shed or failed fast"""
+    response = jsonify(body)
+    if status in (429, 503):
+        response.headers['Retry-After'] = str(body['retry_after'])
+    return response, status
+
+def lookup_meaning(word, provider='ollama', model=None, api_key=None, use_cache=True, priority=INTERACTIVE):
+    """Define a word with the requested provider, falling back to the dictionary.
+
+    Returns the JSON body and HTTP status so it can serve both the single
+    and the batch endpoints. A lookup shed by admission control returns 429
+    rather than falling back, so clients back off while Ollama is saturated.
+    A provider whose circuit breaker is open is skipped for the fallback
+    straight away; an open Dictionary API breaker returns 503. With
+    ``OFFLINE_DICTIONARY_MODE=first`` the offline dictionary answers before
+    the provider is asked.
+    """
+    try:
+        if OFFLINE_DICTIONARY_MODE == 'first':
+            body = offline_definition(word)
+            if body is not None:
+                meaning_lookups.inc(provider, 'offline')
+                return body, 200
+
+        if provider_usable(provider, api_key):
+            body = llm_source(word, provider, resolve_model(provider, model), api_key, use_cache, priority)
+            if body is not None:
+                meaning_lookups.inc(provider, 'llm')
+                return body, 200
+        logger.warning(f"No valid response from {provider}, falling back to Dictionary API")
+
+        body = dictionary_source(word, use_cache)
+        if body is not None:
+            meaning_lookups.inc(provider, body.get("source", "dictionary"))
+            return body, 200
+
+        logger.error(f"No definition found for '{word}'")
+        meaning_lookups.inc(provider, 'none')
+        return {
+            "error": "Word not found",
+            "message": "No definition available in both Ollama and dictionary API"
+        }, 404
+
+    except AdmissionRejected as e:
+        meaning_lookups.inc(provider, 'shed')
+        return shed_response(e)
+    except CircuitOpen as e:
+        meaning_lookups.inc(provider, 'unavailable')
+        return unavailable_response(e)
     except Exception as e:
         logger.error(f"Error processing '{word}': {str(e)}")
-        return jsonify({
+        meaning_lookups.inc(provider, 'error')
+        return {
             "error": "Service error",
             "message": str(e)
-        }), 500
+        }, 500
+
+def race_source(winner, provider, body=None):
+    """Source label for meaning_lookups_total of a hedged lookup"""
+    if winner is None:
+        return 'none'
+    if winner == 'dictionary':
+        return body.get('source', 'dictionary') if body else 'dictionary'
+    return 'llm' if winner == provider else 'hedge'
+
+def race_meaning(word, provider='ollama', model=None, api_key=None, use_cache=True,
+                 budget=HEDGE_BUDGET, hedge='dictionary', hedge_model=None, hedge_after=HEDGE_DELAY):
+    """Define a word within a latency budget by hedging the provider with a second source.
+
+    The hedge starts ``hedge_after`` seconds into the race (or as soon as the
+    primary fails) and the first acceptable answer wins. The body reports the
+    winner and each source's timing under ``race``. Losing Ollama and
+    Dictionary API calls are aborted, giving back their admission slot and
+    connection; OpenAI and Gemini calls can't be and are abandoned.
+    """
+    if OFFLINE_DICTIONARY_MODE == 'first':
+        body = offline_definition(word)
+        if body is not None:
+            meaning_lookups.inc(provider, 'offline')
+            return body, 200
+
+    def llm_candidate(name, source, source_model, delay=0.0):
+        # Only Ollama calls can be aborted
+        cancellation = Cancellation() if source == 'ollama' else None
+        on_cancel = cancellation.on_cancel if cancellation is not None else None
+        return Candidate(name, lambda: llm_source(word, source, source_model, api_key, use_cache,
+                                                  on_cancel=on_cancel), delay, cancellation)
+
+    candidates = []
+    if provider_usable(provider, api_key):
+        model = resolve_model(provider, model)
+        candidates.append(llm_candidate(provider, provider, model))
+
+    delay = hedge_after if candidates else 0.0
+    if hedge == 'dictionary':
+        cancellation = Cancellation()
+        candidates.append(Candidate(
+            'dictionary', lambda: dictionary_source(word, use_cache, cancellation.on_cancel), delay, cancellation))
+    elif provider_usable(hedge, api_key):
+        hedge_model = resolve_model(hedge, hedge_model)
+        if hedge == provider and hedge_model == model:
+            return duplicate_hedge_response(provider, model)
+        name = hedge if hedge != provider else f"{hedge}:{hedge_model}"
+        candidates.append(llm_candidate(name, hedge, hedge_model, delay))
+
+    winner, body, timings = race(candidates, budget, hedge_executor)
+    meaning_lookups.inc(provider, race_source(winner, provider, body))
+    race_info = {"winner": winner, "budget": budget, "sources": timings}
+    if winner is not None:
+        return {**body, "race": race_info}, 200
+
+    timed_out = any(t['status'] in ('abandoned', 'cancelled') for t in timings.values())
+    if timed_out:
+        logger.warning(f"No definition for '{word}' within {budget}s budget")
+        return {
+            "error": "Timeout",
+            "message": f"No definition available within {budget}s",
+            "race": race_info
+        }, 504
+    return {
+        "error": "Word not found",
+        "message": "No definition available from any source",
+        "race": race_info
+    }, 404
+
+@app.route('/api/meaning/<word>', methods=['GET'])
+def get_meaning(word):
+    if 'budget' in request.args:
+        hedging, error = race_args(request.args)
+        if error is not None:
+            return jsonify(error), 400
+        body, status = race_meaning(
+            word,
+            provider=request.args.get('provider', 'ollama'),
+            model=request.args.get('model', None),
+            api_key=request.args.get('api_key', None),
+            use_cache=request.args.get('cache', '1') != '0',
+            **hedging
+        )
+        with span('serialize'):
+            return jsonify(body), status
+
+    body, status = lookup_meaning(
+        word,
+        provider=request.args.get('provider', 'ollama'),
+        model=request.args.get('model', None),
+        api_key=request.args.get('api_key', None),
+        use_cache=request.args.get('cache', '1') != '0'
+    )
+    with span('serialize'):
+        return meaning_response(body, status)
+
+@app.route('/api/meanings', methods=['POST'])
+def get_meanings():
+    """Define many words concurrently, streaming NDJSON lines as each finishes"""
+    data = request.get_json(silent=True) or {}
+    words = data.get('words')
+    if not isinstance(words, list) or not words:
+        return jsonify({"error": "Invalid request", "message": "Expected a non-empty 'words' list"}), 400
+    if len(words) > BATCH_MAX_WORDS:
+        return jsonify({
+            "error": "Invalid request",
+            "message": f"At most {BATCH_MAX_WORDS} words per batch"
+        }), 400
+
+    provider = data.get('provider', 'ollama')
+    model = data.get('model')
+    api_key = data.get('api_key')
+    use_cache = data.get('cache', True)
+    if not isinstance(use_cache, bool):
+        return jsonify({"error": "Invalid request", "message": "'cache' must be true or false"}), 400
+    item_timeout = positive_seconds(data.get('timeout', BATCH_ITEM_TIMEOUT))
+    if item_timeout is None:
+        return jsonify({"error": "Invalid request", "message": "'timeout' must be a positive number of seconds"}), 400
+
+    # Dedupe on the normalized form, remembering every spelling requested
+    requested = {}
+    for word in words:
+        if not isinstance(word, str) or not normalize_word(word):
+            continue
+        requested.setdefault(normalize_word(word), []).append(word)
+
+    logger.info(f"Batch lookup of {len(requested)} unique words using {provider}")
+
+    # Per-item timeouts run from when a worker picks the word up, so words
+    # queued behind a busy pool still get their full budget
+    started = {}
+
+    def run(word):
+        started[word] = time.monotonic()
+        # Batch words queue behind single lookups for the same model
+        body, status = lookup_meaning(word, provider, model, api_key, use_cache, BULK)
+        return body, status, time.monotonic() - started[word]
+
+    def line(word, status, body, elapsed):
+        return json.dumps({
+            "word": word,
+            "requested": requested[word],
+            "status": status,
+            "elapsed": round(elapsed, 3) if elapsed is not None else None,
+            "result": body
+        }) + "\n"
+
+    def lines():
+        queue = collections.deque(requested)
+        pending = {}
+        # Timed-out words whose threads are still running count as in flight
+        overdue = set()
+        counts = {"ok": 0, "not_found": 0, "shed": 0, "unavailable": 0, "error": 0, "timeout": 0}
+        try:
+            while pending or queue:
+                overdue = {future for future in overdue if not future.done()}
+                while queue and len(pending) + len(overdue) < BATCH_IN_FLIGHT:
+                    word = queue.popleft()
+                    pending[batch_executor.submit(bind(run, word))] = word
+
+                done, _ = wait([*pending, *overdue], timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    word = pending.pop(future, None)
+                    if word is None:
+                        continue
+                    try:
+                        body, status, elapsed = future.result()
+                    except Exception as e:
+                        body, status, elapsed = {"error": "Service error", "message": str(e)}, 500, None
+                    counts[{200: "ok", 404: "not_found", 429: "shed", 503: "unavailable"}.get(status, "error")] += 1
+                    yield line(word, status, body, elapsed)
+
+                # Report overdue words as partial results; their threads finish
+                # in the background and still populate the cache
+                now = time.monotonic()
+                for future, word in list(pending.items()):
+                    if word in started and now - started[word] > item_timeout:
+                        del pending[future]
+                        overdue.add(future)
+                        counts["timeout"] += 1
+                        yield line(word, 504, {
+                            "error": "Timeout",
+                            "message": f"No definition within {item_timeout}s"
+                        }, now - started[word])
+        finally:
+            # The client went away or the stream failed: drop words no worker has started
+            for future in pending:
+                future.cancel()
+
+        yield json.dumps({"done": True, "words": len(requested), **counts}) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+# Started on import so WSGI servers get them too. debug=True also runs this
+# module in the reloader's watcher process; only the serving child checks
+# hosts and keeps models warm
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    ollama_pool.start()
+    model_warmer.start()
 
 if __name__ == '__main__':
     available_models = get_available_models()
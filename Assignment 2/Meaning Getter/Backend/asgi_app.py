@@ -0,0 +1,534 @@
+"""Asyncio serving mode for the Meaning Getter backend.
+
+Run with: hypercorn asgi_app:app --bind 127.0.0.1:8050
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from quart import Quart, Response, g, jsonify, request
+
+from backend_common.admission import BULK, INTERACTIVE, AdmissionRejected, admission
+from backend_common.circuit_breaker import CircuitOpen, breakers
+from backend_common.metrics import (CONTENT_TYPE, http_duration, http_in_flight, llm_duration, llm_errors,
+                                    record_ollama_stats, registry)
+from backend_common.ollama_pool import OllamaHostError, ollama_pool
+from backend_common.tracing import REQUEST_ID_HEADER, bind, slow_requests, span, start_trace
+from backend_common.upstream_client import CONNECT_TIMEOUT, READ_TIMEOUT, upstream
+
+from app import (
+    BATCH_IN_FLIGHT,
+    BATCH_ITEM_TIMEOUT,
+    BATCH_MAX_WORDS,
+    DICTIONARY_API_URL,
+    HEDGE_BUDGET,
+    HEDGE_DELAY,
+    build_prompt,
+    default_model,
+    duplicate_hedge_response,
+    get_available_models,
+    meaning_lookups,
+    model_catalog,
+    model_usage,
+    model_warmer,
+    offline_definition,
+    positive_seconds,
+    provider_registry,
+    provider_usable,
+    query_provider,
+    race_args,
+    race_source,
+    shed_response,
+    unavailable_response,
+)
+from definition_cache import DICTIONARY_TTL, LLM_TTL, definition_cache, dictionary_key, llm_key, normalize_word
+from hedging import Candidate, race_async
+from offline_dictionary import OFFLINE_DICTIONARY_MODE, offline_dictionary
+
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO; keep only its warnings off the hot path
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', '200'))
+PROVIDER_WORKERS = int(os.environ.get('ASYNC_PROVIDER_WORKERS', '16'))
+# Threads for definition cache reads and writes, whose SQLite tier blocks
+CACHE_WORKERS = int(os.environ.get('ASYNC_CACHE_WORKERS', '4'))
+
+app = Quart(__name__)
+
+# Created on startup so it binds to the serving event loop
+http = None
+provider_executor = ThreadPoolExecutor(max_workers=PROVIDER_WORKERS, thread_name_prefix='provider')
+cache_executor = ThreadPoolExecutor(max_workers=CACHE_WORKERS, thread_name_prefix='cache')
+
+
+@app.before_serving
+async def open_client():
+    global http
+    http = httpx.AsyncClient(
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                            max_keepalive_connections=ASYNC_MAX_CONNECTIONS // 4)
+    )
+    ollama_pool.start()
+    model_warmer.start()
+
+
+@app.after_serving
+async def close_client():
+    await http.aclose()
+    provider_executor.shutdown(wait=False)
+    cache_executor.shutdown(wait=False)
+
+
+@app.before_request
+async def start_timer():
+    # Quart counterpart of metrics.track_requests and tracing.trace_requests
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    g.trace = start_trace(g.metrics_route, request.headers.get(REQUEST_ID_HEADER))
+    http_in_flight.inc(g.metrics_route)
+
+
+@app.after_request
+async def allow_cors(response):
+    # Same policy as flask_cors' CORS(app) in app.py
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers[REQUEST_ID_HEADER] = g.trace.request_id
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+async def stop_timer(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    route = g.pop('metrics_route')
+    status = g.pop('metrics_status', 500)
+    http_in_flight.dec(route)
+    http_duration.observe(time.perf_counter() - started, route, request.method, str(status))
+    slow_requests.finish(g.pop('trace'), request.method, status)
+
+
+async def run_blocking(func, *args):
+    """Run a blocking call on the bounded provider executor, keeping the request's trace"""
+    return await asyncio.get_running_loop().run_in_executor(provider_executor, bind(func, *args))
+
+
+async def cache_call(func, *args):
+    """Run a definition cache call off the loop when it may touch the SQLite tier.
+
+    Its own executor keeps cache reads from queueing behind slow SDK calls.
+    """
+    if definition_cache.disk is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(cache_executor, bind(func, *args))
+
+
+async def query_ollama(prompt, model, meta=None):
+    """Query Ollama without blocking the event loop"""
+    try:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        }
+        keep_alive = model_warmer.keep_alive_for(model)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        started = time.perf_counter()
+        with ollama_pool.lease(model, errors=(httpx.TransportError, OllamaHostError)) as host:
+            response = await http.post(f'{host.url}/api/generate', json=payload)
+            if response.status_code >= 500:
+                raise OllamaHostError(f'Ollama at {host.url} answered {response.status_code}')
+        if response.is_success:
+            body = response.json()
+            record_ollama_stats(model, body)
+            timing = model_usage.record(model, body, time.perf_counter() - started)
+            if meta is not None:
+                meta['timing'] = timing
+            return body['response']
+        logger.error(f"Ollama API error for model {model}")
+        return None
+    except CircuitOpen:
+        raise
+    except Exception as e:
+        logger.error(f"Error querying Ollama: {str(e)}")
+        return None
+
+
+def meaning_response(body, status):
+    """Quart counterpart of app.meaning_response"""
+    response = jsonify(body)
+    if status in (429, 503):
+        response.headers['Retry-After'] = str(body['retry_after'])
+    return response, status
+
+
+async def resolve_model(provider, model):
+    if model:
+        return model
+    with span('model'):
+        if provider == 'ollama' and model_catalog.stats()['cached_models'] == 0:
+            # Cold catalogue: the first fetch blocks, so keep it off the loop
+            return await run_blocking(default_model, provider)
+        return default_model(provider)
+
+
+async def llm_definition(word, provider, model, api_key, priority=INTERACTIVE):
+    """Async counterpart of app.llm_definition"""
+    with span('prompt'):
+        prompt = build_prompt(word)
+    response = None
+    meta = {}
+
+    try:
+        if provider == 'ollama':
+            ollama_pool.require()
+            async with admission.async_slot(model, priority):
+                started = time.perf_counter()
+                try:
+                    response = await query_ollama(prompt, model, meta)
+                finally:
+                    llm_duration.observe(time.perf_counter() - started, provider, model)
+            logger.info(f"Using Ollama (model: {model}) for word: '{word}'")
+        elif provider_usable(provider, api_key):
+            # SDK clients are blocking; they come from the shared registry
+            response = await run_blocking(query_provider, provider, prompt, model, api_key)
+            logger.info(f"Using {provider} (model: {model}) for word: '{word}'")
+    except CircuitOpen as e:
+        logger.info(f"{str(e)}, skipping to the fallback for '{word}'")
+        return None
+
+    if not response or len(response) <= 10:
+        llm_errors.inc(provider, model)
+        return None
+    return {
+        "word": word,
+        "meanings": [{
+            "partOfSpeech": "definition",
+            "definitions": [{
+                "definition": response.strip()
+            }]
+        }],
+        **meta
+    }
+
+
+async def dictionary_definition(word):
+    """Async counterpart of app.dictionary_definition"""
+    logger.info(f"Using Dictionary API fallback for '{word}'")
+    started = time.perf_counter()
+    try:
+        with breakers.get('dictionary').guard() as call:
+            response = await http.get(f"{DICTIONARY_API_URL}/{word}", timeout=10)
+            call.failed = response.status_code >= 500
+    finally:
+        llm_duration.observe(time.perf_counter() - started, 'dictionary', '')
+    if response.is_success:
+        return response.json()[0]
+    return None
+
+
+async def cached_definition(cache_key, ttl, use_cache, produce):
+    if use_cache:
+        cached, tier = await cache_call(definition_cache.get, cache_key)
+        if cached is not None:
+            return {**cached, "cache": {"status": "hit", "tier": tier}}
+    result = await produce()
+    if result is None:
+        return None
+    timing = result.pop("timing", None)
+    await cache_call(definition_cache.set, cache_key, result, ttl)
+    if timing is not None:
+        return {**result, "cache": {"status": "miss"}, "timing": timing}
+    return {**result, "cache": {"status": "miss"}}
+
+
+async def llm_source(word, provider, model, api_key, use_cache=True, priority=INTERACTIVE):
+    with span('provider'):
+        return await cached_definition(llm_key(word, provider, model), LLM_TTL, use_cache,
+                                       lambda: llm_definition(word, provider, model, api_key, priority))
+
+
+async def dictionary_source(word, use_cache=True):
+    with span('fallback'):
+        # Offline lookups read a memory-mapped file and are fast enough to run on the loop
+        if OFFLINE_DICTIONARY_MODE == 'fallback':
+            body = offline_definition(word)
+            if body is not None:
+                return body
+        return await cached_definition(dictionary_key(word), DICTIONARY_TTL, use_cache,
+                                       lambda: dictionary_definition(word))
+
+
+async def lookup_meaning(word, provider='ollama', model=None, api_key=None, use_cache=True, priority=INTERACTIVE):
+    """Async counterpart of app.lookup_meaning"""
+    try:
+        if OFFLINE_DICTIONARY_MODE == 'first':
+            body = offline_definition(word)
+            if body is not None:
+                meaning_lookups.inc(provider, 'offline')
+                return body, 200
+
+        if provider_usable(provider, api_key):
+            model = await resolve_model(provider, model)
+            body = await llm_source(word, provider, model, api_key, use_cache, priority)
+            if body is not None:
+                meaning_lookups.inc(provider, 'llm')
+                return body, 200
+        logger.warning(f"No valid response from {provider}, falling back to Dictionary API")
+
+        body = await dictionary_source(word, use_cache)
+        if body is not None:
+            meaning_lookups.inc(provider, body.get("source", "dictionary"))
+            return body, 200
+
+        logger.error(f"No definition found for '{word}'")
+        meaning_lookups.inc(provider, 'none')
+        return {
+            "error": "Word not found",
+            "message": "No definition available in both Ollama and dictionary API"
+        }, 404
+
+    except AdmissionRejected as e:
+        meaning_lookups.inc(provider, 'shed')
+        return shed_response(e)
+    except CircuitOpen as e:
+        meaning_lookups.inc(provider, 'unavailable')
+        return unavailable_response(e)
+    except Exception as e:
+        logger.error(f"Error processing '{word}': {str(e)}")
+        meaning_lookups.inc(provider, 'error')
+        return {
+            "error": "Service error",
+            "message": str(e)
+        }, 500
+
+
+async def race_meaning(word, provider='ollama', model=None, api_key=None, use_cache=True,
+                       budget=HEDGE_BUDGET, hedge='dictionary', hedge_model=None, hedge_after=HEDGE_DELAY):
+    """Async counterpart of app.race_meaning; losing sources are cancelled"""
+    if OFFLINE_DICTIONARY_MODE == 'first':
+        body = offline_definition(word)
+        if body is not None:
+            meaning_lookups.inc(provider, 'offline')
+            return body, 200
+
+    candidates = []
+    if provider_usable(provider, api_key):
+        model = await resolve_model(provider, model)
+        candidates.append(Candidate(
+            provider, lambda: llm_source(word, provider, model, api_key, use_cache)))
+
+    delay = hedge_after if candidates else 0.0
+    if hedge == 'dictionary':
+        candidates.append(Candidate(
+            'dictionary', lambda: dictionary_source(word, use_cache), delay))
+    elif provider_usable(hedge, api_key):
+        hedge_model = await resolve_model(hedge, hedge_model)
+        if hedge == provider and hedge_model == model:
+            return duplicate_hedge_response(provider, model)
+        name = hedge if hedge != provider else f"{hedge}:{hedge_model}"
+        candidates.append(Candidate(
+            name, lambda: llm_source(word, hedge, hedge_model, api_key, use_cache), delay))
+
+    winner, body, timings = await race_async(candidates, budget)
+    meaning_lookups.inc(provider, race_source(winner, provider, body))
+    race_info = {"winner": winner, "budget": budget, "sources": timings}
+    if winner is not None:
+        return {**body, "race": race_info}, 200
+    if any(t['status'] == 'cancelled' for t in timings.values()):
+        return {
+            "error": "Timeout",
+            "message": f"No definition available within {budget}s",
+            "race": race_info
+        }, 504
+    return {
+        "error": "Word not found",
+        "message": "No definition available from any source",
+        "race": race_info
+    }, 404
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus metrics for this process"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/api/upstream/stats', methods=['GET'])
+async def upstream_stats():
+    """Endpoint to report upstream connection pool usage (pool and warm-up traffic in this mode)"""
+    return jsonify({"hosts": upstream.stats()})
+
+
+@app.route('/api/providers/stats', methods=['GET'])
+async def provider_stats():
+    """Endpoint to report shared provider clients"""
+    return jsonify(provider_registry.stats())
+
+
+@app.route('/api/admission/stats', methods=['GET'])
+async def admission_stats():
+    """Endpoint to report per-model Ollama concurrency, queue depth and wait times"""
+    return jsonify(admission.stats())
+
+
+@app.route('/api/pool/stats', methods=['GET'])
+async def pool_stats():
+    """Endpoint to report load, latency, health and loaded models per Ollama host"""
+    return jsonify({"hosts": ollama_pool.stats()})
+
+
+@app.route('/api/breakers/stats', methods=['GET'])
+async def breaker_stats():
+    """Endpoint to report the state of every circuit breaker"""
+    return jsonify({"breakers": breakers.stats()})
+
+
+@app.route('/api/traces/slow', methods=['GET'])
+async def slow_traces():
+    """Endpoint to report per-phase breakdowns of recent slow requests"""
+    return jsonify(slow_requests.stats())
+
+
+@app.route('/api/warmup/stats', methods=['GET'])
+async def warmup_stats():
+    """Endpoint to report resident Ollama models and per-model cold and warm latency"""
+    return jsonify(model_warmer.stats())
+
+
+@app.route('/api/dictionary/stats', methods=['GET'])
+async def dictionary_stats():
+    """Endpoint to report offline dictionary size and lookups"""
+    if offline_dictionary is None:
+        return jsonify({"available": False, "mode": OFFLINE_DICTIONARY_MODE})
+    return jsonify({**offline_dictionary.stats(), "mode": OFFLINE_DICTIONARY_MODE})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def cache_stats():
+    """Endpoint to report definition cache usage"""
+    return jsonify(await cache_call(definition_cache.stats))
+
+
+@app.route('/api/models', methods=['GET'])
+async def list_models():
+    """Endpoint to list available models"""
+    if request.args.get('refresh'):
+        result = await run_blocking(model_catalog.refresh)
+        return jsonify({"models": result['models'], "refreshed": result['status'] == 'success'})
+    if model_catalog.stats()['cached_models'] == 0:
+        return jsonify({"models": await run_blocking(get_available_models)})
+    return jsonify({"models": get_available_models()})
+
+
+@app.route('/api/meaning/<word>', methods=['GET'])
+async def get_meaning(word):
+    if 'budget' in request.args:
+        hedging, error = race_args(request.args)
+        if error is not None:
+            return jsonify(error), 400
+        body, status = await race_meaning(
+            word,
+            provider=request.args.get('provider', 'ollama'),
+            model=request.args.get('model', None),
+            api_key=request.args.get('api_key', None),
+            use_cache=request.args.get('cache', '1') != '0',
+            **hedging
+        )
+        with span('serialize'):
+            return jsonify(body), status
+
+    body, status = await lookup_meaning(
+        word,
+        provider=request.args.get('provider', 'ollama'),
+        model=request.args.get('model', None),
+        api_key=request.args.get('api_key', None),
+        use_cache=request.args.get('cache', '1') != '0'
+    )
+    with span('serialize'):
+        return meaning_response(body, status)
+
+
+@app.route('/api/meanings', methods=['POST'])
+async def get_meanings():
+    """Async counterpart of app.get_meanings; overdue words are cancelled"""
+    data = await request.get_json(silent=True) or {}
+    words = data.get('words')
+    if not isinstance(words, list) or not words:
+        return jsonify({"error": "Invalid request", "message": "Expected a non-empty 'words' list"}), 400
+    if len(words) > BATCH_MAX_WORDS:
+        return jsonify({
+            "error": "Invalid request",
+            "message": f"At most {BATCH_MAX_WORDS} words per batch"
+        }), 400
+
+    provider = data.get('provider', 'ollama')
+    model = data.get('model')
+    api_key = data.get('api_key')
+    use_cache = data.get('cache', True)
+    if not isinstance(use_cache, bool):
+        return jsonify({"error": "Invalid request", "message": "'cache' must be true or false"}), 400
+    item_timeout = positive_seconds(data.get('timeout', BATCH_ITEM_TIMEOUT))
+    if item_timeout is None:
+        return jsonify({"error": "Invalid request", "message": "'timeout' must be a positive number of seconds"}), 400
+
+    requested = {}
+    for word in words:
+        if not isinstance(word, str) or not normalize_word(word):
+            continue
+        requested.setdefault(normalize_word(word), []).append(word)
+
+    logger.info(f"Batch lookup of {len(requested)} unique words using {provider}")
+    in_flight = asyncio.Semaphore(BATCH_IN_FLIGHT)
+
+    async def run(word):
+        async with in_flight:
+            # The timeout runs from when the word gets a place, as in app.get_meanings
+            started = time.monotonic()
+            try:
+                body, status = await asyncio.wait_for(
+                    lookup_meaning(word, provider, model, api_key, use_cache, BULK), item_timeout)
+            except asyncio.TimeoutError:
+                body, status = {
+                    "error": "Timeout",
+                    "message": f"No definition within {item_timeout}s"
+                }, 504
+            except Exception as e:
+                body, status = {"error": "Service error", "message": str(e)}, 500
+            return word, body, status, time.monotonic() - started
+
+    async def lines():
+        tasks = [asyncio.ensure_future(run(word)) for word in requested]
+        counts = {"ok": 0, "not_found": 0, "shed": 0, "unavailable": 0, "error": 0, "timeout": 0}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                word, body, status, elapsed = await next_done
+                counts[{200: "ok", 404: "not_found", 429: "shed", 503: "unavailable",
+                        504: "timeout"}.get(status, "error")] += 1
+                yield json.dumps({
+                    "word": word,
+                    "requested": requested[word],
+                    "status": status,
+                    "elapsed": round(elapsed, 3),
+                    "result": body
+                }) + "\n"
+            yield json.dumps({"done": True, "words": len(requested), **counts}) + "\n"
+        finally:
+            # The client went away: stop every lookup still running or waiting
+            for task in tasks:
+                task.cancel()
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+
+if __name__ == '__main__':
+    logger.info("Starting Meaning Getter backend server (asyncio mode)")
+    app.run(port=8050)
@@ -0,0 +1,38 @@
+import os
+import unicodedata
+
+from backend_common.tiered_cache import LRUCache, SQLiteStore, TieredCache
+
+# LLM answers depend only on word/provider/model, so keep them a long time;
+# dictionary entries are refreshed more often
+LLM_TTL = float(os.environ.get('DEFINITION_CACHE_LLM_TTL', str(30 * 24 * 3600)))
+DICTIONARY_TTL = float(os.environ.get('DEFINITION_CACHE_DICTIONARY_TTL', str(7 * 24 * 3600)))
+MEMORY_ENTRIES = int(os.environ.get('DEFINITION_CACHE_MEMORY_ENTRIES', '2048'))
+MEMORY_BYTES = int(os.environ.get('DEFINITION_CACHE_MEMORY_BYTES', str(16 * 1024 * 1024)))
+DISK_ENTRIES = int(os.environ.get('DEFINITION_CACHE_DISK_ENTRIES', '200000'))
+# Set to an empty string to keep the cache in memory only
+DISK_PATH = os.environ.get(
+    'DEFINITION_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'definition_cache.sqlite3')
+)
+
+
+def normalize_word(word):
+    """Normalize a looked-up word so trivial variants share an entry"""
+    return unicodedata.normalize('NFKC', word).strip().strip('.,;:!?"\'()[]').lower()
+
+
+def llm_key(word, provider, model):
+    """Cache key for an LLM-generated definition"""
+    return f"llm:{provider}:{model or 'default'}:{normalize_word(word)}"
+
+
+def dictionary_key(word):
+    """Cache key for a dictionary API entry"""
+    return f"dictionary:{normalize_word(word)}"
+
+
+definition_cache = TieredCache(
+    LRUCache(max_entries=MEMORY_ENTRIES, max_bytes=MEMORY_BYTES),
+    SQLiteStore(DISK_PATH, max_entries=DISK_ENTRIES) if DISK_PATH else None
+)
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from backend_common.tracing import bind
+
+logger = logging.getLogger(__name__)
+
+
+class SourceCancelled(Exception):
+    """Raised in a race candidate that was cancelled because the race ended without it"""
+
+
+class Cancellation:
+    """Abort functions a running candidate registers, called when its race ends.
+
+    Sources pass ``on_cancel`` down to the calls they make, e.g. an
+    upstream request's Interrupt or an admission wait.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, func):
+        """Call ``func`` on cancel, straight away if it already happened"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(func)
+                return
+        func()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            try:
+                func()
+            except Exception as e:
+                logger.debug(f"Cancelling a hedged source failed: {str(e)}")
+
+
+class Candidate:
+    """A source in a race, started ``delay`` seconds after the race begins.
+
+    ``func`` returns an acceptable answer, or None if the source has
+    nothing usable. A candidate with a ``cancellation`` is cancelled
+    through it when it is still running as the race ends; one without
+    is abandoned and finishes in the background.
+    """
+
+    def __init__(self, name, func, delay=0.0, cancellation=None):
+        self.name = name
+        self.func = func
+        self.delay = delay
+        self.cancellation = cancellation
+
+
+class HedgeThreads:
+    """Runs race candidates each on a thread of its own, at most ``limit`` at once.
+
+    A fixed pool would queue a new race's candidates behind losers of
+    earlier races that are still finishing, spending the new race's budget
+    on the wait. Here a candidate starts at once or not at all: when
+    ``limit`` threads are busy, only a candidate the race can't do without
+    starts, and a hedge is skipped.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._running = 0
+        self._lock = threading.Lock()
+        self._counters = {'started': 0, 'skipped': 0}
+
+    def submit(self, func, required=True):
+        """Start ``func`` and return its future, or None if it was skipped"""
+        with self._lock:
+            if self._running >= self.limit and not required:
+                self._counters['skipped'] += 1
+                return None
+            self._running += 1
+            self._counters['started'] += 1
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        threading.Thread(target=run, name='hedge', daemon=True).start()
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'running': self._running, 'limit': self.limit}
+
+
+def _next_start(candidates, started, now, budget):
+    delays = [c.delay for c in candidates if c.name not in started]
+    return min(delays + [budget]) - now
+
+
+def race(candidates, budget, executor):
+    """Run candidates as staggered hedges and return the first acceptable answer.
+
+    A candidate starts once its delay has passed, or straight away when
+    every started candidate has already failed. Returns
+    ``(winner, result, timings)``; ``winner`` is None if nothing acceptable
+    arrived within ``budget`` seconds. ``executor`` is a HedgeThreads, so
+    candidates never queue; a hedge it has no room for is skipped. Losers
+    still running are cancelled if they can be; the rest finish in the
+    background and their results are dropped.
+    """
+    if len({c.name for c in candidates}) != len(candidates):
+        raise ValueError('Race candidates need distinct names')
+    began = time.monotonic()
+    futures = {}
+    timings = {c.name: {'status': 'not_started'} for c in candidates}
+    started = set()
+
+    def start(candidate):
+        started.add(candidate.name)
+        timings[candidate.name] = {'status': 'pending', 'started': round(time.monotonic() - began, 3)}
+
+        def run():
+            t = time.monotonic()
+            try:
+                return candidate.func()
+            finally:
+                timings[candidate.name]['elapsed'] = round(time.monotonic() - t, 3)
+
+        # Bound so the candidate's spans and log records stay on the request's trace
+        future = executor.submit(bind(run), required=not futures)
+        if future is None:
+            timings[candidate.name] = {'status': 'skipped'}
+        else:
+            futures[future] = candidate
+
+    winner = result = None
+    while True:
+        now = time.monotonic() - began
+        idle = not futures
+        for candidate in candidates:
+            if candidate.name not in started and (candidate.delay <= now or idle):
+                start(candidate)
+                idle = False
+        if not futures or now >= budget:
+            break
+
+        timeout = max(0.0, min(_next_start(candidates, started, now, budget), budget - now))
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            candidate = futures.pop(future)
+            try:
+                answer = future.result()
+            except Exception as e:
+                logger.error(f"Hedged source {candidate.name} failed: {str(e)}")
+                answer = None
+            if answer is not None and winner is None:
+                winner, result = candidate.name, answer
+                timings[candidate.name]['status'] = 'won'
+            else:
+                timings[candidate.name]['status'] = 'failed' if answer is None else 'lost'
+        if winner is not None:
+            break
+
+    for candidate in futures.values():
+        if candidate.cancellation is not None:
+            candidate.cancellation.cancel()
+            timings[candidate.name]['status'] = 'cancelled'
+        else:
+            timings[candidate.name]['status'] = 'abandoned'
+    # Losing threads keep writing their own timings; hand back a snapshot
+    return winner, result, {name: dict(timing) for name, timing in timings.items()}
+
+
+async def race_async(candidates, budget):
+    """Asyncio counterpart of race(); losing candidates are cancelled outright"""
+    if len({c.name for c in candidates}) != len(candidates):
+        raise ValueError('Race candidates need distinct names')
+    began = time.monotonic()
+    tasks = {}
+    timings = {c.name: {'status': 'not_started'} for c in candidates}
+    started = set()
+
+    def start(candidate):
+        started.add(candidate.name)
+        timings[candidate.name] = {'status': 'pending', 'started': round(time.monotonic() - began, 3)}
+
+        async def run():
+            t = time.monotonic()
+            try:
+                return await candidate.func()
+            finally:
+                timings[candidate.name]['elapsed'] = round(time.monotonic() - t, 3)
+
+        tasks[asyncio.ensure_future(run())] = candidate
+
+    winner = result = None
+    while True:
+        now = time.monotonic() - began
+        idle = not tasks
+        for candidate in candidates:
+            if candidate.name not in started and (candidate.delay <= now or idle):
+                start(candidate)
+                idle = False
+        if not tasks or now >= budget:
+            break
+
+        timeout = max(0.0, min(_next_start(candidates, started, now, budget), budget - now))
+        done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            candidate = tasks.pop(task)
+            try:
+                answer = task.result()
+            except Exception as e:
+                logger.error(f"Hedged source {candidate.name} failed: {str(e)}")
+                answer = None
+            if answer is not None and winner is None:
+                winner, result = candidate.name, answer
+                timings[candidate.name]['status'] = 'won'
+            else:
+                timings[candidate.name]['status'] = 'failed' if answer is None else 'lost'
+        if winner is not None:
+            break
+
+    for task, candidate in tasks.items():
+        task.cancel()
+        timings[candidate.name]['status'] = 'cancelled'
+    return winner, result, timings
@@ -0,0 +1,388 @@
+"""Offline dictionary served from a memory-mapped index file.
+
+Build the index once from a lexicon dump, then point the server at it:
+
+    python offline_dictionary.py websters.json
+    python offline_dictionary.py kaikki-english.jsonl --output /data/dictionary.idx
+
+Supported dumps:
+- a JSON object of word to definition text, like the public-domain
+  Webster's 1913 JSON dumps
+- JSON lines from Wiktextract (kaikki.org), one part of speech per line;
+  inflected forms and "form of" senses become aliases of their lemma
+- a JSON list or JSON lines of entries in the dictionaryapi.dev shape
+"""
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from definition_cache import normalize_word
+
+logger = logging.getLogger(__name__)
+
+# Index file built by this module's importer; lookups are skipped while it doesn't exist
+OFFLINE_DICTIONARY_PATH = os.environ.get(
+    'OFFLINE_DICTIONARY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_dictionary.idx')
+)
+# "fallback" answers before the Dictionary API, "first" before the LLM, "off" never
+OFFLINE_DICTIONARY_MODE = os.environ.get('OFFLINE_DICTIONARY_MODE', 'fallback')
+
+MAGIC = b'MGDICT01'
+# magic, entries, blocks, block index offset and length, zlib dictionary offset and length
+HEADER = struct.Struct('<8sIIQQQQ')
+PAGE_SIZE = 4096
+# Keys longer than this (in UTF-8 bytes) are not indexed
+MAX_KEY_BYTES = 255
+# Per block entry after the key: record offset and compressed length
+RECORD_REF = struct.Struct('<II')
+# Definitions kept per part of speech
+MAX_DEFINITIONS = 5
+# Wiktextract "forms" that aren't words
+SKIPPED_FORM_TAGS = frozenset(('romanization', 'table-tags', 'inflection-template'))
+# Bytes of sample records the shared zlib dictionary is built from
+ZDICT_SIZE = 32 * 1024
+
+# Common irregular forms the suffix rules can't undo
+IRREGULAR = {
+    'am': 'be', 'are': 'be', 'is': 'be', 'was': 'be', 'were': 'be', 'been': 'be',
+    'has': 'have', 'had': 'have', 'does': 'do', 'did': 'do', 'done': 'do',
+    'went': 'go', 'gone': 'go', 'ran': 'run', 'came': 'come', 'saw': 'see', 'seen': 'see',
+    'took': 'take', 'taken': 'take', 'gave': 'give', 'given': 'give', 'made': 'make',
+    'said': 'say', 'knew': 'know', 'known': 'know', 'thought': 'think', 'brought': 'bring',
+    'bought': 'buy', 'caught': 'catch', 'taught': 'teach', 'found': 'find', 'told': 'tell',
+    'felt': 'feel', 'kept': 'keep', 'left': 'leave', 'meant': 'mean', 'began': 'begin',
+    'begun': 'begin', 'wrote': 'write', 'written': 'write', 'spoke': 'speak', 'spoken': 'speak',
+    'ate': 'eat', 'eaten': 'eat', 'drove': 'drive', 'driven': 'drive', 'chose': 'choose',
+    'chosen': 'choose', 'broke': 'break', 'broken': 'break', 'flew': 'fly', 'flown': 'fly',
+    'grew': 'grow', 'grown': 'grow', 'threw': 'throw', 'thrown': 'throw', 'fell': 'fall',
+    'fallen': 'fall', 'held': 'hold', 'stood': 'stand', 'understood': 'understand',
+    'children': 'child', 'men': 'man', 'women': 'woman', 'people': 'person', 'feet': 'foot',
+    'teeth': 'tooth', 'mice': 'mouse', 'geese': 'goose', 'oxen': 'ox', 'lives': 'life',
+    'better': 'good', 'best': 'good', 'worse': 'bad', 'worst': 'bad',
+}
+# Inflection suffixes and what replaces them, tried in order
+SUFFIX_RULES = (
+    ('ies', 'y'), ('ied', 'y'), ('iest', 'y'), ('ier', 'y'), ('ves', 'f'), ('ves', 'fe'),
+    ('sses', 'ss'), ('xes', 'x'), ('ches', 'ch'), ('shes', 'sh'), ('es', 'e'), ('s', ''),
+    ('ing', ''), ('ing', 'e'), ('ed', ''), ('ed', 'e'), ('est', ''), ('est', 'e'),
+    ('er', ''), ('er', 'e'), ('ly', ''),
+)
+
+
+def lemma_candidates(word):
+    """Possible base forms of an inflected word, most likely first"""
+    if word in IRREGULAR:
+        yield IRREGULAR[word]
+    for suffix, replacement in SUFFIX_RULES:
+        if not word.endswith(suffix) or len(word) - len(suffix) < 2:
+            continue
+        stem = word[:-len(suffix)]
+        yield stem + replacement
+        # running -> run, stopped -> stop
+        if not replacement and len(stem) > 2 and stem[-1] == stem[-2] and stem[-1] not in 'aeiouls':
+            yield stem[:-1]
+
+
+class OfflineDictionary:
+    """Read-only word lookups against a memory-mapped index.
+
+    The file holds page-aligned blocks of sorted keys, each key pointing
+    at a zlib-compressed JSON entry in the dictionaryapi.dev shape. Only
+    the first key of every block is kept in memory, so finding a word
+    touches one block page and then its entry, usually on the next page.
+    """
+
+    def __init__(self, path=OFFLINE_DICTIONARY_PATH):
+        self.path = path
+        self._mmap = None
+        self._first_keys = []
+        self._block_offsets = []
+        self._zdict = b''
+        self._entries = 0
+        self._lock = threading.Lock()
+        self._counters = {'lookups': 0, 'hits': 0, 'lemma_hits': 0, 'misses': 0}
+        self._open()
+
+    def _open(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, entries, blocks, index_offset, index_length, zdict_offset, zdict_length = \
+                HEADER.unpack_from(data, 0)
+            if magic != MAGIC:
+                raise ValueError(f'{self.path} is not an offline dictionary index')
+            first_keys, block_offsets = [], []
+            position = index_offset
+            for _ in range(blocks):
+                length = data[position]
+                first_keys.append(bytes(data[position + 1:position + 1 + length]))
+                block_offsets.append(struct.unpack_from('<Q', data, position + 1 + length)[0])
+                position += 9 + length
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable offline dictionary: {str(e)}")
+            return
+        self._mmap = data
+        self._first_keys = first_keys
+        self._block_offsets = block_offsets
+        self._zdict = bytes(data[zdict_offset:zdict_offset + zdict_length])
+        self._entries = entries
+        logger.info(f"Loaded offline dictionary with {entries} keys from {self.path}")
+
+    @property
+    def available(self):
+        return self._mmap is not None
+
+    def _find(self, key):
+        """Raw compressed entry for an exact key, or None"""
+        key = key.encode('utf-8')
+        block = bisect.bisect_right(self._first_keys, key) - 1
+        if block < 0:
+            return None
+        data = self._mmap
+        start = self._block_offsets[block]
+        count, = struct.unpack_from('<H', data, start)
+        # Binary search the block's table of item offsets
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            position = start + struct.unpack_from('<H', data, start + 2 + 2 * middle)[0]
+            length = data[position]
+            candidate = data[position + 1:position + 1 + length]
+            if candidate == key:
+                offset, size = RECORD_REF.unpack_from(data, position + 1 + length)
+                return data[offset:offset + size]
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _decode(self, record):
+        decompressor = zlib.decompressobj(zdict=self._zdict) if self._zdict else zlib.decompressobj()
+        return json.loads(decompressor.decompress(record))
+
+    def lookup(self, word):
+        """Entry for a word or its base form, or None if neither is indexed"""
+        if not self.available:
+            return None
+        word = normalize_word(word)
+        record = self._find(word)
+        lemma_hit = False
+        if record is None:
+            for candidate in lemma_candidates(word):
+                record = self._find(candidate)
+                if record is not None:
+                    lemma_hit = True
+                    break
+        with self._lock:
+            self._counters['lookups'] += 1
+            if record is None:
+                self._counters['misses'] += 1
+            else:
+                self._counters['lemma_hits' if lemma_hit else 'hits'] += 1
+        return self._decode(record) if record is not None else None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['available'] = self.available
+        stats['path'] = self.path
+        stats['keys'] = self._entries
+        stats['size'] = len(self._mmap) if self.available else 0
+        return stats
+
+
+def build_index(entries, aliases, path):
+    """Write an index for ``entries`` (key to entry dict) and ``aliases`` (form to key).
+
+    Aliases share their lemma's record; a form that is also a headword
+    keeps its own entry.
+    """
+    keys = sorted(key for key in entries if len(key.encode('utf-8')) <= MAX_KEY_BYTES)
+    serialized = {key: json.dumps(entries[key], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                  for key in keys}
+
+    # zlib favours matches near the end of its dictionary, so spread samples across the alphabet
+    step = max(1, len(keys) // 400)
+    zdict = b''.join(serialized[key] for key in keys[::step])[-ZDICT_SIZE:]
+
+    references = {}
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b'\0' * PAGE_SIZE)
+        records = bytearray()
+        for key in keys:
+            compressor = zlib.compressobj(9, zdict=zdict)
+            compressed = compressor.compress(serialized[key]) + compressor.flush()
+            references[key] = (len(records), len(compressed))
+            records += compressed
+        for form, lemma in aliases.items():
+            if form not in references and lemma in references and len(form.encode('utf-8')) <= MAX_KEY_BYTES:
+                references[form] = references[lemma]
+
+        # Blocks come after the records, so record offsets are known up front
+        records_offset = PAGE_SIZE
+        f.write(records)
+        block_start = -(-(records_offset + len(records)) // PAGE_SIZE) * PAGE_SIZE
+        f.write(b'\0' * (block_start - records_offset - len(records)))
+
+        index = bytearray()
+        blocks = 0
+        items = []
+
+        def flush():
+            nonlocal blocks
+            # Block layout: item count, each item's offset in the block, then the items
+            offsets, position = [], 2 + 2 * len(items)
+            for item in items:
+                offsets.append(position)
+                position += len(item)
+            block = struct.pack(f'<H{len(items)}H', len(items), *offsets) + b''.join(items)
+            first = items[0][1:1 + items[0][0]]
+            index.extend(bytes([len(first)]) + first + struct.pack('<Q', f.tell()))
+            f.write(block + b'\0' * (PAGE_SIZE - len(block)))
+            blocks += 1
+            items.clear()
+
+        used = 2
+        for key in sorted(references, key=lambda key: key.encode('utf-8')):
+            encoded = key.encode('utf-8')
+            offset, size = references[key]
+            item = bytes([len(encoded)]) + encoded + RECORD_REF.pack(records_offset + offset, size)
+            if items and used + 2 + len(item) > PAGE_SIZE:
+                flush()
+                used = 2
+            items.append(item)
+            used += 2 + len(item)
+        if items:
+            flush()
+
+        index_offset = f.tell()
+        f.write(index)
+        zdict_offset = f.tell()
+        f.write(zdict)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(references), blocks, index_offset, len(index), zdict_offset, len(zdict)))
+    os.replace(tmp, path)
+    return len(keys), len(references) - len(keys)
+
+
+class LexiconImporter:
+    """Collect entries in the dictionaryapi.dev shape from lexicon dumps"""
+
+    def __init__(self):
+        self.entries = {}
+        self.aliases = {}
+
+    def _meaning(self, key, word, part_of_speech):
+        entry = self.entries.setdefault(key, {'word': word, 'meanings': []})
+        for meaning in entry['meanings']:
+            if meaning['partOfSpeech'] == part_of_speech:
+                return entry, meaning
+        meaning = {'partOfSpeech': part_of_speech, 'definitions': []}
+        entry['meanings'].append(meaning)
+        return entry, meaning
+
+    def add(self, word, part_of_speech, definition, example=None):
+        key = normalize_word(word)
+        if not key or not definition:
+            return
+        _, meaning = self._meaning(key, word, part_of_speech or 'definition')
+        if len(meaning['definitions']) < MAX_DEFINITIONS:
+            item = {'definition': ' '.join(definition.split())}
+            if example:
+                item['example'] = ' '.join(example.split())
+            meaning['definitions'].append(item)
+
+    def add_alias(self, form, lemma):
+        form, lemma = normalize_word(form), normalize_word(lemma)
+        if form and lemma and form != lemma:
+            self.aliases.setdefault(form, lemma)
+
+    def add_webster(self, dump):
+        """Word to definition text, one sense per line"""
+        for word, text in dump.items():
+            senses = text if isinstance(text, list) else str(text).split('\n')
+            for sense in senses:
+                self.add(word, None, sense)
+
+    def add_dictionaryapi(self, entry):
+        for meaning in entry.get('meanings', []):
+            for definition in meaning.get('definitions', []):
+                self.add(entry['word'], meaning.get('partOfSpeech'), definition.get('definition'),
+                         definition.get('example'))
+        key = normalize_word(entry['word'])
+        if entry.get('phonetic') and key in self.entries:
+            self.entries[key].setdefault('phonetic', entry['phonetic'])
+
+    def add_wiktextract(self, line):
+        if line.get('lang_code', 'en') != 'en':
+            return
+        word = line['word']
+        for sense in line.get('senses', []):
+            if sense.get('form_of'):
+                self.add_alias(word, sense['form_of'][0]['word'])
+                continue
+            glosses = sense.get('glosses')
+            if glosses:
+                examples = sense.get('examples') or [{}]
+                self.add(word, line.get('pos'), glosses[-1], examples[0].get('text'))
+        for form in line.get('forms', []):
+            # Table headers and templates are listed as forms too
+            if 'form' in form and not SKIPPED_FORM_TAGS & set(form.get('tags', [])):
+                self.add_alias(form['form'], word)
+        key = normalize_word(word)
+        for sound in line.get('sounds', []):
+            if 'ipa' in sound and key in self.entries:
+                self.entries[key].setdefault('phonetic', sound['ipa'])
+                break
+
+    def add_file(self, path):
+        if path.endswith('.jsonl'):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        if 'senses' in item:
+                            self.add_wiktextract(item)
+                        elif 'meanings' in item:
+                            self.add_dictionaryapi(item)
+            return
+        with open(path, encoding='utf-8') as f:
+            dump = json.load(f)
+        if isinstance(dump, list):
+            for entry in dump:
+                self.add_dictionaryapi(entry)
+        else:
+            self.add_webster(dump)
+
+
+# Create a global instance
+offline_dictionary = OfflineDictionary() if OFFLINE_DICTIONARY_MODE != 'off' else None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Build the offline dictionary index from lexicon dumps')
+    parser.add_argument('dumps', nargs='+', help='.json or .jsonl lexicon dumps')
+    parser.add_argument('--output', default=OFFLINE_DICTIONARY_PATH, help='index file to write')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    importer = LexiconImporter()
+    for dump in args.dumps:
+        logger.info(f"Reading {dump}")
+        importer.add_file(dump)
+    words, aliases = build_index(importer.entries, importer.aliases, args.output)
+    logger.info(f"Wrote {words} words and {aliases} inflected forms to {args.output} "
+                f"({os.path.getsize(args.output) / 2**20:.1f} MiB) in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,247 @@
+import abc
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import google.ai.generativelanguage as glm
+import httpx
+import requests
+from google.api_core.client_options import ClientOptions
+from openai import OpenAI
+
+from backend_common.circuit_breaker import CircuitOpen
+from backend_common.metrics import record_ollama_stats
+from backend_common.ollama_pool import OllamaHostError
+from backend_common.upstream_client import CONNECT_TIMEOUT, READ_TIMEOUT, Interrupt, upstream
+from hedging import SourceCancelled
+
+logger = logging.getLogger(__name__)
+
+# Seconds an unused client is kept before it is closed
+PROVIDER_IDLE_TTL = float(os.environ.get('PROVIDER_IDLE_TTL', '600'))
+# Clients kept at most; the least recently used idle ones are closed first
+PROVIDER_MAX_CLIENTS = int(os.environ.get('PROVIDER_MAX_CLIENTS', '64'))
+
+
+def fingerprint(api_key):
+    """Short stable identifier of an API key that is safe to log"""
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+class Provider(abc.ABC):
+    """A configured client for one provider, API key and model.
+
+    Instances are built once by the registry and shared by concurrent
+    requests, so ``generate`` must be thread-safe.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def generate(self, prompt, meta=None):
+        """Return the model's answer to ``prompt``, or None if there is none.
+
+        Providers that report timing add it to the ``meta`` dict if given.
+        """
+
+    def close(self):
+        pass
+
+
+class OllamaProvider(Provider):
+    name = 'ollama'
+
+    def __init__(self, pool, model, warmer):
+        self.pool = pool
+        self.model = model
+        self.warmer = warmer
+
+    def generate(self, prompt, meta=None, on_cancel=None):
+        """``on_cancel``, if given, is called with a function aborting the request.
+
+        An aborted request raises SourceCancelled and doesn't count against the host.
+        """
+        try:
+            payload = {
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False
+            }
+            keep_alive = self.warmer.keep_alive_for(self.model)
+            if keep_alive is not None:
+                payload["keep_alive"] = keep_alive
+            interrupt = Interrupt()
+            if on_cancel is not None:
+                on_cancel(interrupt)
+            started = time.perf_counter()
+            with self.pool.lease(self.model) as host:
+                try:
+                    response = upstream.post(f'{host.url}/api/generate', json=payload, interrupt=interrupt)
+                except requests.RequestException:
+                    if interrupt.fired:
+                        raise SourceCancelled('Ollama request cancelled') from None
+                    raise
+                if response.status_code >= 500:
+                    raise OllamaHostError(f'Ollama at {host.url} answered {response.status_code}')
+            if response.ok:
+                body = response.json()
+                record_ollama_stats(self.model, body)
+                timing = self.warmer.usage.record(self.model, body, time.perf_counter() - started)
+                if meta is not None:
+                    meta['timing'] = timing
+                return body['response']
+            logger.error(f"Ollama API error for model {self.model}")
+            return None
+        except (CircuitOpen, SourceCancelled):
+            raise
+        except Exception as e:
+            logger.error(f"Error querying Ollama: {str(e)}")
+            return None
+
+
+class OpenAIProvider(Provider):
+    name = 'openai'
+
+    def __init__(self, api_key, model):
+        self.model = model
+        # An explicit httpx client keeps the pool and timeouts under our control
+        self.client = OpenAI(api_key=api_key, http_client=httpx.Client(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)))
+
+    def generate(self, prompt, meta=None):
+        try:
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}]
+            )
+            return completion.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Error with OpenAI API: {str(e)}")
+            return None
+
+    def close(self):
+        self.client.close()
+
+
+class GeminiProvider(Provider):
+    name = 'gemini'
+
+    GENERATION_CONFIG = glm.GenerationConfig(temperature=0.7, top_p=0.8, top_k=40)
+
+    def __init__(self, api_key, model):
+        self.model = model if model.startswith('models/') else f'models/{model}'
+        # A client per key instead of genai.configure(), which is process-wide
+        self.client = glm.GenerativeServiceClient(client_options=ClientOptions(api_key=api_key))
+
+    def generate(self, prompt, meta=None):
+        try:
+            response = self.client.generate_content(glm.GenerateContentRequest(
+                model=self.model,
+                contents=[glm.Content(role='user', parts=[glm.Part(text=prompt)])],
+                generation_config=self.GENERATION_CONFIG
+            ))
+            if not response.candidates:
+                logger.error(f"Gemini returned no candidates for model {self.model}")
+                return None
+            return ''.join(part.text for part in response.candidates[0].content.parts)
+        except Exception as e:
+            logger.error(f"Error with Gemini API: {str(e)}")
+            return None
+
+    def close(self):
+        self.client.transport.close()
+
+
+class _Entry:
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.leases = 0
+
+
+class ProviderRegistry:
+    """Cache of provider clients keyed by (provider, API key fingerprint, model).
+
+    Clients are built on first use and shared afterwards. Ones left unused
+    for ``idle_ttl`` seconds, or beyond ``max_clients``, are closed once no
+    request holds them.
+    """
+
+    def __init__(self, factories, idle_ttl=PROVIDER_IDLE_TTL, max_clients=PROVIDER_MAX_CLIENTS):
+        self.factories = factories
+        self.idle_ttl = idle_ttl
+        self.max_clients = max_clients
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._counters = {'built': 0, 'reused': 0, 'evicted': 0}
+
+    @contextmanager
+    def lease(self, provider, model, api_key=None):
+        """Yield the shared client for this provider, key and model"""
+        if provider not in self.factories:
+            raise ValueError(f"Unknown provider: {provider}")
+        key = (provider, fingerprint(api_key), model)
+        entry = self._acquire(key)
+        if entry is None:
+            client = self.factories[provider](api_key, model)
+            entry = self._acquire(key, client)
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+
+    def _acquire(self, key, client=None):
+        stale = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._counters['reused'] += 1
+                if client is not None:
+                    # Another request built the same client first
+                    stale.append(client)
+            elif client is not None:
+                entry = self._entries[key] = _Entry(client)
+                self._counters['built'] += 1
+                logger.info(f"Created {key[0]} client for model {key[2]} (key {key[1]})")
+            if entry is not None:
+                entry.leases += 1
+                entry.last_used = time.monotonic()
+                stale.extend(self._evict())
+        for old in stale:
+            old.close()
+        return entry
+
+    def _evict(self):
+        """Drop idle and excess clients; caller holds the lock and closes them"""
+        now = time.monotonic()
+        if now - self._last_sweep < self.idle_ttl / 2 and len(self._entries) <= self.max_clients:
+            return []
+        self._last_sweep = now
+        idle = sorted(((entry.last_used, key) for key, entry in self._entries.items() if entry.leases == 0),
+                      key=lambda item: item[0])
+        excess = len(self._entries) - self.max_clients
+        evicted = []
+        for last_used, key in idle:
+            if now - last_used < self.idle_ttl and excess <= 0:
+                break
+            evicted.append(self._entries.pop(key).client)
+            excess -= 1
+        self._counters['evicted'] += len(evicted)
+        return evicted
+
+    def stats(self):
+        """Report client counts per provider and reuse counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['clients'] = {}
+            for provider, _, _ in self._entries:
+                stats['clients'][provider] = stats['clients'].get(provider, 0) + 1
+            return stats
@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# app starts host health checks and model warm-up on import; the tests have no Ollama
+os.environ.setdefault('OLLAMA_HEALTH_INTERVAL', '0')
+os.environ.setdefault('OLLAMA_WARM_INTERVAL', '0')
+
+import app as meaning_app
+from backend_common.circuit_breaker import BreakerRegistry
+from backend_common.tiered_cache import LRUCache, TieredCache
+from providers import Provider, ProviderRegistry
+
+ANSWER = "# {word}\n\n*noun*\n\nA stub definition of {word}, long enough to be accepted."
+
+
+class DictionaryStub:
+    """dictionaryapi.dev stand-in; words in ``slow`` answer once ``release`` is set"""
+
+    def __init__(self):
+        self.known = {'apple', 'river', 'stone', 'cloud', 'lamp', 'bread', 'slow'}
+        self.slow = {'slow'}
+        self.release = threading.Event()
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                word = self.path.rsplit('/', 1)[-1]
+                stub.requests.append(word)
+                if word in stub.slow:
+                    stub.release.wait(5)
+                if word in stub.known:
+                    status, payload = 200, [{
+                        'word': word,
+                        'meanings': [{'partOfSpeech': 'noun', 'definitions': [
+                            {'definition': f'Dictionary definition of {word}.'}]}]
+                    }]
+                else:
+                    status, payload = 404, {'title': 'No Definitions Found'}
+                body = json.dumps(payload).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    # The client gave up on this request
+                    pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/v2/entries/en'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubProviders:
+    """Answers for the stub provider by word; None means no usable answer"""
+
+    def __init__(self):
+        self.answers = {}
+        self.delays = {}
+        self.calls = []
+        self.built = 0
+
+
+class StubProvider(Provider):
+    name = 'openai'
+
+    def __init__(self, script):
+        self.script = script
+        script.built += 1
+
+    def generate(self, prompt, meta=None):
+        word = re.search(r"Define the word '(.+?)'", prompt).group(1)
+        self.script.calls.append(word)
+        time.sleep(self.script.delays.get(word, 0))
+        return self.script.answers.get(word, ANSWER.format(word=word))
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def dictionary_api():
+    stub = DictionaryStub()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def providers():
+    return StubProviders()
+
+
+@pytest.fixture
+def backend(monkeypatch, dictionary_api, providers):
+    """The Flask app module with its upstreams stubbed and its caches, breakers and clients fresh"""
+    monkeypatch.setattr(meaning_app, 'definition_cache', TieredCache(LRUCache(max_entries=256)))
+    monkeypatch.setattr(meaning_app, 'breakers', BreakerRegistry())
+    monkeypatch.setattr(meaning_app, 'DICTIONARY_API_URL', dictionary_api.url)
+    monkeypatch.setattr(meaning_app, 'provider_registry',
+                        ProviderRegistry({'openai': lambda api_key, model: StubProvider(providers)}))
+    monkeypatch.setattr(meaning_app, 'offline_dictionary', None)
+    monkeypatch.setattr(meaning_app, 'OFFLINE_DICTIONARY_MODE', 'fallback')
+    return meaning_app
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import asgi_app
+
+
+@pytest.fixture
+def backends(backend, monkeypatch):
+    """The Flask and Quart apps, sharing the stubbed upstreams"""
+    monkeypatch.setattr(asgi_app, 'definition_cache', backend.definition_cache)
+    monkeypatch.setattr(asgi_app, 'breakers', backend.breakers)
+    monkeypatch.setattr(asgi_app, 'DICTIONARY_API_URL', backend.DICTIONARY_API_URL)
+    monkeypatch.setattr(asgi_app, 'OFFLINE_DICTIONARY_MODE', 'fallback')
+    monkeypatch.setattr(asgi_app, 'http', None)
+    return backend.app.test_client(), asgi_app.app.test_client()
+
+
+def quart_call(client, method, path, **kwargs):
+    async def call():
+        asgi_app.http = httpx.AsyncClient()
+        try:
+            response = await getattr(client, method)(path, **kwargs)
+            return response.status_code, await response.get_data(as_text=True)
+        finally:
+            await asgi_app.http.aclose()
+    return asyncio.run(call())
+
+
+def both(clients, method, path, **kwargs):
+    """Status and JSON body from each backend"""
+    flask, quart = clients
+    response = getattr(flask, method)(path, **kwargs)
+    status, text = quart_call(quart, method, path, **kwargs)
+    return (response.status_code, response.get_json()), (status, json.loads(text))
+
+
+@pytest.mark.parametrize('path', [
+    '/api/meaning/apple?provider=openai&api_key=key&cache=0',
+    '/api/meaning/apple?provider=openai&cache=0',
+    '/api/meaning/zzzz?provider=openai&cache=0',
+    '/api/meaning/apple?budget=soon',
+    '/api/meaning/apple?budget=1&hedge_after=-1',
+    '/api/meaning/apple?provider=openai&api_key=key&budget=1&hedge=openai',
+])
+def test_lookups_answer_the_same_in_both_modes(backends, path):
+    flask, quart = both(backends, 'get', path)
+    assert flask == quart
+
+
+def test_provider_failure_falls_back_to_the_dictionary_in_both_modes(backends, providers):
+    providers.answers['river'] = None
+    flask, quart = both(backends, 'get', '/api/meaning/river?provider=openai&api_key=key&cache=0')
+    assert flask == quart
+    status, body = flask
+    assert status == 200
+    assert body['meanings'][0]['definitions'][0]['definition'] == 'Dictionary definition of river.'
+    assert providers.calls == ['river', 'river']
+
+
+def test_definitions_are_cached_in_both_modes(backends, providers):
+    flask, quart = backends
+    first = flask.get('/api/meaning/stone?provider=openai&api_key=key').get_json()
+    status, text = quart_call(quart, 'get', '/api/meaning/stone?provider=openai&api_key=key')
+    second = json.loads(text)
+    assert first['cache'] == {'status': 'miss'}
+    assert second['cache'] == {'status': 'hit', 'tier': 'memory'}
+    assert providers.calls == ['stone']
+
+
+def test_hedged_lookups_pick_the_same_winner_in_both_modes(backends, providers):
+    providers.delays['cloud'] = 0.5
+    flask, quart = both(backends, 'get',
+                        '/api/meaning/cloud?provider=openai&api_key=key&cache=0&budget=2&hedge_after=0.05')
+    for status, body in (flask, quart):
+        assert status == 200
+        assert body['race']['winner'] == 'dictionary'
+        assert body['meanings'][0]['definitions'][0]['definition'] == 'Dictionary definition of cloud.'
+    assert {k: v for k, v in flask[1].items() if k != 'race'} == {k: v for k, v in quart[1].items() if k != 'race'}
+
+
+def test_batches_stream_the_same_lines_in_both_modes(backends, providers):
+    providers.answers['river'] = None
+    payload = {'words': ['Apple', 'apple', 'river', 'zzzz'], 'provider': 'openai', 'api_key': 'key', 'cache': False}
+    flask, quart = backends
+    flask_lines = flask.post('/api/meanings', json=payload).get_data(as_text=True).splitlines()
+    status, text = quart_call(quart, 'post', '/api/meanings', json=payload)
+    assert status == 200
+
+    def comparable(lines):
+        parsed = [json.loads(line) for line in lines]
+        for line in parsed:
+            line.pop('elapsed', None)
+        return sorted(parsed[:-1], key=lambda line: line['word']), parsed[-1]
+
+    assert comparable(flask_lines) == comparable(text.splitlines())
+
+
+def test_batches_reject_a_non_boolean_cache_in_both_modes(backends):
+    flask, quart = both(backends, 'post', '/api/meanings', json={'words': ['apple'], 'cache': 'false'})
+    assert flask == quart
+    assert flask[0] == 400
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import wait_for
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+def test_batch_streams_one_line_per_unique_word(client):
+    response = client.post('/api/meanings', json={
+        'words': ['Apple', 'apple.', 'river', 'zzzz', 42],
+        'provider': 'openai', 'api_key': 'key'
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = ndjson(response)
+
+    done = lines.pop()
+    assert done == {'done': True, 'words': 3, 'ok': 3, 'not_found': 0, 'shed': 0,
+                    'unavailable': 0, 'error': 0, 'timeout': 0}
+    by_word = {line['word']: line for line in lines}
+    assert set(by_word) == {'apple', 'river', 'zzzz'}
+    assert by_word['apple']['requested'] == ['Apple', 'apple.']
+    assert all(line['status'] == 200 for line in lines)
+
+
+def test_batch_falls_back_to_the_dictionary_per_word(client, providers):
+    providers.answers['river'] = None
+    lines = ndjson(client.post('/api/meanings', json={
+        'words': ['apple', 'river'], 'provider': 'openai', 'api_key': 'key'}))
+
+    by_word = {line['word']: line for line in lines[:-1]}
+    assert by_word['apple']['result']['meanings'][0]['partOfSpeech'] == 'definition'
+    assert by_word['river']['result']['meanings'][0]['definitions'][0]['definition'] == \
+        'Dictionary definition of river.'
+
+
+def test_batch_keeps_at_most_batch_in_flight_words_running(backend, client, monkeypatch):
+    monkeypatch.setattr(backend, 'BATCH_IN_FLIGHT', 2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def lookup(word, *args):
+        with lock:
+            running.append(word)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(word)
+        return {'word': word}, 200
+
+    monkeypatch.setattr(backend, 'lookup_meaning', lookup)
+    lines = ndjson(client.post('/api/meanings', json={'words': [f'w{i}' for i in range(8)]}))
+    assert lines[-1]['ok'] == 8
+    assert max(peak) <= 2
+
+
+def test_overdue_words_are_reported_as_timeouts(backend, client, monkeypatch):
+    release = threading.Event()
+
+    def lookup(word, *args):
+        if word == 'slow':
+            release.wait(2)
+        return {'word': word}, 200
+
+    monkeypatch.setattr(backend, 'lookup_meaning', lookup)
+    try:
+        lines = ndjson(client.post('/api/meanings', json={'words': ['slow', 'fast'], 'timeout': 0.2}))
+    finally:
+        release.set()
+    by_word = {line['word']: line for line in lines[:-1]}
+    assert by_word['fast']['status'] == 200
+    assert by_word['slow']['status'] == 504
+    assert by_word['slow']['result']['error'] == 'Timeout'
+    assert (lines[-1]['ok'], lines[-1]['timeout']) == (1, 1)
+
+
+def test_closing_the_stream_drops_words_no_worker_started(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'BATCH_IN_FLIGHT', 2)
+    release = threading.Event()
+    started = []
+
+    def lookup(word, *args):
+        started.append(word)
+        if word != 'w0':
+            release.wait(2)
+        return {'word': word}, 200
+
+    monkeypatch.setattr(backend, 'lookup_meaning', lookup)
+    response = backend.app.test_client().post(
+        '/api/meanings', json={'words': [f'w{i}' for i in range(6)]}, buffered=False)
+    first = json.loads(next(response.response))
+    assert first['word'] == 'w0'
+    response.close()
+    release.set()
+
+    wait_for(lambda: len(started) >= 2)
+    time.sleep(0.1)
+    # w0 finished and w1 and w2 took its place; the rest never started
+    assert set(started) <= {'w0', 'w1', 'w2'}
+
+
+@pytest.mark.parametrize('payload, message', [
+    ({}, "Expected a non-empty 'words' list"),
+    ({'words': []}, "Expected a non-empty 'words' list"),
+    ({'words': 'apple'}, "Expected a non-empty 'words' list"),
+    ({'words': ['apple'], 'timeout': 0}, "'timeout' must be a positive number of seconds"),
+    ({'words': ['apple'], 'timeout': 'soon'}, "'timeout' must be a positive number of seconds"),
+    ({'words': ['apple'], 'cache': 'false'}, "'cache' must be true or false"),
+    ({'words': ['apple'], 'cache': 0}, "'cache' must be true or false"),
+])
+def test_invalid_batches_are_rejected(client, payload, message):
+    response = client.post('/api/meanings', json=payload)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid request', 'message': message}
+
+
+def test_oversized_batches_are_rejected(backend, client, monkeypatch):
+    monkeypatch.setattr(backend, 'BATCH_MAX_WORDS', 3)
+    response = client.post('/api/meanings', json={'words': ['a', 'b', 'c', 'd']})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'At most 3 words per batch'
+
+
+def test_batches_can_bypass_the_cache(client, providers):
+    payload = {'words': ['apple'], 'provider': 'openai', 'api_key': 'key'}
+    client.post('/api/meanings', json=payload)
+    line = ndjson(client.post('/api/meanings', json={**payload, 'cache': False}))[0]
+    assert line['result']['cache'] == {'status': 'miss'}
+    assert providers.calls == ['apple', 'apple']
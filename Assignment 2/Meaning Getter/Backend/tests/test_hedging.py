@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import wait_for
+from hedging import Cancellation, Candidate, HedgeThreads, SourceCancelled, race, race_async
+
+
+def answer(value, after=0.0, release=None):
+    def func():
+        if release is not None:
+            release.wait(after)
+        else:
+            time.sleep(after)
+        return value
+    return func
+
+
+def test_first_acceptable_answer_wins():
+    winner, result, timings = race([
+        Candidate('primary', answer('slow', 0.3)),
+        Candidate('hedge', answer('fast'), delay=0.05),
+    ], 2, HedgeThreads(4))
+    assert (winner, result) == ('hedge', 'fast')
+    assert timings['hedge']['status'] == 'won'
+    assert timings['primary']['status'] == 'abandoned'
+    assert timings['hedge']['started'] >= 0.05
+
+
+def test_hedge_waits_for_its_delay_while_the_primary_runs():
+    winner, _, timings = race([
+        Candidate('primary', answer('quick', 0.02)),
+        Candidate('hedge', answer('never'), delay=1),
+    ], 2, HedgeThreads(4))
+    assert winner == 'primary'
+    assert timings['hedge'] == {'status': 'not_started'}
+
+
+def test_hedge_starts_at_once_when_the_primary_fails():
+    def broken():
+        raise RuntimeError('provider down')
+
+    began = time.monotonic()
+    winner, _, timings = race([
+        Candidate('primary', broken),
+        Candidate('hedge', answer('fallback'), delay=1),
+    ], 2, HedgeThreads(4))
+    assert winner == 'hedge'
+    assert timings['primary']['status'] == 'failed'
+    assert time.monotonic() - began < 0.5
+
+
+def test_losers_with_a_cancellation_are_cancelled():
+    release = threading.Event()
+    cancellation = Cancellation()
+    cancellation.on_cancel(release.set)
+    winner, _, timings = race([
+        Candidate('primary', answer('late', 5, release), cancellation=cancellation),
+        Candidate('hedge', answer('fast'), delay=0.02),
+    ], 2, HedgeThreads(4))
+    assert winner == 'hedge'
+    assert timings['primary']['status'] == 'cancelled'
+    assert cancellation.cancelled and release.is_set()
+
+
+def test_nothing_within_the_budget_returns_no_winner():
+    release = threading.Event()
+    try:
+        winner, result, timings = race([Candidate('primary', answer('late', 5, release))], 0.1, HedgeThreads(4))
+    finally:
+        release.set()
+    assert (winner, result) == (None, None)
+    assert timings['primary']['status'] == 'abandoned'
+
+
+def test_candidate_names_must_differ():
+    with pytest.raises(ValueError):
+        race([Candidate('a', answer(1)), Candidate('a', answer(2))], 1, HedgeThreads(4))
+
+
+def test_hedges_are_skipped_rather_than_queued_when_threads_are_busy():
+    threads = HedgeThreads(1)
+    release = threading.Event()
+    busy = threads.submit(answer('busy', 5, release))
+    try:
+        winner, _, timings = race([
+            Candidate('primary', answer('primary', 0.05)),
+            Candidate('hedge', answer('hedge')),
+        ], 2, threads)
+    finally:
+        release.set()
+    # The primary is required and still starts; the hedge is skipped
+    assert winner == 'primary'
+    assert timings['hedge'] == {'status': 'skipped'}
+    assert busy.result(1) == 'busy'
+    assert threads.stats()['skipped'] == 1
+
+
+def test_cancellation_runs_callbacks_registered_after_cancel():
+    cancellation = Cancellation()
+    cancellation.cancel()
+    called = []
+    cancellation.on_cancel(lambda: called.append(1))
+    assert called == [1]
+
+
+def test_race_async_cancels_losing_tasks():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append('primary')
+            raise
+
+    async def fast():
+        return 'fast'
+
+    async def main():
+        result = await race_async([Candidate('primary', slow), Candidate('hedge', fast, delay=0.02)], 2)
+        await asyncio.sleep(0)
+        return result
+
+    winner, result, timings = asyncio.run(main())
+    assert (winner, result) == ('hedge', 'fast')
+    assert timings['primary']['status'] == 'cancelled'
+    assert cancelled == ['primary']
+
+
+def test_race_async_starts_the_hedge_when_the_primary_has_nothing():
+    async def nothing():
+        return None
+
+    async def fallback():
+        return 'fallback'
+
+    winner, _, timings = asyncio.run(race_async(
+        [Candidate('primary', nothing), Candidate('hedge', fallback, delay=1)], 2))
+    assert winner == 'hedge'
+    assert timings['primary']['status'] == 'failed'
+
+
+def test_losing_dictionary_call_is_aborted(backend, dictionary_api, providers):
+    providers.delays['slow'] = 0.1
+    host = dictionary_api.url.split('/api')[0]
+    body, status = backend.race_meaning('slow', provider='openai', api_key='key', use_cache=False,
+                                        budget=2, hedge_after=0)
+    assert status == 200
+    assert body['race']['winner'] == 'openai'
+    assert body['race']['sources']['dictionary']['status'] == 'cancelled'
+    # The request was interrupted, not left waiting on the server's answer
+    wait_for(lambda: backend.upstream.stats()[host]['in_flight'] == 0, timeout=1)
+    assert not dictionary_api.release.is_set()
+    # An aborted call isn't the Dictionary API's fault
+    assert backend.breakers.get('dictionary').stats()['state'] == 'closed'
+
+
+def test_cancelled_dictionary_call_raises_source_cancelled(backend, dictionary_api):
+    cancellation = Cancellation()
+    outcome = []
+
+    def lookup():
+        try:
+            backend.dictionary_definition('slow', cancellation.on_cancel)
+        except SourceCancelled:
+            outcome.append('cancelled')
+
+    thread = threading.Thread(target=lookup)
+    thread.start()
+    wait_for(lambda: dictionary_api.requests == ['slow'])
+    cancellation.cancel()
+    thread.join(1)
+    assert outcome == ['cancelled']
@@ -0,0 +1,121 @@
+import pytest
+
+from offline_dictionary import LexiconImporter, OfflineDictionary, build_index
+
+
+@pytest.fixture(scope='module')
+def index_path(tmp_path_factory):
+    importer = LexiconImporter()
+    importer.add_webster({
+        'Apple': 'The fleshy fruit of a rosaceous tree.\nAny of various similar fruits.',
+        'go': 'To move from one place to another.',
+    })
+    importer.add_dictionaryapi({
+        'word': 'run', 'phonetic': '/rʌn/',
+        'meanings': [{'partOfSpeech': 'verb', 'definitions': [
+            {'definition': 'To move swiftly on foot.', 'example': 'She runs every morning.'}]}]
+    })
+    importer.add_wiktextract({
+        'word': 'sing', 'lang_code': 'en', 'pos': 'verb',
+        'senses': [{'glosses': ['To produce musical sounds with the voice.']}],
+        'forms': [{'form': 'sang', 'tags': ['past']}, {'form': 'sing-', 'tags': ['table-tags']}],
+        'sounds': [{'ipa': '/sɪŋ/'}]
+    })
+    importer.add_wiktextract({
+        'word': 'sung', 'lang_code': 'en', 'pos': 'verb',
+        'senses': [{'form_of': [{'word': 'sing'}], 'glosses': ['past participle of sing']}]
+    })
+    importer.add_wiktextract({'word': 'Wort', 'lang_code': 'de', 'senses': [{'glosses': ['word']}]})
+    # Enough headwords to fill several index blocks
+    importer.add_webster({f'filler{i:05d}': f'Filler entry number {i}.' for i in range(3000)})
+    path = tmp_path_factory.mktemp('offline') / 'dictionary.idx'
+    words, aliases = build_index(importer.entries, importer.aliases, str(path))
+    assert (words, aliases) == (3004, 2)
+    return str(path)
+
+
+def test_headwords_are_found(index_path):
+    dictionary = OfflineDictionary(index_path)
+    entry = dictionary.lookup('run')
+    assert entry == {
+        'word': 'run', 'phonetic': '/rʌn/',
+        'meanings': [{'partOfSpeech': 'verb', 'definitions': [
+            {'definition': 'To move swiftly on foot.', 'example': 'She runs every morning.'}]}]
+    }
+    apple = dictionary.lookup('  Apple! ')
+    assert [d['definition'] for d in apple['meanings'][0]['definitions']] == [
+        'The fleshy fruit of a rosaceous tree.', 'Any of various similar fruits.']
+    assert dictionary.lookup('sing')['phonetic'] == '/sɪŋ/'
+
+
+def test_every_key_is_found_across_blocks(index_path):
+    dictionary = OfflineDictionary(index_path)
+    for i in range(0, 3000, 7):
+        assert dictionary.lookup(f'filler{i:05d}')['meanings'][0]['definitions'][0]['definition'] == \
+            f'Filler entry number {i}.'
+    assert dictionary.lookup('filler99999') is None
+
+
+def test_inflected_forms_find_their_lemma(index_path):
+    dictionary = OfflineDictionary(index_path)
+    # Aliases from the dump
+    assert dictionary.lookup('sang')['word'] == 'sing'
+    assert dictionary.lookup('sung')['word'] == 'sing'
+    # Suffix rules and irregular forms
+    assert dictionary.lookup('running')['word'] == 'run'
+    assert dictionary.lookup('apples')['word'] == 'Apple'
+    assert dictionary.lookup('went')['word'] == 'go'
+    assert dictionary.lookup('sing-') is None
+    assert dictionary.lookup('wort') is None
+
+    stats = dictionary.stats()
+    assert (stats['lookups'], stats['hits'], stats['lemma_hits'], stats['misses']) == (7, 2, 3, 2)
+    assert stats['available'] and stats['keys'] == 3006
+
+
+def test_missing_or_unreadable_files_are_skipped(tmp_path):
+    assert not OfflineDictionary(str(tmp_path / 'missing.idx')).available
+    garbage = tmp_path / 'garbage.idx'
+    garbage.write_bytes(b'not an index' * 100)
+    dictionary = OfflineDictionary(str(garbage))
+    assert not dictionary.available
+    assert dictionary.lookup('run') is None
+
+
+@pytest.fixture
+def offline(backend, monkeypatch, index_path):
+    monkeypatch.setattr(backend, 'offline_dictionary', OfflineDictionary(index_path))
+    return backend
+
+
+def test_first_mode_answers_before_the_provider(offline, monkeypatch, providers):
+    monkeypatch.setattr(offline, 'OFFLINE_DICTIONARY_MODE', 'first')
+    body, status = offline.lookup_meaning('running', provider='openai', api_key='key')
+    assert status == 200
+    assert (body['word'], body['source']) == ('run', 'offline')
+    body, status = offline.race_meaning('sang', provider='openai', api_key='key', budget=1)
+    assert (status, body['source']) == (200, 'offline')
+    assert providers.calls == []
+
+
+def test_first_mode_asks_the_provider_for_unknown_words(offline, monkeypatch, providers):
+    monkeypatch.setattr(offline, 'OFFLINE_DICTIONARY_MODE', 'first')
+    body, status = offline.lookup_meaning('river', provider='openai', api_key='key')
+    assert status == 200
+    assert 'source' not in body
+    assert providers.calls == ['river']
+
+
+def test_fallback_mode_answers_before_the_dictionary_api(offline, providers, dictionary_api):
+    body, status = offline.lookup_meaning('run', provider='openai', api_key='key')
+    assert status == 200 and 'source' not in body
+    providers.answers['go'] = None
+    body, status = offline.lookup_meaning('go', provider='openai', api_key='key')
+    assert (status, body['source']) == (200, 'offline')
+    assert providers.calls == ['run', 'go']
+    assert dictionary_api.requests == []
+
+    providers.answers['river'] = None
+    body, status = offline.lookup_meaning('river', provider='openai', api_key='key')
+    assert status == 200 and 'source' not in body
+    assert dictionary_api.requests == ['river']
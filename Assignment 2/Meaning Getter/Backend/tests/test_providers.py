@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+import providers
+from providers import ProviderRegistry
+
+
+class Clock:
+    """Stands in for the time module so tests step time by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class Client:
+    def __init__(self, api_key, model):
+        self.api_key = api_key
+        self.model = model
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(providers, 'time', clock)
+    return clock
+
+
+def registry(**kwargs):
+    options = dict(idle_ttl=60, max_clients=8)
+    options.update(kwargs)
+    return ProviderRegistry({'openai': Client, 'gemini': Client}, **options)
+
+
+def lease(registry, provider='openai', model='m', api_key='key'):
+    with registry.lease(provider, model, api_key) as client:
+        return client
+
+
+def test_clients_are_shared_per_provider_key_and_model(clock):
+    r = registry()
+    first = lease(r)
+    assert lease(r) is first
+    assert lease(r, api_key='other') is not first
+    assert lease(r, model='other') is not first
+    assert lease(r, provider='gemini') is not first
+    stats = r.stats()
+    assert (stats['built'], stats['reused']) == (4, 1)
+    assert stats['clients'] == {'openai': 3, 'gemini': 1}
+
+
+def test_unknown_provider_is_rejected(clock):
+    with pytest.raises(ValueError):
+        lease(registry(), provider='nope')
+
+
+def test_idle_clients_are_closed_after_the_ttl(clock):
+    r = registry()
+    old = lease(r)
+    clock.now += 61
+    lease(r, api_key='other')
+    assert old.closed
+    assert lease(r) is not old
+    assert r.stats()['evicted'] == 1
+
+
+def test_leased_clients_are_never_closed(clock):
+    r = registry()
+    with r.lease('openai', 'm', 'key') as held:
+        clock.now += 61
+        lease(r, api_key='other')
+        assert not held.closed
+    assert lease(r) is held
+
+
+def test_least_recently_used_clients_go_first_past_max_clients(clock):
+    r = registry(max_clients=2)
+    first = lease(r, model='a')
+    clock.now += 1
+    second = lease(r, model='b')
+    clock.now += 1
+    lease(r, model='a')
+    clock.now += 1
+    lease(r, model='c')
+    assert second.closed and not first.closed
+    assert r.stats()['clients'] == {'openai': 2}
+
+
+def test_concurrent_first_leases_keep_one_client(clock):
+    built = []
+    both_building = threading.Barrier(2)
+
+    def factory(api_key, model):
+        client = Client(api_key, model)
+        built.append(client)
+        both_building.wait(1)
+        return client
+
+    r = ProviderRegistry({'openai': factory})
+    leased = []
+    threads = [threading.Thread(target=lambda: leased.append(lease(r))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(built) == 2
+    assert leased[0] is leased[1]
+    # The client built second is closed rather than leaked
+    assert sum(client.closed for client in built) == 1
+
+
+def test_api_keys_are_fingerprinted():
+    assert providers.fingerprint(None) is None
+    assert providers.fingerprint('secret') == providers.fingerprint('secret')
+    assert 'secret' not in providers.fingerprint('secret')
+    assert len(providers.fingerprint('secret')) == 12
+
+
+def test_lookups_share_one_client_per_key(backend, providers):
+    for word in ('apple', 'river'):
+        _, status = backend.lookup_meaning(word, provider='openai', api_key='key', use_cache=False)
+        assert status == 200
+    backend.lookup_meaning('stone', provider='openai', api_key='other', use_cache=False)
+    assert providers.built == 2
+    assert backend.provider_registry.stats()['reused'] == 1
+
+
+class FailingCompletions:
+    def create(self, **kwargs):
+        raise RuntimeError('OpenAI is down')
+
+
+def test_openai_errors_fall_back_to_the_dictionary(backend, monkeypatch):
+    def failing_openai(api_key, model):
+        provider = providers.OpenAIProvider(api_key, model)
+        provider.client.close()
+        monkeypatch.setattr(provider.client.chat, 'completions', FailingCompletions())
+        return provider
+
+    monkeypatch.setattr(backend, 'provider_registry', ProviderRegistry({'openai': failing_openai}))
+    body, status = backend.lookup_meaning('river', provider='openai', api_key='key', use_cache=False)
+    assert status == 200
+    assert body['meanings'][0]['definitions'][0]['definition'] == 'Dictionary definition of river.'
+    # The breaker counts the failure without the request seeing it
+    assert backend.breakers.get(f"openai:{providers.fingerprint('key')}").stats()['failures'] == 1
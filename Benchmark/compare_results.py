@@ -0,0 +1,76 @@
+"""Compare two run_benchmark.py result files.
+
+    python compare_results.py results/before.json results/after.json --threshold 10
+
+Exits with status 1 if any scenario's p95/p99 latency rose, or its
+requests/sec fell, by more than the threshold percentage.
+"""
+import argparse
+import json
+import sys
+
+# (key, label, True if higher is better)
+COLUMNS = [
+    ('rps', 'req/s', True),
+    ('p50', 'p50 ms', False),
+    ('p95', 'p95 ms', False),
+    ('p99', 'p99 ms', False),
+]
+GATED = ('rps', 'p95', 'p99')
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {(r['backend'], r['scenario']): r for r in report['results']}
+
+
+def value(result, key):
+    return result['rps'] if key == 'rps' else result['latency_ms'][key]
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    before_report, before = load(args.before)
+    after_report, after = load(args.after)
+    print(f"before: {before_report['commit']} ({before_report['timestamp']})")
+    print(f"after:  {after_report['commit']} ({after_report['timestamp']})")
+    if before_report['config'].get('concurrency') != after_report['config'].get('concurrency'):
+        print("warning: runs used different concurrency")
+
+    print(f"{'backend':13s} {'scenario':17s} " + ' '.join(f'{label:>18s}' for _, label, _ in COLUMNS))
+    regressions = []
+    for key in sorted(set(before) & set(after)):
+        cells = []
+        for column, label, higher_is_better in COLUMNS:
+            old, new = value(before[key], column), value(after[key], column)
+            delta = change(old, new)
+            cells.append(f"{new:9.1f} ({delta:+6.1f}%)" if delta is not None else f"{new!s:>18s}")
+            worse = delta is not None and (-delta if higher_is_better else delta) > args.threshold
+            if worse and column in GATED:
+                regressions.append(f"{key[0]}/{key[1]} {label} {delta:+.1f}%")
+        print(f"{key[0]:13s} {key[1]:17s} " + ' '.join(f'{cell:>18s}' for cell in cells))
+
+    for key in sorted(set(before) ^ set(after)):
+        print(f"{key[0]}/{key[1]}: only in {'before' if key in before else 'after'}")
+
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""Load-test both backends against local stub upstreams.
+
+Starts the Ollama and dictionary stubs, launches each selected backend
+pointed at them, drives its endpoints at a fixed concurrency and writes
+latency percentiles, throughput and backend memory to a JSON file:
+
+    python run_benchmark.py --backends summarizer meaning --concurrency 16 --requests 200
+
+Compare two result files with compare_results.py.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+import stub_upstreams
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+BACKENDS = {
+    'summarizer': {
+        'cwd': ROOT / 'Assignment 1' / 'Webpage Summarizer' / 'Backend',
+        'command': lambda port: [sys.executable, '-c',
+                                 "import api_server; api_server.mark_ready('benchmark'); "
+                                 f"api_server.server.run(port={port}, threaded=True)"],
+    },
+    'meaning': {
+        'cwd': ROOT / 'Assignment 2' / 'Meaning Getter' / 'Backend',
+        'command': lambda port: [sys.executable, '-c',
+                                 f"import app; app.app.run(port={port}, threaded=True)"],
+    },
+    'meaning-asgi': {
+        'cwd': ROOT / 'Assignment 2' / 'Meaning Getter' / 'Backend',
+        'command': lambda port: [sys.executable, '-m', 'hypercorn', 'asgi_app:app',
+                                 '--bind', f'127.0.0.1:{port}'],
+    },
+}
+
+MODEL = stub_upstreams.MODELS[0]
+
+# name -> function building (method, path, json body) for the i-th request
+SCENARIOS = {
+    'summarizer': {
+        'models': lambda i: ('GET', '/api/models', None),
+        'generate': lambda i: ('POST', '/api/generate', {
+            'model': MODEL, 'prompt': f'Summarize page {i}', 'temperature': 0.7}),
+        'generate-cached': lambda i: ('POST', '/api/generate', {
+            'model': MODEL, 'prompt': 'Summarize the cached page', 'temperature': 0.7}),
+    },
+    'meaning': {
+        'models': lambda i: ('GET', '/api/models', None),
+        'meaning': lambda i: ('GET', f'/api/meaning/word{i}?cache=0', None),
+        'meaning-cached': lambda i: ('GET', '/api/meaning/benchmark', None),
+        'meaning-fallback': lambda i: ('GET', f'/api/meaning/word{i}?provider=openai&cache=0', None),
+    },
+}
+SCENARIOS['meaning-asgi'] = SCENARIOS['meaning']
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # The parent pid follows the parenthesised command name
+                parent = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(entry))
+    return children
+
+
+def rss_bytes(pid):
+    """Resident and peak resident memory of a process and its children, from /proc.
+
+    Worker processes (hypercorn spawns them) are included. Returns
+    ``(None, None)`` where /proc is unavailable.
+    """
+    pending, rss, peak, found = [pid], 0, 0, False
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                fields = dict(line.split(':', 1) for line in status if ':' in line)
+        except OSError:
+            continue
+        found = True
+        rss += int(fields.get('VmRSS', '0 kB').split()[0]) * 1024
+        peak += int(fields.get('VmHWM', '0 kB').split()[0]) * 1024
+        pending.extend(_children(current))
+    return (rss, peak) if found else (None, None)
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD'], cwd=ROOT).returncode != 0
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Backend:
+    """A backend process pointed at the stub upstreams"""
+
+    def __init__(self, name, port, env):
+        self.name = name
+        self.port = port
+        self.base_url = f'http://127.0.0.1:{port}'
+        spec = BACKENDS[name]
+        # The shared package, for checkouts where it isn't installed
+        pythonpath = os.pathsep.join(filter(None, [str(ROOT / 'Common'), os.environ.get('PYTHONPATH')]))
+        self.process = subprocess.Popen(
+            spec['command'](port), cwd=spec['cwd'], env={**os.environ, **env, 'PYTHONPATH': pythonpath},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def wait_ready(self, timeout):
+        started = time.perf_counter()
+        while time.perf_counter() - started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'{self.name} exited with code {self.process.returncode}')
+            try:
+                if requests.get(f'{self.base_url}/api/models', timeout=2).ok:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError(f'{self.name} did not start within {timeout}s')
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_scenario(backend, name, build, total, concurrency, warmup, timeout):
+    """Send ``total`` requests with ``concurrency`` workers and summarize the results"""
+    local = threading.local()
+
+    def send(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, body = build(i)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, backend.base_url + path, json=body, timeout=timeout)
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(-warmup, 0)))
+
+        samples = []
+        stop = threading.Event()
+
+        def sample_memory():
+            while not stop.is_set():
+                samples.append(rss_bytes(backend.process.pid)[0])
+                stop.wait(0.1)
+
+        rss_before = rss_bytes(backend.process.pid)[0]
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        results = list(pool.map(send, range(total)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+
+    rss_after, rss_peak = rss_bytes(backend.process.pid)
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    samples = [value for value in samples if value is not None]
+
+    def ms(seconds):
+        return round(seconds * 1000, 2) if seconds is not None else None
+
+    return {
+        'backend': backend.name,
+        'scenario': name,
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'duration': round(elapsed, 3),
+        'rps': round(total / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'min': ms(latencies[0]),
+            'mean': ms(sum(latencies) / len(latencies)),
+            'p50': ms(percentile(latencies, 0.50)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1]),
+        },
+        'memory_bytes': {
+            'rss_before': rss_before,
+            'rss_after': rss_after,
+            'rss_max_sampled': max(samples) if samples else None,
+            'rss_peak': rss_peak,
+        },
+    }
+
+
+def print_row(result):
+    latency = result['latency_ms']
+    rss = result['memory_bytes']['rss_after']
+    print(f"{result['backend']:13s} {result['scenario']:17s} {result['rps']:9.1f} "
+          f"{latency['p50']:9.1f} {latency['p95']:9.1f} {latency['p99']:9.1f} "
+          f"{result['errors']:6d} {rss / 2**20 if rss else float('nan'):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['summarizer', 'meaning'], choices=sorted(BACKENDS))
+    parser.add_argument('--scenarios', nargs='+', help='scenario names to run (default: all)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per scenario')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='stub seconds between tokens')
+    parser.add_argument('--dictionary-delay', type=float, default=0.01, help='stub seconds per lookup')
+    parser.add_argument('--port', type=int, default=18050, help='port for the backend under test')
+    parser.add_argument('--ollama-port', type=int, default=11500)
+    parser.add_argument('--dictionary-port', type=int, default=11501)
+    parser.add_argument('--output', help='result file (default: results/<time>-<commit>.json)')
+    args = parser.parse_args()
+
+    stub_upstreams.start(args.ollama_port, stub_upstreams.ollama_handler(args.token_delay))
+    stub_upstreams.start(args.dictionary_port, stub_upstreams.dictionary_handler(args.dictionary_delay))
+    env = {
+        'OLLAMA_URL': f'http://127.0.0.1:{args.ollama_port}',
+        'DICTIONARY_API_URL': f'http://127.0.0.1:{args.dictionary_port}/api/v2/entries/en',
+        # Memory-only caches so runs don't depend on earlier ones
+        'RESPONSE_CACHE_PATH': '',
+        'DEFINITION_CACHE_PATH': '',
+        'MODEL_USAGE_PATH': '',
+    }
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': vars(args),
+        'startup_seconds': {},
+        'results': [],
+    }
+
+    print(f"{'backend':13s} {'scenario':17s} {'req/s':>9s} {'p50 ms':>9s} {'p95 ms':>9s} "
+          f"{'p99 ms':>9s} {'errors':>6s} {'RSS MiB':>8s}")
+    for name in args.backends:
+        backend = Backend(name, args.port, env)
+        try:
+            report['startup_seconds'][name] = round(backend.wait_ready(60), 3)
+            for scenario, build in SCENARIOS[name].items():
+                if args.scenarios and scenario not in args.scenarios:
+                    continue
+                result = run_scenario(backend, scenario, build, args.requests,
+                                      args.concurrency, args.warmup, args.timeout)
+                report['results'].append(result)
+                print_row(result)
+        finally:
+            backend.stop()
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + '\n')
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
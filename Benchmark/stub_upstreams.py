@@ -0,0 +1,179 @@
+"""Local stand-ins for Ollama and dictionaryapi.dev.
+
+Run directly to serve both for manual testing:
+
+    python stub_upstreams.py --ollama-port 11500 --dictionary-port 11501 --token-delay 0.02
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODELS = ['mistral:latest', 'llama3:latest']
+TOKENS = ['# Summary\n\n', 'The ', 'page ', 'describes ', 'a ', '**stub** ', 'response', '.\n\n',
+          '- first ', 'point\n', '- second ', 'point\n']
+
+
+class StubServer(ThreadingHTTPServer):
+    # Load tests open many connections at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def ollama_handler(token_delay, tokens=TOKENS):
+    """Handler imitating Ollama's tags, ps, embeddings and generate APIs"""
+
+    class OllamaHandler(_Handler):
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self.send_json({'models': [
+                    {'name': name, 'model': name, 'size': 4_000_000_000, 'details': {'family': name.split(':')[0]}}
+                    for name in MODELS
+                ]})
+            elif self.path == '/api/ps':
+                self.send_json({'models': [{'name': MODELS[0], 'model': MODELS[0], 'size': 4_000_000_000}]})
+            else:
+                self.send_json({'error': 'not found'}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if self.path in ('/api/embeddings', '/api/embed'):
+                text = request.get('prompt') or request.get('input') or ''
+                digest = hashlib.sha256(str(text).encode('utf-8')).digest()
+                vector = [byte / 255 for byte in digest]
+                self.send_json({'embedding': vector} if self.path == '/api/embeddings'
+                               else {'embeddings': [vector]})
+            elif self.path == '/api/generate':
+                self.generate(request)
+            else:
+                self.send_json({'error': 'not found'}, 404)
+
+        def generate(self, request):
+            model = request.get('model', MODELS[0])
+            if model not in MODELS:
+                self.send_json({'error': f"model '{model}' not found"}, 404)
+                return
+            started = time.perf_counter_ns()
+            stats = {
+                'load_duration': 1_000_000,
+                'prompt_eval_count': len(str(request.get('prompt', '')).split()),
+                'prompt_eval_duration': 2_000_000,
+                'eval_count': len(tokens),
+            }
+
+            if request.get('stream') is False:
+                time.sleep(token_delay * len(tokens))
+                elapsed = time.perf_counter_ns() - started
+                self.send_json({'model': model, 'created_at': _now(), 'response': ''.join(tokens),
+                                'done': True, 'done_reason': 'stop', 'total_duration': elapsed,
+                                'eval_duration': elapsed, **stats})
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in tokens:
+                time.sleep(token_delay)
+                self.write_chunk({'model': model, 'created_at': _now(), 'response': token, 'done': False})
+            elapsed = time.perf_counter_ns() - started
+            self.write_chunk({'model': model, 'created_at': _now(), 'response': '', 'done': True,
+                              'done_reason': 'stop', 'total_duration': elapsed,
+                              'eval_duration': elapsed, **stats})
+            self.wfile.write(b'0\r\n\r\n')
+
+        def write_chunk(self, payload):
+            line = (json.dumps(payload) + '\n').encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.flush()
+
+    return OllamaHandler
+
+
+def dictionary_handler(delay):
+    """Handler imitating dictionaryapi.dev; words starting with 'zzz' are not found"""
+
+    class DictionaryHandler(_Handler):
+        def do_GET(self):
+            time.sleep(delay)
+            word = self.path.rstrip('/').rsplit('/', 1)[-1]
+            if word.startswith('zzz'):
+                self.send_json({
+                    'title': 'No Definitions Found',
+                    'message': "Sorry pal, we couldn't find definitions for the word you were looking for.",
+                    'resolution': 'You can try the search again at later time or head to the web instead.'
+                }, 404)
+                return
+            self.send_json([{
+                'word': word,
+                'phonetic': f'/{word}/',
+                'phonetics': [{'text': f'/{word}/', 'audio': ''}],
+                'meanings': [{
+                    'partOfSpeech': 'noun',
+                    'definitions': [{
+                        'definition': f'A stub definition of {word}.',
+                        'example': f'This sentence uses {word}.',
+                        'synonyms': [],
+                        'antonyms': []
+                    }],
+                    'synonyms': [],
+                    'antonyms': []
+                }],
+                'license': {'name': 'CC BY-SA 3.0', 'url': 'https://creativecommons.org/licenses/by-sa/3.0'},
+                'sourceUrls': [f'https://en.wiktionary.org/wiki/{word}']
+            }])
+
+    return DictionaryHandler
+
+
+def start(port, handler):
+    """Serve ``handler`` on 127.0.0.1:port from a daemon thread"""
+    server = StubServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ollama-port', type=int, default=11500)
+    parser.add_argument('--dictionary-port', type=int, default=11501)
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds between streamed tokens')
+    parser.add_argument('--dictionary-delay', type=float, default=0.01, help='seconds per dictionary lookup')
+    args = parser.parse_args()
+
+    start(args.ollama_port, ollama_handler(args.token_delay))
+    start(args.dictionary_port, dictionary_handler(args.dictionary_delay))
+    print(f"Ollama stub on http://127.0.0.1:{args.ollama_port}")
+    print(f"Dictionary stub on http://127.0.0.1:{args.dictionary_port}/api/v2/entries/en")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+"""Infrastructure shared by the Webpage Summarizer and Meaning Getter backends.
+
+Pooled upstream sessions, Ollama host routing, circuit breakers, admission
+control, model catalog and warm-up, tiered caches, metrics and tracing.
+"""
@@ -0,0 +1,297 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Generations each Ollama model runs at once; the rest wait in a queue
+OLLAMA_MODEL_CONCURRENCY = int(os.environ.get('OLLAMA_MODEL_CONCURRENCY', '2'))
+# Per-model overrides, e.g. "mistral:latest=1,llama3:latest=4"
+OLLAMA_MODEL_LIMITS = os.environ.get('OLLAMA_MODEL_LIMITS', '')
+# Requests allowed to wait per model before new ones are shed
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', '32'))
+# Seconds a request may wait for a slot before it is shed
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', '30'))
+
+# Lower classes are admitted first
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+admission_wait = registry.histogram(
+    'admission_wait_seconds', 'Time spent waiting for an Ollama slot', ('model', 'priority'))
+admission_rejected = registry.counter(
+    'admission_rejected_total', 'Requests shed instead of waiting for an Ollama slot',
+    ('model', 'priority', 'reason'))
+
+
+def parse_limits(spec):
+    """Parse "model=limit,..." into a dict"""
+    limits = {}
+    for item in spec.split(','):
+        if '=' in item:
+            model, limit = item.rsplit('=', 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; ``retry_after`` is a hint in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionCancelled(Exception):
+    """Raised when a queued request is cancelled before it gets a slot"""
+
+
+class _ThreadWaiter(threading.Event):
+    """Queued thread, woken when ``release`` hands it a slot or ``abort`` gives up on it"""
+
+    def __init__(self):
+        super().__init__()
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        self.set()
+        return True
+
+    def abort(self):
+        self.set()
+
+
+class _AsyncWaiter:
+    """Queued coroutine, woken on its event loop when ``release`` hands it a slot"""
+
+    __slots__ = ('loop', 'future', 'granted')
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def grant(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The loop is closed; nobody is left to take the slot
+            return False
+        self.granted = True
+        return True
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _ModelState:
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.queue = []
+        # Moving average of how long a slot is held
+        self.service_time = None
+
+
+class AdmissionController:
+    """Per-model concurrency limits with a bounded priority wait queue.
+
+    A request runs at once if its model has a free slot. Otherwise it
+    waits in the model's queue, where interactive requests go ahead of
+    bulk ones. A request is shed with ``AdmissionRejected`` instead of
+    queued when the queue is full or the expected wait already exceeds
+    ``max_wait``, and when it does wait ``max_wait`` without a slot.
+    """
+
+    def __init__(self, limit=OLLAMA_MODEL_CONCURRENCY, limits=None, max_queue=ADMISSION_QUEUE_SIZE,
+                 max_wait=ADMISSION_MAX_WAIT):
+        self.limit = limit
+        self.limits = limits or {}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._models = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._counters = {'admitted': 0, 'queued': 0, 'rejected': 0, 'timed_out': 0, 'cancelled': 0}
+        self._wait_total = 0.0
+
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState(self.limits.get(model, self.limit))
+        return state
+
+    def _expected_wait(self, state, ahead):
+        if state.service_time is None:
+            return None
+        return (ahead // state.limit + 1) * state.service_time
+
+    def _reject(self, model, priority, reason, message, retry_after):
+        self._counters['rejected'] += 1
+        admission_rejected.inc(model, PRIORITY_NAMES[priority], reason)
+        logger.warning(f"Shedding {PRIORITY_NAMES[priority]} request for {model}: {message}")
+        return AdmissionRejected(message, max(1, math.ceil(retry_after)))
+
+    def _enqueue(self, model, priority, waiter):
+        """Take a free slot and return None, or queue ``waiter`` and return its entry"""
+        with self._lock:
+            state = self._state(model)
+            if state.running < state.limit and not state.queue:
+                state.running += 1
+                self._counters['admitted'] += 1
+                admission_wait.observe(0.0, model, PRIORITY_NAMES[priority])
+                return None
+
+            ahead = sum(1 for entry in state.queue if entry[0] <= priority)
+            expected = self._expected_wait(state, ahead)
+            if len(state.queue) >= self.max_queue:
+                raise self._reject(model, priority, 'queue_full', 'Too many requests queued for this model',
+                                   expected or self.max_wait)
+            if expected is not None and expected > self.max_wait:
+                raise self._reject(model, priority, 'deadline',
+                                   f'Expected wait of {expected:.1f}s exceeds {self.max_wait}s', expected)
+
+            entry = [priority, next(self._sequence), waiter]
+            heapq.heappush(state.queue, entry)
+            self._counters['queued'] += 1
+            return entry
+
+    def _abandon(self, model, entry):
+        """Take a waiter that stopped waiting out of the queue; False if it was granted meanwhile"""
+        with self._lock:
+            if entry[2].granted:
+                return False
+            state = self._models[model]
+            state.queue.remove(entry)
+            heapq.heapify(state.queue)
+            return True
+
+    def _timed_out(self, model, priority):
+        with self._lock:
+            state = self._models[model]
+            self._counters['timed_out'] += 1
+            return self._reject(model, priority, 'timeout', f'No slot free within {self.max_wait}s',
+                                self._expected_wait(state, len(state.queue)) or self.max_wait)
+
+    def _admitted(self, model, priority, started):
+        waited = time.monotonic() - started
+        with self._lock:
+            self._counters['admitted'] += 1
+            self._wait_total += waited
+        admission_wait.observe(waited, model, PRIORITY_NAMES[priority])
+
+    def acquire(self, model, priority=INTERACTIVE, on_cancel=None):
+        """Block until a slot for ``model`` is free, or raise AdmissionRejected.
+
+        ``on_cancel``, if given, is called with a function that stops the
+        wait; the caller then leaves the queue with AdmissionCancelled.
+        """
+        started = time.monotonic()
+        entry = self._enqueue(model, priority, _ThreadWaiter())
+        if entry is None:
+            return
+        waiter = entry[2]
+        if on_cancel is not None:
+            on_cancel(waiter.abort)
+        # A slot may have been handed over while the wait timed out or was aborted
+        if not waiter.wait(self.max_wait) and self._abandon(model, entry):
+            raise self._timed_out(model, priority)
+        if not waiter.granted and self._abandon(model, entry):
+            with self._lock:
+                self._counters['cancelled'] += 1
+            raise AdmissionCancelled('Cancelled while waiting for a slot')
+        self._admitted(model, priority, started)
+
+    async def async_acquire(self, model, priority=INTERACTIVE):
+        """Wait on the event loop for a slot for ``model``, or raise AdmissionRejected.
+
+        Queued coroutines wait in the same queue as threads, on a future that
+        ``release`` resolves, so they hold no thread while they wait.
+        """
+        started = time.monotonic()
+        entry = self._enqueue(model, priority, _AsyncWaiter(asyncio.get_running_loop()))
+        if entry is None:
+            return
+        waiter = entry[2]
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            if self._abandon(model, entry):
+                raise self._timed_out(model, priority)
+        except asyncio.CancelledError:
+            if not self._abandon(model, entry):
+                # Granted as the caller gave up; pass the slot on
+                self.release(model)
+            raise
+        self._admitted(model, priority, started)
+
+    def release(self, model, service_time=None):
+        """Free a slot, handing it straight to the next queued request if any"""
+        with self._lock:
+            state = self._models[model]
+            if service_time is not None:
+                state.service_time = (service_time if state.service_time is None
+                                      else 0.8 * state.service_time + 0.2 * service_time)
+            while state.queue:
+                if heapq.heappop(state.queue)[2].grant():
+                    return
+            state.running -= 1
+
+    @contextmanager
+    def slot(self, model, priority=INTERACTIVE, on_cancel=None):
+        """Hold a slot for ``model`` for the duration of the block"""
+        self.acquire(model, priority, on_cancel)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(model, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def async_slot(self, model, priority=INTERACTIVE):
+        """Async counterpart of ``slot``"""
+        await self.async_acquire(model, priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(model, time.monotonic() - started)
+
+    def stats(self):
+        """Report admission counters, mean wait and per-model queues"""
+        with self._lock:
+            stats = dict(self._counters)
+            waited = stats['queued'] - stats['timed_out'] - stats['cancelled']
+            stats['mean_wait'] = round(self._wait_total / waited, 4) if waited > 0 else None
+            stats['max_queue'] = self.max_queue
+            stats['max_wait'] = self.max_wait
+            stats['models'] = {
+                model: {
+                    'limit': state.limit,
+                    'running': state.running,
+                    'queued': len(state.queue),
+                    'service_time': round(state.service_time, 3) if state.service_time is not None else None
+                }
+                for model, state in self._models.items()
+            }
+            return stats
+
+
+# Create a global instance
+admission = AdmissionController(limits=parse_limits(OLLAMA_MODEL_LIMITS))
+
+registry.collector('admission_queue_depth', 'Requests waiting for an Ollama slot', 'gauge', ('model',),
+                   lambda: {(model,): stats['queued'] for model, stats in admission.stats()['models'].items()})
+registry.collector('admission_running', 'Requests holding an Ollama slot', 'gauge', ('model',),
+                   lambda: {(model,): stats['running'] for model, stats in admission.stats()['models'].items()})
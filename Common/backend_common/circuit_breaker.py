@@ -0,0 +1,246 @@
+import collections
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Seconds of recent calls a breaker judges error and slow-call rates over
+CIRCUIT_WINDOW = float(os.environ.get('CIRCUIT_WINDOW', '30'))
+# Calls needed in the window before a breaker may open
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', '5'))
+# Share of failed calls in the window that opens a breaker
+CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', '0.5'))
+# Calls taking longer than this many seconds count as slow
+CIRCUIT_SLOW_SECONDS = float(os.environ.get('CIRCUIT_SLOW_SECONDS', '60'))
+# Share of slow calls in the window that opens a breaker
+CIRCUIT_SLOW_RATE = float(os.environ.get('CIRCUIT_SLOW_RATE', '0.8'))
+# Seconds an open breaker fails fast before letting a trial call through
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', '15'))
+# Trial calls allowed at once while half-open
+CIRCUIT_HALF_OPEN_CALLS = int(os.environ.get('CIRCUIT_HALF_OPEN_CALLS', '1'))
+
+# Reopening after a failed trial doubles the open time up to this
+MAX_OPEN_SECONDS = 300
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+circuit_transitions = registry.counter(
+    'circuit_breaker_transitions_total', 'Circuit breaker state changes', ('name', 'state'))
+circuit_rejected = registry.counter(
+    'circuit_breaker_rejected_total', 'Calls failed fast by an open circuit breaker', ('name',))
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'Circuit for {name} is open')
+        self.name = name
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _Call:
+    """Handle yielded by ``guard``; set ``failed`` for an answer that is a failure without raising"""
+
+    __slots__ = ('failed',)
+
+    def __init__(self):
+        self.failed = False
+
+
+class CircuitBreaker:
+    """Closed, open and half-open breaker over a sliding window of calls.
+
+    While closed every call goes through. Once the window holds at least
+    ``min_calls`` calls and the share of failures or of slow calls reaches
+    its threshold, the breaker opens and calls fail fast with CircuitOpen.
+    After ``open_seconds`` it turns half-open and lets ``half_open_calls``
+    trial calls through: a success closes it, a failure opens it again for
+    twice as long.
+    """
+
+    def __init__(self, name, window=CIRCUIT_WINDOW, min_calls=CIRCUIT_MIN_CALLS,
+                 error_rate=CIRCUIT_ERROR_RATE, slow_seconds=CIRCUIT_SLOW_SECONDS,
+                 slow_rate=CIRCUIT_SLOW_RATE, open_seconds=CIRCUIT_OPEN_SECONDS,
+                 half_open_calls=CIRCUIT_HALF_OPEN_CALLS):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        # (finished at, failed, slow) of calls in the window
+        self._calls = collections.deque()
+        self._failed = 0
+        self._slow = 0
+        self._opened_at = None
+        self._open_for = open_seconds
+        self._trials = 0
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    def _transition(self, state):
+        self._state = state
+        circuit_transitions.inc(self.name, state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._counters['opened'] += 1
+            logger.warning(f"Circuit for {self.name} opened for {self._open_for:g}s")
+        elif state == CLOSED:
+            self._calls.clear()
+            self._failed = self._slow = 0
+            self._open_for = self.open_seconds
+            logger.info(f"Circuit for {self.name} closed")
+
+    def _current_state(self, now):
+        # An open breaker turns half-open once its open time has passed
+        if self._state == OPEN and now - self._opened_at >= self._open_for:
+            self._transition(HALF_OPEN)
+            self._trials = 0
+        return self._state
+
+    def _retry_after(self, now):
+        if self._state == OPEN:
+            return self._opened_at + self._open_for - now
+        return self._open_for
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def available(self):
+        """True if a call would be let through right now"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == CLOSED or (state == HALF_OPEN and self._trials < self.half_open_calls)
+
+    def retry_after(self):
+        with self._lock:
+            return max(0.0, self._retry_after(time.monotonic()))
+
+    def acquire(self):
+        """Let a call through or raise CircuitOpen; pair with ``release``"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return
+            self._counters['rejected'] += 1
+            retry_after = self._retry_after(now)
+        circuit_rejected.inc(self.name)
+        raise CircuitOpen(self.name, retry_after)
+
+    def release(self, outcome, elapsed=None):
+        """Record how a call let through ended: ``ok``, ``failed`` or ``other``.
+
+        ``other`` (a cancelled call, an error that isn't the dependency's
+        fault) only gives back a half-open trial slot.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == HALF_OPEN:
+                self._trials = max(0, self._trials - 1)
+            if outcome == 'other':
+                return
+            failed = outcome == 'failed'
+            slow = elapsed is not None and elapsed >= self.slow_seconds
+            self._counters['calls'] += 1
+            self._counters['failures'] += failed
+            self._counters['slow_calls'] += slow
+
+            if state == HALF_OPEN:
+                if failed or slow:
+                    self._open_for = min(self._open_for * 2, MAX_OPEN_SECONDS)
+                    self._transition(OPEN)
+                else:
+                    self._transition(CLOSED)
+                return
+            if state == OPEN:
+                # A call let through before the breaker opened
+                return
+
+            self._calls.append((now, failed, slow))
+            self._failed += failed
+            self._slow += slow
+            while self._calls and self._calls[0][0] < now - self.window:
+                _, old_failed, old_slow = self._calls.popleft()
+                self._failed -= old_failed
+                self._slow -= old_slow
+            calls = len(self._calls)
+            if calls >= self.min_calls and (self._failed / calls >= self.error_rate
+                                            or self._slow / calls >= self.slow_rate):
+                self._transition(OPEN)
+
+    @contextmanager
+    def guard(self, errors=(Exception,)):
+        """Run the block through the breaker; ``errors`` raised in it count as failures"""
+        self.acquire()
+        call = _Call()
+        started = time.monotonic()
+        try:
+            yield call
+        except errors:
+            self.release('failed', time.monotonic() - started)
+            raise
+        except BaseException:
+            self.release('other')
+            raise
+        self.release('failed' if call.failed else 'ok', time.monotonic() - started)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            stats = dict(self._counters)
+            calls = len(self._calls)
+            stats['state'] = state
+            stats['window_calls'] = calls
+            stats['error_rate'] = round(self._failed / calls, 3) if calls else None
+            stats['slow_rate'] = round(self._slow / calls, 3) if calls else None
+            stats['retry_after'] = round(self._retry_after(now), 1) if state == OPEN else None
+            return stats
+
+
+class BreakerRegistry:
+    """Breakers by name, created on first use"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+# Create a global instance
+breakers = BreakerRegistry()
+
+registry.collector('circuit_breaker_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', 'gauge',
+                   ('name',), lambda: {(name,): STATE_VALUES[stats['state']]
+                                       for name, stats in breakers.stats().items()})
@@ -0,0 +1,337 @@
+"""Prometheus text-format metrics without external dependencies.
+
+Counters, gauges and histograms keep one value table per thread, so
+recording a sample takes no lock; tables are merged when ``/metrics`` is
+scraped. Values other modules already track (cache and upstream stats)
+are read at scrape time through collectors.
+"""
+import bisect
+import threading
+import time
+
+from flask import g, request
+
+# Latency buckets in seconds, from cache hits up to long generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Generation speed buckets in tokens per second
+RATE_BUCKETS = (1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+# Live per-thread tables allowed before tables of finished threads are folded
+SHARD_SWEEP_AT = 64
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _add_into(total, values):
+    for key, cell in values.items():
+        current = total.get(key)
+        if current is None:
+            total[key] = list(cell)
+        else:
+            for i, value in enumerate(cell):
+                current[i] += value
+
+
+class _Shards:
+    """Per-thread tables of ``labels -> [values]`` merged on demand"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def local(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            with self._lock:
+                if len(self._shards) >= SHARD_SWEEP_AT:
+                    self._sweep()
+                self._shards.append((threading.current_thread(), values))
+            self._local.values = values
+            return values
+
+    def _sweep(self):
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                _add_into(self._retired, values)
+        self._shards = live
+
+    def collect(self):
+        with self._lock:
+            self._sweep()
+            total = {key: list(cell) for key, cell in self._retired.items()}
+            for _, values in self._shards:
+                # dict() copies atomically; a writer may be mid-update on a cell
+                _add_into(total, dict(values))
+        return total
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def add(self, amount, *labels):
+        values = self._shards.local()
+        cell = values.get(labels)
+        if cell is None:
+            cell = values[labels] = [0]
+        cell[0] += amount
+
+    def inc(self, *labels):
+        self.add(1, *labels)
+
+    def samples(self):
+        for labels, cell in sorted(self._shards.collect().items()):
+            yield self.name, _labels(self.labelnames, labels), cell[0]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, such as requests in flight"""
+
+    type = 'gauge'
+
+    def dec(self, *labels):
+        self.add(-1, *labels)
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._shards = _Shards()
+
+    def observe(self, value, *labels):
+        values = self._shards.local()
+        cell = values.get(labels)
+        if cell is None:
+            # One slot per bucket, one for +Inf, then the sum
+            cell = values[labels] = [0] * (len(self.buckets) + 2)
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def samples(self):
+        for labels, cell in sorted(self._shards.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), cell[:-1]):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _labels(self.labelnames, labels, [('le', _number(bound))]), cumulative)
+            yield f'{self.name}_sum', _labels(self.labelnames, labels), cell[-1]
+            yield f'{self.name}_count', _labels(self.labelnames, labels), cumulative
+
+
+class Collector:
+    """Metric whose values are read from ``func()`` at scrape time.
+
+    ``func`` returns a mapping of label value tuples to numbers.
+    """
+
+    def __init__(self, name, help, type, labelnames, func):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.func = func
+
+    def samples(self):
+        for labels, value in sorted(self.func().items()):
+            if value is not None:
+                yield self.name, _labels(self.labelnames, labels), value
+
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; each name may be registered once, as the text format allows one family per name"""
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, name, help, type, labelnames, func):
+        return self.register(Collector(name, help, type, labelnames, func))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Create a global registry and the metrics both backends record
+registry = Registry()
+
+http_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('route', 'method', 'status'))
+http_in_flight = registry.gauge(
+    'http_requests_in_flight', 'HTTP requests being served', ('route',))
+llm_duration = registry.histogram(
+    'llm_request_duration_seconds', 'Latency of calls to a definition or generation provider',
+    ('provider', 'model'))
+llm_errors = registry.counter(
+    'llm_errors_total', 'Provider calls that failed or returned no usable answer',
+    ('provider', 'model'))
+llm_ttft = registry.histogram(
+    'llm_time_to_first_token_seconds', 'Time until the first generated token',
+    ('provider', 'model'))
+llm_tokens_per_second = registry.histogram(
+    'llm_tokens_per_second', 'Generation speed reported by Ollama',
+    ('provider', 'model'), buckets=RATE_BUCKETS)
+llm_tokens = registry.counter(
+    'llm_generated_tokens_total', 'Tokens generated, as reported by Ollama',
+    ('provider', 'model'))
+
+
+def record_ollama_stats(model, body, ttft=None):
+    """Record token counts and speed from an Ollama response's final object.
+
+    Without a measured ``ttft`` the time to first token is taken from
+    Ollama's own load and prompt evaluation durations.
+    """
+    count = body.get('eval_count')
+    duration = body.get('eval_duration')
+    if count and duration:
+        llm_tokens.add(count, 'ollama', model)
+        llm_tokens_per_second.observe(count / (duration / 1e9), 'ollama', model)
+    if ttft is None and 'prompt_eval_duration' in body:
+        ttft = (body.get('load_duration', 0) + body['prompt_eval_duration']) / 1e9
+    if ttft is not None:
+        llm_ttft.observe(ttft, 'ollama', model)
+
+
+# Caches and upstream clients exported so far; each metric family covers all of them
+_caches = {}
+_upstreams = []
+
+
+def _cache_hits():
+    values = {}
+    for name, cache in list(_caches.items()):
+        stats = cache.stats()
+        values[(name, 'memory')] = stats['memory_hits']
+        values[(name, 'disk')] = stats['disk_hits']
+    return values
+
+
+def _cache_values(key):
+    return {(name,): cache.stats()[key] for name, cache in list(_caches.items())}
+
+
+def register_cache(name, cache):
+    """Export hit counters and the hit ratio of a TieredCache under ``cache=name``"""
+    if name in _caches:
+        raise ValueError(f'Cache {name} is already registered')
+    if not _caches:
+        registry.collector('cache_hits_total', 'Cache hits by tier', 'counter', ('cache', 'tier'), _cache_hits)
+        registry.collector('cache_misses_total', 'Cache misses', 'counter', ('cache',),
+                           lambda: _cache_values('misses'))
+        registry.collector('cache_hit_ratio', 'Share of lookups served from the cache', 'gauge', ('cache',),
+                           lambda: _cache_values('hit_ratio'))
+    _caches[name] = cache
+
+
+def _upstream_values(key):
+    # Clients talking to the same host are summed
+    values = {}
+    for client in list(_upstreams):
+        for host, stats in client.stats().items():
+            values[(host,)] = values.get((host,), 0) + stats[key]
+    return values
+
+
+def register_upstream(client):
+    """Export request, retry and error counters of an UpstreamClient per host"""
+    if client in _upstreams:
+        raise ValueError('Upstream client is already registered')
+    if not _upstreams:
+        for key, type, help in (
+            ('requests', 'counter', 'Upstream HTTP requests'),
+            ('retries', 'counter', 'Upstream HTTP retries'),
+            ('errors', 'counter', 'Upstream HTTP requests that failed'),
+            ('in_flight', 'gauge', 'Upstream HTTP requests in flight'),
+        ):
+            name = f'upstream_{key}_total' if type == 'counter' else f'upstream_{key}'
+            registry.collector(name, help, type, ('host',), lambda key=key: _upstream_values(key))
+    _upstreams.append(client)
+
+
+def track_requests(app):
+    """Record latency and in-flight gauges for every request to a Flask app"""
+    @app.before_request
+    def start_timer():
+        g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.metrics_started = time.perf_counter()
+        http_in_flight.inc(g.metrics_route)
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def stop_timer(exc):
+        # Runs after streamed responses finish, so their full duration counts
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        route = g.pop('metrics_route')
+        status = g.pop('metrics_status', 500)
+        http_in_flight.dec(route)
+        http_duration.observe(time.perf_counter() - started, route, request.method, str(status))
@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds a model list is served without revalidation
+MODEL_CACHE_TTL = float(os.environ.get('MODEL_CACHE_TTL', '60'))
+# Seconds past the TTL a stale list may still be served while refreshing
+MODEL_CACHE_MAX_STALE = float(os.environ.get('MODEL_CACHE_MAX_STALE', '600'))
+# Seconds to wait after a failed fetch before blocking on Ollama again
+MODEL_CACHE_RETRY_AFTER = float(os.environ.get('MODEL_CACHE_RETRY_AFTER', '5'))
+
+
+class ModelCatalog:
+    """TTL cache of the model names an Ollama server provides.
+
+    Fresh lists are served from memory. Once the TTL passes the stale list
+    is still returned while a background thread revalidates it, so only the
+    very first lookup (or one after a long outage) waits on the tags call.
+    """
+
+    def __init__(self, fetch, ttl=MODEL_CACHE_TTL, max_stale=MODEL_CACHE_MAX_STALE,
+                 retry_after=MODEL_CACHE_RETRY_AFTER):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.retry_after = retry_after
+        self._models = None
+        self._fetched_at = 0.0
+        self._failed_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+
+    def _age(self):
+        return time.monotonic() - self._fetched_at
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def get(self):
+        """Return the cached model names, fetching or revalidating as needed"""
+        with self._lock:
+            models = self._models
+            age = self._age()
+            failed_at = self._failed_at
+
+        if models is not None and age < self.ttl:
+            self._count('hits')
+            return models
+        if models is not None and age < self.ttl + self.max_stale:
+            self._count('stale_hits')
+            self._refresh_in_background()
+            return models
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_after:
+            return models or []
+
+        self._count('misses')
+        return self.refresh(force=False)['models']
+
+    def peek(self):
+        """Return the cached model names without fetching, or None"""
+        with self._lock:
+            return self._models
+
+    def warm(self):
+        """Start a background fetch if nothing is cached yet"""
+        if self.peek() is None:
+            self._refresh_in_background()
+
+    def refresh(self, force=True):
+        """Fetch the model list now and report the outcome.
+
+        Concurrent callers share one fetch; without ``force`` a caller that
+        waited on another caller's fetch reuses its result.
+        """
+        with self._fetch_lock:
+            if not force:
+                with self._lock:
+                    if self._models is not None and self._age() < self.ttl:
+                        return {'status': 'success', 'models': self._models, 'refreshed': False}
+
+            try:
+                models = list(self._fetch())
+            except Exception as e:
+                logger.error(f"Model catalogue refresh failed: {str(e)}")
+                with self._lock:
+                    self._failed_at = time.monotonic()
+                    self._counters['errors'] += 1
+                    cached = self._models
+                return {
+                    'status': 'error',
+                    'message': str(e),
+                    'models': cached or [],
+                    'stale': cached is not None
+                }
+
+            with self._lock:
+                self._models = models
+                self._fetched_at = time.monotonic()
+                self._failed_at = None
+                self._counters['refreshes'] += 1
+            logger.debug(f"Model catalogue refreshed: {len(models)} models")
+            return {'status': 'success', 'models': models, 'refreshed': True}
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(force=False)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stats(self):
+        """Report cache counters and the age of the cached list"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['cached_models'] = len(self._models) if self._models is not None else 0
+            stats['age'] = round(self._age(), 3) if self._models is not None else None
+            stats['ttl'] = self.ttl
+            return stats
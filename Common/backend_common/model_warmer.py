@@ -0,0 +1,314 @@
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+from .metrics import registry
+from .ollama_pool import OllamaHostError
+from .upstream_client import upstream
+
+logger = logging.getLogger(__name__)
+
+# Models loaded at startup, comma separated, before the most used ones
+OLLAMA_PRELOAD_MODELS = os.environ.get('OLLAMA_PRELOAD_MODELS', '')
+# keep_alive sent for models chosen to stay resident (Ollama's default is 5m)
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+# Seconds between keep-alive rounds; 0 disables warm-up entirely
+OLLAMA_WARM_INTERVAL = float(os.environ.get('OLLAMA_WARM_INTERVAL', '240'))
+# Unload models this process loaded once they drop out of its resident set. Off by
+# default, since other processes sharing the Ollama host may still be using them
+OLLAMA_UNLOAD_DROPPED = os.environ.get('OLLAMA_UNLOAD_DROPPED', '').lower() in ('1', 'true', 'yes')
+# GiB of model weights kept resident at most; 0 means no limit
+OLLAMA_MEMORY_BUDGET_GB = float(os.environ.get('OLLAMA_MEMORY_BUDGET_GB', '0'))
+# Seconds for a request's weight in the usage score to halve
+MODEL_USAGE_HALF_LIFE = float(os.environ.get('MODEL_USAGE_HALF_LIFE', '1800'))
+# JSON file usage scores are saved to, so restarts preload the same models; empty
+# keeps them in memory. Unset, each backend keeps its own file (see usage_path)
+MODEL_USAGE_PATH = os.environ.get('MODEL_USAGE_PATH')
+
+# A load_duration above this marks a response as a cold start
+COLD_LOAD_SECONDS = 0.5
+# Models scoring below this have had too little recent traffic to keep warm
+MIN_SCORE = 0.1
+
+model_load = registry.histogram(
+    'ollama_model_load_seconds', 'Model load time reported by Ollama on cold starts', ('model',))
+cold_starts = registry.counter(
+    'ollama_cold_starts_total', 'Generations that had to load their model first', ('model',))
+
+
+def usage_path(directory):
+    """MODEL_USAGE_PATH if set, else model_usage.json in the calling backend's directory"""
+    if MODEL_USAGE_PATH is not None:
+        return MODEL_USAGE_PATH
+    return os.path.join(directory, 'model_usage.json')
+
+
+class ModelUsage:
+    """Per-model request scores that decay over time, with cold and warm latency.
+
+    Each request adds 1 to its model's score; scores halve every
+    ``half_life`` seconds, so they track recent traffic.
+    """
+
+    def __init__(self, half_life=MODEL_USAGE_HALF_LIFE, path=None):
+        self.half_life = half_life
+        self.path = path
+        self._models = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _entry(self, model):
+        entry = self._models.get(model)
+        if entry is None:
+            entry = self._models[model] = {
+                'score': 0.0, 'updated': time.time(), 'requests': 0, 'last_used': None,
+                'cold': 0, 'cold_seconds': 0.0, 'warm': 0, 'warm_seconds': 0.0
+            }
+        return entry
+
+    def _decayed(self, entry, now):
+        return entry['score'] * math.pow(0.5, (now - entry['updated']) / self.half_life)
+
+    def record(self, model, body, elapsed):
+        """Record a finished Ollama generation and return its timing metadata.
+
+        ``body`` is Ollama's final response object and ``elapsed`` the
+        seconds the call took; the model load time comes from the body.
+        """
+        load = body.get('load_duration', 0) / 1e9
+        cold = load >= COLD_LOAD_SECONDS
+        if cold:
+            model_load.observe(load, model)
+            cold_starts.inc(model)
+        now = time.time()
+        with self._lock:
+            entry = self._entry(model)
+            entry['score'] = self._decayed(entry, now) + 1
+            entry['updated'] = entry['last_used'] = now
+            entry['requests'] += 1
+            kind = 'cold' if cold else 'warm'
+            entry[kind] += 1
+            entry[f'{kind}_seconds'] += elapsed
+        return {
+            'model_state': 'cold' if cold else 'warm',
+            'load': round(load, 3),
+            'generation': round(max(0.0, elapsed - load), 3),
+            'total': round(elapsed, 3)
+        }
+
+    def scores(self):
+        """Current decayed score per model"""
+        now = time.time()
+        with self._lock:
+            return {model: self._decayed(entry, now) for model, entry in self._models.items()}
+
+    def last_used(self, model):
+        with self._lock:
+            entry = self._models.get(model)
+            return entry['last_used'] if entry else None
+
+    def stats(self):
+        """Report requests, score and mean cold and warm latency per model"""
+        now = time.time()
+        with self._lock:
+            return {
+                model: {
+                    'requests': entry['requests'],
+                    'score': round(self._decayed(entry, now), 3),
+                    'cold_starts': entry['cold'],
+                    'cold_latency': round(entry['cold_seconds'] / entry['cold'], 3) if entry['cold'] else None,
+                    'warm_latency': round(entry['warm_seconds'] / entry['warm'], 3) if entry['warm'] else None
+                }
+                for model, entry in self._models.items()
+            }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            for model, entry in saved.items():
+                self._entry(model).update(score=entry['score'], updated=entry['updated'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable model usage file: {str(e)}")
+
+    def save(self):
+        """Persist scores so the next start knows which models are popular"""
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = {model: {'score': entry['score'], 'updated': entry['updated']}
+                        for model, entry in self._models.items()}
+        try:
+            # A temp file of its own, so concurrent saves never replace the file with a torn one
+            tmp = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.path)),
+                                              prefix=f'.{os.path.basename(self.path)}.', suffix='.tmp',
+                                              delete=False)
+            try:
+                with tmp:
+                    json.dump(snapshot, tmp)
+                os.replace(tmp.name, self.path)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        except OSError as e:
+            logger.warning(f"Could not save model usage: {str(e)}")
+
+
+class ModelWarmer:
+    """Keep the configured and most used Ollama models loaded.
+
+    Each round picks the models to keep resident: the configured ones
+    first, then those with recent traffic by usage score, as long as their
+    combined size fits the memory budget. Chosen models idle since the
+    last round get a keep-alive request (which also loads them at startup)
+    and generations for them carry a long ``keep_alive``. Models that drop
+    out of the set are left to expire on Ollama's own timer, because another
+    process sharing the host may be using them; with ``unload_dropped`` the
+    ones this warmer loaded itself are unloaded at once. Keep-alives go to
+    the host the pool would route the model to; unloads go to every host
+    holding it.
+    """
+
+    def __init__(self, pool, usage, preload=OLLAMA_PRELOAD_MODELS, keep_alive=OLLAMA_KEEP_ALIVE,
+                 interval=OLLAMA_WARM_INTERVAL, budget_gb=OLLAMA_MEMORY_BUDGET_GB,
+                 unload_dropped=OLLAMA_UNLOAD_DROPPED):
+        self.pool = pool
+        self.usage = usage
+        self.preload = [model.strip() for model in preload.split(',') if model.strip()]
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.budget = int(budget_gb * 2**30)
+        self.unload_dropped = unload_dropped
+        self._resident = []
+        # Models whose keep-alive found them unloaded, so this process loaded them
+        self._loaded = set()
+        self._last_round = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {'rounds': 0, 'pings': 0, 'unloads': 0, 'errors': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def keep_alive_for(self, model):
+        """keep_alive to send with a generation, or None for Ollama's default"""
+        with self._lock:
+            return self.keep_alive if model in self._resident else None
+
+    def select(self, sizes):
+        """Models to keep resident, in priority order, within the memory budget"""
+        scores = self.usage.scores()
+        popular = sorted((model for model, score in scores.items()
+                          if score >= MIN_SCORE and model not in self.preload),
+                         key=lambda model: -scores[model])
+        chosen, used = [], 0
+        for model in self.preload + popular:
+            if model not in sizes:
+                continue
+            if self.budget and used + sizes[model] > self.budget:
+                continue
+            chosen.append(model)
+            used += sizes[model]
+        return chosen
+
+    def _send(self, host, model, keep_alive):
+        # A generate call without a prompt only loads or unloads the model
+        response = upstream.post(f'{host.url}/api/generate', json={
+            'model': model,
+            'keep_alive': keep_alive,
+            'stream': False
+        })
+        if response.status_code >= 500:
+            raise OllamaHostError(f'Ollama at {host.url} answered {response.status_code}')
+        response.raise_for_status()
+        return response.json()
+
+    def _ping(self, model):
+        """Load or keep ``model`` loaded on the host the pool would route it to"""
+        with self.pool.lease(model) as host:
+            return self._send(host, model, self.keep_alive)
+
+    def _unload(self, model):
+        for host in self.pool.hosts_with(model):
+            self._send(host, model, 0)
+            self.pool.mark_unloaded(host, model)
+
+    def run_round(self):
+        """Choose the resident models, keep them loaded and unload the rest"""
+        try:
+            sizes = self.pool.fetch_models()
+        except Exception as e:
+            logger.warning(f"Model warm-up skipped, Ollama unavailable: {str(e)}")
+            self._count('errors')
+            return
+        chosen = self.select(sizes)
+        with self._lock:
+            dropped = [model for model in self._resident if model not in chosen]
+            self._resident = chosen
+            idle_since = self._last_round
+            self._last_round = time.time()
+            self._counters['rounds'] += 1
+
+        for model in chosen:
+            last_used = self.usage.last_used(model)
+            if idle_since is not None and last_used is not None and last_used > idle_since:
+                # Traffic since the last round already refreshed keep_alive
+                continue
+            try:
+                started = time.perf_counter()
+                body = self._ping(model)
+                self._count('pings')
+                load = body.get('load_duration', 0) / 1e9
+                if load >= COLD_LOAD_SECONDS:
+                    self._loaded.add(model)
+                    model_load.observe(load, model)
+                    logger.info(f"Loaded {model} in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Keep-alive for {model} failed: {str(e)}")
+
+        for model in dropped:
+            if not self.unload_dropped or model not in self._loaded:
+                continue
+            self._loaded.discard(model)
+            try:
+                self._unload(model)
+                self._count('unloads')
+                logger.info(f"Unloaded {model}, no longer among the models kept warm")
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Unloading {model} failed: {str(e)}")
+
+        self.usage.save()
+
+    def _loop(self):
+        while True:
+            self.run_round()
+            time.sleep(self.interval)
+
+    def start(self):
+        """Preload models and start periodic keep-alive rounds in the background"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='model-warmer', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        """Report resident models, budget, round counters and usage"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['resident'] = list(self._resident)
+            stats['last_round'] = self._last_round
+        stats['preload'] = self.preload
+        stats['budget_gb'] = self.budget / 2**30 if self.budget else None
+        stats['keep_alive'] = self.keep_alive
+        stats['unload_dropped'] = self.unload_dropped
+        stats['usage'] = self.usage.stats()
+        return stats
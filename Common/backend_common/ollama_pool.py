@@ -0,0 +1,281 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from .circuit_breaker import CircuitOpen, breakers
+from .metrics import registry
+from .upstream_client import upstream
+
+logger = logging.getLogger(__name__)
+
+# Comma separated Ollama base URLs requests are spread over
+OLLAMA_HOSTS = os.environ.get('OLLAMA_HOSTS', os.environ.get('OLLAMA_URL', 'http://localhost:11434'))
+# Seconds between active health checks of every host; 0 disables them
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get('OLLAMA_HEALTH_INTERVAL', '10'))
+
+# Latency assumed for every host before any request finishes
+DEFAULT_LATENCY = 1.0
+HEALTH_TIMEOUT = (upstream.connect_timeout, 5)
+
+
+class OllamaHostError(Exception):
+    """Raised for a response showing the host itself is failing (5xx)"""
+
+
+# Errors that count against the host a request went to
+HOST_ERRORS = (requests.ConnectionError, requests.Timeout, OllamaHostError)
+
+
+class OllamaHost:
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency = None
+        # Installed models with their sizes (/api/tags) and models in memory (/api/ps)
+        self.models = {}
+        self.loaded = set()
+        self.checked = None
+        # Set while the host fails its health check
+        self.down = False
+        self.breaker = breakers.get(f'ollama:{url}')
+
+    def available(self):
+        return not self.down and self.breaker.available()
+
+    def load(self, default_latency):
+        """Expected wait for a new request: queued work times its typical latency"""
+        return (self.in_flight + 1) * (self.latency if self.latency is not None else default_latency)
+
+
+class Lease:
+    """One request's hold on a host, yielded by ``OllamaPool.lease``.
+
+    Call ``responded()`` when the response headers or first token arrive;
+    the circuit breaker's slow-call rule then judges the request by that
+    latency rather than by how long a healthy stream went on.
+    """
+
+    __slots__ = ('host', 'url', 'started', 'first_response')
+
+    def __init__(self, host):
+        self.host = host
+        self.url = host.url
+        self.started = time.monotonic()
+        self.first_response = None
+
+    def responded(self):
+        if self.first_response is None:
+            self.first_response = time.monotonic() - self.started
+
+
+class OllamaPool:
+    """Route Ollama requests across several hosts.
+
+    Each request goes to the least loaded available host, preferring hosts
+    that have the model in memory, then hosts that have it installed.
+    Every host has its own circuit breaker, fed by the requests sent to
+    it, and is also out of rotation while its health check fails. When no
+    host is available requests fail fast with CircuitOpen.
+    """
+
+    def __init__(self, urls=OLLAMA_HOSTS, health_interval=OLLAMA_HEALTH_INTERVAL):
+        self.hosts = [OllamaHost(url.strip().rstrip('/')) for url in urls.split(',') if url.strip()]
+        self.health_interval = health_interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def urls(self):
+        return [host.url for host in self.hosts]
+
+    def _unavailable(self):
+        """CircuitOpen for when no host can take a request"""
+        waits = [host.breaker.retry_after() for host in self.hosts if not host.down]
+        # Hosts that are down come back with the next health check
+        if len(waits) < len(self.hosts) and self._thread is not None:
+            waits.append(self.health_interval)
+        return CircuitOpen('ollama', min(waits) if waits else self.health_interval)
+
+    def require(self):
+        """Raise CircuitOpen now if no host can take a request"""
+        if not any(host.available() for host in self.hosts):
+            raise self._unavailable()
+
+    def ranked(self, model=None):
+        """Available hosts for ``model``, best first"""
+        with self._lock:
+            candidates = [host for host in self.hosts if host.available()]
+            if model:
+                resident = [host for host in candidates if model in host.loaded]
+                # Hosts never checked might have the model too
+                installed = [host for host in candidates if model in host.models or host.checked is None]
+                candidates = resident or installed or candidates
+            # Unmeasured hosts are assumed as fast as the fastest, so each gets
+            # tried; ties go to the host that has served fewer requests
+            measured = [host.latency for host in candidates if host.latency is not None]
+            default = min(measured) if measured else DEFAULT_LATENCY
+            return sorted(candidates, key=lambda host: (host.load(default), host.requests))
+
+    def pick(self, model=None):
+        """Best available host for ``model`` without leasing it.
+
+        For side traffic such as embeddings: requests sent to it count
+        toward neither the host's load nor its circuit breaker. Raises
+        CircuitOpen when no host is available.
+        """
+        hosts = self.ranked(model)
+        if not hosts:
+            raise self._unavailable()
+        return hosts[0]
+
+    def hosts_with(self, model):
+        """Hosts known to have ``model`` in memory"""
+        with self._lock:
+            return [host for host in self.hosts if model in host.loaded]
+
+    def _finished(self, host, outcome, model=None, elapsed=None, latency=None):
+        """Record the end of a request: ``ok``, ``failed`` (the host's fault) or ``other``.
+
+        ``elapsed`` is the whole request and feeds the routing latency;
+        the breaker gets ``latency``, the time to the first response, if known.
+        """
+        with self._lock:
+            host.in_flight -= 1
+            if outcome == 'failed':
+                host.failures += 1
+            elif outcome == 'ok':
+                host.latency = elapsed if host.latency is None else 0.8 * host.latency + 0.2 * elapsed
+                if model:
+                    host.loaded.add(model)
+        host.breaker.release(outcome, latency if latency is not None else elapsed)
+
+    @contextmanager
+    def lease(self, model=None, errors=HOST_ERRORS):
+        """Pick a host for ``model`` and count the block as one request to it.
+
+        Yields a Lease whose ``url`` is the host's. ``errors`` raised in the
+        block count against the host; other exceptions (a missing model, a
+        cancelled request) don't. Raise OllamaHostError for a 5xx response.
+        Raises CircuitOpen when no host is available.
+        """
+        for host in self.ranked(model):
+            try:
+                host.breaker.acquire()
+            except CircuitOpen:
+                # Another request took the host's half-open trial
+                continue
+            break
+        else:
+            raise self._unavailable()
+        with self._lock:
+            host.in_flight += 1
+            host.requests += 1
+        lease = Lease(host)
+        try:
+            yield lease
+        except errors:
+            self._finished(host, 'failed', elapsed=time.monotonic() - lease.started,
+                           latency=lease.first_response)
+            raise
+        except BaseException:
+            self._finished(host, 'other')
+            raise
+        self._finished(host, 'ok', model, time.monotonic() - lease.started, lease.first_response)
+
+    def mark_unloaded(self, host, model):
+        with self._lock:
+            host.loaded.discard(model)
+
+    def check(self, host):
+        """Refresh a host's installed and loaded models; True if it answered"""
+        try:
+            tags = upstream.get(f'{host.url}/api/tags', timeout=HEALTH_TIMEOUT, retries=0)
+            tags.raise_for_status()
+            ps = upstream.get(f'{host.url}/api/ps', timeout=HEALTH_TIMEOUT, retries=0)
+            loaded = {model['name'] for model in ps.json().get('models', [])} if ps.ok else None
+            models = {model['name']: model.get('size', 0) for model in tags.json()['models']}
+        except Exception as e:
+            with self._lock:
+                if not host.down:
+                    logger.warning(f"Ollama host {host.url} failed its health check, taken out of rotation")
+                host.down = True
+            logger.debug(f"Health check of {host.url} failed: {str(e)}")
+            return False
+        with self._lock:
+            host.models = models
+            if loaded is not None:
+                host.loaded = loaded
+            host.checked = time.time()
+            if host.down:
+                host.down = False
+                logger.info(f"Ollama host {host.url} is healthy again")
+        return True
+
+    def check_all(self):
+        return [self.check(host) for host in self.hosts]
+
+    def fetch_models(self):
+        """Installed models across all hosts with their sizes, first host's order first.
+
+        Refreshes the hosts that are available; raises if none of them
+        answered, or CircuitOpen without trying if none is available.
+        """
+        # The health loop brings hosts that are down back; without it this is their only check
+        hosts = [host for host in self.hosts
+                 if host.breaker.available() and not (host.down and self._thread is not None)]
+        if not hosts:
+            raise self._unavailable()
+        if not any([self.check(host) for host in hosts]):
+            raise OllamaHostError(f"No Ollama host reachable: {', '.join(self.urls)}")
+        models = {}
+        with self._lock:
+            for host in self.hosts:
+                for name, size in host.models.items():
+                    models.setdefault(name, size)
+        return models
+
+    def _loop(self):
+        while True:
+            self.check_all()
+            time.sleep(self.health_interval)
+
+    def start(self):
+        """Start active health checks in the background"""
+        if self.health_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='ollama-health', daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        """Report load, latency, health and models per host"""
+        with self._lock:
+            return {
+                host.url: {
+                    'healthy': host.available(),
+                    'down': host.down,
+                    'circuit': host.breaker.state,
+                    'in_flight': host.in_flight,
+                    'requests': host.requests,
+                    'failures': host.failures,
+                    'latency': round(host.latency, 3) if host.latency is not None else None,
+                    'models': len(host.models),
+                    'loaded': sorted(host.loaded),
+                    'checked': host.checked
+                }
+                for host in self.hosts
+            }
+
+
+# Create a global instance
+ollama_pool = OllamaPool()
+
+registry.collector('ollama_host_in_flight', 'Requests running on each Ollama host', 'gauge', ('host',),
+                   lambda: {(url,): stats['in_flight'] for url, stats in ollama_pool.stats().items()})
+registry.collector('ollama_host_healthy', 'Whether each Ollama host is in rotation', 'gauge', ('host',),
+                   lambda: {(url,): int(stats['healthy']) for url, stats in ollama_pool.stats().items()})
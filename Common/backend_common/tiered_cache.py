@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """In-process LRU bounded by entry count and total payload size"""
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, size = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, expires_at=None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+
+class SQLiteStore:
+    """On-disk key/value store that survives restarts.
+
+    Reads go through SQLite's memory-mapped I/O. Each thread keeps its own
+    connection; the oldest rows are trimmed once the store outgrows
+    ``max_entries``.
+    """
+
+    SCHEMA = '''CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL,
+        created_at REAL NOT NULL
+    )'''
+
+    def __init__(self, path, max_entries=100000, mmap_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(self.SCHEMA)
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at)')
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_bytes)}')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value, expires_at FROM entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None, None
+        return value, expires_at
+
+    def set(self, key, value, expires_at=None):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO entries (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)',
+            (key, value, expires_at, time.time())
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self.prune()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        conn.commit()
+
+    def prune(self):
+        """Drop expired rows, then the oldest rows beyond max_entries"""
+        conn = self._conn()
+        conn.execute('DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        conn.execute(
+            'DELETE FROM entries WHERE key IN ('
+            'SELECT key FROM entries ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def stats(self):
+        count = self._conn().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return {'entries': count, 'path': self.path}
+
+
+class TieredCache:
+    """LRU hot tier in front of an optional SQLite tier.
+
+    Values must be JSON-serialisable. Disk hits are promoted to memory.
+    """
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self._counters[key] += 1
+
+    def get(self, key):
+        """Return ``(value, tier)``, or ``(None, None)`` on a miss"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value, 'memory'
+
+        if self.disk is not None:
+            try:
+                raw, expires_at = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.error(f"Disk cache read failed: {str(e)}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.set(key, value, len(raw), expires_at)
+                self._count('disk_hits')
+                return value, 'disk'
+
+        self._count('misses')
+        return None, None
+
+    def set(self, key, value, ttl=None):
+        raw = json.dumps(value)
+        expires_at = time.time() + ttl if ttl else None
+        self.memory.set(key, value, len(raw), expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, raw, expires_at)
+            except sqlite3.Error as e:
+                logger.error(f"Disk cache write failed: {str(e)}")
+        self._count('sets')
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+        stats['memory'] = self.memory.stats()
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
@@ -0,0 +1,231 @@
+import atexit
+import collections
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Requests taking at least this many seconds have their phases logged; 0 disables
+TRACE_SLOW_SECONDS = float(os.environ.get('TRACE_SLOW_SECONDS', '0'))
+# Slow request breakdowns kept for /api/traces/slow
+TRACE_SLOW_KEEP = int(os.environ.get('TRACE_SLOW_KEEP', '50'))
+# Minimum level of records written
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Characters of a log message kept; the rest is replaced by a marker
+LOG_MAX_CHARS = int(os.environ.get('LOG_MAX_CHARS', '1000'))
+# Share of requests whose records below WARNING are written
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Client supplied IDs are kept only if they are short and plain
+_VALID_ID = re.compile(r'^[\w.:-]{1,64}$')
+
+phase_duration = registry.histogram(
+    'request_phase_seconds', 'Time spent in each phase of a request', ('route', 'phase'))
+log_dropped = registry.counter(
+    'log_records_dropped_total', 'Log records not written, by reason', ('reason',))
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """Phases of one request, in the order they finished"""
+
+    __slots__ = ('request_id', 'route', 'started', 'spans', 'sampled')
+
+    def __init__(self, route, request_id=None, sample_rate=LOG_SAMPLE_RATE):
+        self.request_id = request_id if request_id and _VALID_ID.match(request_id) else uuid.uuid4().hex[:16]
+        self.route = route
+        self.started = time.perf_counter()
+        # (phase, seconds into the request it began, seconds it took)
+        self.spans = []
+        # Decided once so a sampled request is logged whole
+        self.sampled = sample_rate >= 1 or random.random() < sample_rate
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def breakdown(self):
+        """Phases with their start offsets and durations, rounded to milliseconds"""
+        return [{'phase': phase, 'at': round(offset, 3), 'seconds': round(seconds, 3)}
+                for phase, offset, seconds in sorted(self.spans, key=lambda span: span[1])]
+
+    def covered(self):
+        """Seconds inside at least one phase; nested and parallel phases count once"""
+        total = 0.0
+        end = 0.0
+        for _, offset, seconds in sorted(self.spans, key=lambda span: span[1]):
+            total += max(0.0, offset + seconds - max(offset, end))
+            end = max(end, offset + seconds)
+        return total
+
+
+def start_trace(route, request_id=None):
+    """Begin tracing a request in the current context"""
+    trace = Trace(route, request_id)
+    _current.set(trace)
+    return trace
+
+
+@contextmanager
+def span(phase):
+    """Time the block as ``phase`` of the current request; free outside a request"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        trace.spans.append((phase, started - trace.started, seconds))
+        phase_duration.observe(seconds, trace.route, phase)
+
+
+def bind(func, *args):
+    """Wrap a call to run in a copy of the current context.
+
+    Threads don't inherit the context, so work handed to an executor
+    is bound to keep its spans and log records on the request's trace.
+    """
+    context = contextvars.copy_context()
+    return lambda: context.run(func, *args)
+
+
+class SlowRequests:
+    """Per-phase breakdowns of the most recent slow requests"""
+
+    def __init__(self, threshold=TRACE_SLOW_SECONDS, keep=TRACE_SLOW_KEEP):
+        self.threshold = threshold
+        self._recent = collections.deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def finish(self, trace, method, status):
+        """End the current trace, recording and logging it if it was slow"""
+        seconds = trace.elapsed()
+        if self.threshold > 0 and seconds >= self.threshold:
+            phases = trace.breakdown()
+            entry = {
+                'request_id': trace.request_id,
+                'route': trace.route,
+                'method': method,
+                'status': status,
+                'seconds': round(seconds, 3),
+                'untraced': round(max(0.0, seconds - trace.covered()), 3),
+                'phases': phases,
+                'finished': time.time()
+            }
+            with self._lock:
+                self._recent.append(entry)
+                self._count += 1
+            logger.warning(
+                "Slow request %s %s took %.3fs (status %s): %s", method, trace.route, seconds, status,
+                ', '.join(f"{p['phase']} {p['seconds']:.3f}s at +{p['at']:.3f}s" for p in phases) or 'no phases')
+        _current.set(None)
+
+    def stats(self):
+        with self._lock:
+            return {'threshold': self.threshold, 'slow_requests': self._count, 'recent': list(self._recent)}
+
+
+# Create a global instance
+slow_requests = SlowRequests()
+
+
+def trace_requests(app):
+    """Give every request to a Flask app a request ID and a trace"""
+    from flask import g, request
+
+    @app.before_request
+    def begin_trace():
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.trace = start_trace(route, request.headers.get(REQUEST_ID_HEADER))
+
+    @app.after_request
+    def add_request_id(response):
+        trace = g.get('trace')
+        if trace is not None:
+            response.headers[REQUEST_ID_HEADER] = trace.request_id
+            g.trace_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        # Runs after streamed responses finish, so their phases are included
+        trace = g.pop('trace', None)
+        if trace is not None:
+            slow_requests.finish(trace, request.method, g.pop('trace_status', 500))
+
+
+class BackgroundLogHandler(logging.handlers.QueueHandler):
+    """Hand records to a writer thread instead of writing on the request thread.
+
+    Records are stamped with the request ID, messages past ``max_chars`` are
+    cut, records below WARNING from requests left out of the sample are
+    dropped, and so is everything while the queue is full.
+    """
+
+    def __init__(self, max_chars=LOG_MAX_CHARS, size=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(size))
+        self.max_chars = max_chars
+
+    def handle(self, record):
+        trace = _current.get()
+        record.request_id = trace.request_id if trace is not None else '-'
+        if trace is not None and not trace.sampled and record.levelno < logging.WARNING:
+            log_dropped.inc('sampled')
+            return False
+        return super().handle(record)
+
+    def prepare(self, record):
+        # Cut the message before a traceback is appended to it, never the traceback
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            record.msg = f"{message[:self.max_chars]}... [{len(message) - self.max_chars} more chars]"
+            record.args = None
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_dropped.inc('queue_full')
+
+
+_setup_lock = threading.Lock()
+
+
+def setup_logging(fmt, datefmt=None, level=LOG_LEVEL):
+    """Route the root logger through a BackgroundLogHandler writing to stderr.
+
+    ``fmt`` may use ``%(request_id)s``. Later calls leave the first setup
+    in place.
+    """
+    root = logging.getLogger()
+    with _setup_lock:
+        if any(isinstance(handler, BackgroundLogHandler) for handler in root.handlers):
+            return
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(fmt, datefmt))
+        handler = BackgroundLogHandler()
+        listener = logging.handlers.QueueListener(handler.queue, stream)
+        listener.start()
+        # Flush what is queued when the process exits
+        atexit.register(listener.stop)
+        root.addHandler(handler)
+        root.setLevel(level)
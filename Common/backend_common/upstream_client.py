@@ -0,0 +1,277 @@
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden per deployment through the environment
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', '120'))
+POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', '10'))
+MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', '2'))
+RETRY_BACKOFF = float(os.environ.get('UPSTREAM_RETRY_BACKOFF', '0.25'))
+
+# Gateway errors worth retrying on idempotent requests
+RETRY_STATUSES = {502, 503, 504}
+
+
+def _not_sent(error):
+    """Whether a requests error happened while connecting, before anything was sent.
+
+    urllib3 raises ConnectTimeoutError, or its NewConnectionError subclass, only
+    when no connection could be opened; requests wraps it in a MaxRetryError.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    cause = error.args[0] if error.args else None
+    if isinstance(cause, MaxRetryError):
+        cause = cause.reason
+    return isinstance(cause, ConnectTimeoutError)
+
+
+# The Interrupt of the request being sent on this thread, if any
+_sending = threading.local()
+
+
+class Interrupt:
+    """Lets another thread abort a request blocked on its upstream.
+
+    Pass it as ``interrupt=`` to a request; calling it shuts the request's
+    socket down, so a wait for response headers or a read of a streamed body
+    fails at once. For a streamed response, ``detach()`` before closing it,
+    as the connection then goes back to the pool for other requests.
+    """
+
+    def __init__(self):
+        self.fired = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shutdown(connection):
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _attach(self, connection):
+        with self._lock:
+            if self.fired:
+                raise ConnectionAbortedError('Request interrupted')
+            self._connection = connection
+
+    def _connected(self, connection):
+        # Fired after the request began but before its socket existed
+        with self._lock:
+            if self.fired and self._connection is connection:
+                self._shutdown(connection)
+
+    def detach(self):
+        with self._lock:
+            self._connection = None
+
+    def __call__(self):
+        with self._lock:
+            self.fired = True
+            if self._connection is not None:
+                self._shutdown(self._connection)
+
+
+class _Interruptible:
+    """Connection mixin that hands itself to the sending thread's Interrupt"""
+
+    def request(self, *args, **kwargs):
+        interrupt = getattr(_sending, 'interrupt', None)
+        if interrupt is not None:
+            interrupt._attach(self)
+        return super().request(*args, **kwargs)
+
+    def connect(self):
+        super().connect()
+        interrupt = getattr(_sending, 'interrupt', None)
+        if interrupt is not None:
+            interrupt._connected(self)
+
+
+class _HTTPConnection(_Interruptible, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_Interruptible, HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _HTTPConnectionPool, 'https': _HTTPSConnectionPool}
+
+
+class UpstreamClient:
+    """Pooled keep-alive HTTP sessions, one per upstream host"""
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_size=POOL_SIZE, max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'
+
+    def _session(self, host):
+        """Return the shared session for a host, creating it on first use"""
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = _Adapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+                self._stats[host] = {
+                    'requests': 0,
+                    'retries': 0,
+                    'errors': 0,
+                    'in_flight': 0,
+                    'peak_in_flight': 0
+                }
+                logger.debug(f"Opened upstream session for {host}")
+            return session
+
+    def _count(self, host, key, delta=1):
+        with self._lock:
+            stats = self._stats[host]
+            stats[key] += delta
+            if key == 'in_flight' and stats['in_flight'] > stats['peak_in_flight']:
+                stats['peak_in_flight'] = stats['in_flight']
+
+    def _backoff(self, attempt):
+        """Sleep with full jitter before the next attempt"""
+        time.sleep(random.uniform(0, self.retry_backoff * (2 ** attempt)))
+
+    def request(self, method, url, timeout=None, retries=None, interrupt=None, **kwargs):
+        """Send a request through the host's pooled session.
+
+        Failures to connect are retried for every method since nothing
+        reached the upstream. Anything later (a reset or timeout after the
+        request went out, or a gateway error) is only retried for GET, so a
+        POST the upstream may have acted on is never sent twice.
+        ``interrupt`` is an Interrupt another thread may use to abort the
+        request; an interrupted request isn't retried.
+        """
+        host = self._host(url)
+        session = self._session(host)
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        if retries is None:
+            retries = self.max_retries
+        idempotent = method.upper() == 'GET'
+
+        attempt = 0
+        while True:
+            self._count(host, 'requests')
+            self._count(host, 'in_flight')
+            _sending.interrupt = interrupt
+            streaming = False
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retryable = idempotent or _not_sent(e)
+                if attempt >= retries or not retryable or (interrupt is not None and interrupt.fired):
+                    self._count(host, 'errors')
+                    raise
+                logger.debug(f"Retrying {method} {url} after error: {str(e)}")
+            else:
+                if not (idempotent and response.status_code in RETRY_STATUSES and attempt < retries):
+                    if kwargs.get('stream'):
+                        self._hold_in_flight(host, response)
+                        streaming = True
+                    return response
+                response.close()
+                logger.debug(f"Retrying {method} {url} after status {response.status_code}")
+            finally:
+                _sending.interrupt = None
+                if interrupt is not None and not kwargs.get('stream'):
+                    # The body is read and the connection back in the pool
+                    interrupt.detach()
+                if not streaming:
+                    self._count(host, 'in_flight', -1)
+
+            self._count(host, 'retries')
+            self._backoff(attempt)
+            attempt += 1
+
+    def _hold_in_flight(self, host, response):
+        """Keep a streamed response in flight until its body is exhausted or it is closed.
+
+        urllib3 releases the connection at either point, so the count drops
+        on the first release.
+        """
+        raw = response.raw
+        release_conn = raw.release_conn
+        lock = threading.Lock()
+        held = [True]
+
+        def release():
+            with lock:
+                first, held[0] = held[0], False
+            if first:
+                self._count(host, 'in_flight', -1)
+            return release_conn()
+
+        raw.release_conn = release
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Report request counters and connection pool usage per host"""
+        with self._lock:
+            report = {}
+            for host, session in self._sessions.items():
+                stats = dict(self._stats[host])
+                adapter = session.get_adapter(host)
+                connections = idle = 0
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools[key]
+                    connections += pool.num_connections
+                    if pool.pool is not None:
+                        idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                stats['pool_maxsize'] = self.pool_size
+                stats['connections_opened'] = connections
+                stats['idle_connections'] = idle
+                report[host] = stats
+            return report
+
+
+# Create a global instance
+upstream = UpstreamClient()
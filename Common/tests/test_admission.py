@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend_common.admission import BULK, INTERACTIVE, AdmissionCancelled, AdmissionController, AdmissionRejected
+
+
+def wait_queued(controller, model, count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while controller.stats()['models'][model]['queued'] < count:
+        assert time.monotonic() < deadline, 'waiters never queued'
+        time.sleep(0.005)
+
+
+def start_waiter(controller, model, priority, name, order):
+    """Acquire in a thread and append ``name`` to ``order`` once admitted"""
+    def run():
+        controller.acquire(model, priority)
+        order.append(name)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_runs_at_once_below_the_limit():
+    controller = AdmissionController(limit=2, max_queue=4, max_wait=1)
+    controller.acquire('m')
+    controller.acquire('m')
+    stats = controller.stats()
+    assert stats['admitted'] == 2
+    assert stats['queued'] == 0
+    assert stats['models']['m']['running'] == 2
+
+
+def test_sheds_when_the_queue_is_full():
+    controller = AdmissionController(limit=1, max_queue=1, max_wait=5)
+    controller.acquire('m')
+    order = []
+    waiter = start_waiter(controller, 'm', INTERACTIVE, 'queued', order)
+    wait_queued(controller, 'm', 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('m')
+    assert rejected.value.retry_after >= 1
+    assert controller.stats()['rejected'] == 1
+
+    controller.release('m')
+    waiter.join(2)
+    assert order == ['queued']
+
+
+def test_sheds_when_the_expected_wait_exceeds_the_deadline():
+    controller = AdmissionController(limit=1, max_queue=8, max_wait=1)
+    controller.acquire('m')
+    controller.release('m', service_time=5)
+    controller.acquire('m')
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('m')
+    assert rejected.value.retry_after == 5
+    assert controller.stats()['models']['m']['queued'] == 0
+
+
+def test_times_out_without_a_slot():
+    controller = AdmissionController(limit=1, max_queue=4, max_wait=0.05)
+    controller.acquire('m')
+
+    with pytest.raises(AdmissionRejected):
+        controller.acquire('m')
+    stats = controller.stats()
+    assert stats['timed_out'] == 1
+    assert stats['models']['m']['queued'] == 0
+
+    # The abandoned entry must not take the slot
+    controller.release('m')
+    assert controller.stats()['models']['m']['running'] == 0
+
+
+def test_interactive_requests_go_ahead_of_bulk_in_arrival_order():
+    controller = AdmissionController(limit=1, max_queue=8, max_wait=5)
+    controller.acquire('m')
+    order = []
+    expected = []
+    for index, priority in enumerate((BULK, INTERACTIVE, BULK, INTERACTIVE)):
+        start_waiter(controller, 'm', priority, index, order)
+        wait_queued(controller, 'm', index + 1)
+        expected.append((priority, index))
+    expected.sort()
+
+    for _ in expected:
+        admitted = len(order)
+        controller.release('m')
+        deadline = time.monotonic() + 2
+        while len(order) == admitted:
+            assert time.monotonic() < deadline
+            time.sleep(0.005)
+    assert order == [name for _, name in expected]
+
+
+def test_async_waiters_share_the_queue_with_threads():
+    controller = AdmissionController(limit=1, max_queue=8, max_wait=5)
+
+    async def main():
+        order = []
+
+        async def lookup(name):
+            async with controller.async_slot('m'):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(lookup(i) for i in range(5)))
+        return order
+
+    assert asyncio.run(main()) == list(range(5))
+    assert controller.stats()['models']['m']['running'] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    controller = AdmissionController(limit=1, max_queue=8, max_wait=5)
+    controller.acquire('m')
+
+    async def main():
+        task = asyncio.ensure_future(controller.async_acquire('m'))
+        await asyncio.sleep(0.01)
+        assert controller.stats()['models']['m']['queued'] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert controller.stats()['models']['m']['queued'] == 0
+    controller.release('m')
+    assert controller.stats()['models']['m']['running'] == 0
+
+
+def test_aborted_thread_waiter_leaves_the_queue():
+    controller = AdmissionController(limit=1, max_queue=8, max_wait=5)
+    controller.acquire('m')
+    aborts = []
+    failures = []
+
+    def wait():
+        try:
+            controller.acquire('m', on_cancel=aborts.append)
+        except AdmissionCancelled as e:
+            failures.append(e)
+
+    thread = threading.Thread(target=wait, daemon=True)
+    thread.start()
+    wait_queued(controller, 'm', 1)
+    aborts[0]()
+    thread.join(1)
+
+    assert failures
+    stats = controller.stats()
+    assert (stats['cancelled'], stats['models']['m']['queued']) == (1, 0)
+    controller.release('m')
+    assert controller.stats()['models']['m']['running'] == 0
@@ -0,0 +1,125 @@
+import pytest
+
+from backend_common import circuit_breaker
+from backend_common.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    """Stands in for the time module so tests step time by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    return clock
+
+
+def breaker(**kwargs):
+    options = dict(window=30, min_calls=4, error_rate=0.5, slow_seconds=10, slow_rate=0.8,
+                   open_seconds=15, half_open_calls=1)
+    options.update(kwargs)
+    return CircuitBreaker('test', **options)
+
+
+def fail(breaker):
+    with pytest.raises(ValueError):
+        with breaker.guard():
+            raise ValueError('upstream down')
+
+
+def succeed(breaker, elapsed=None):
+    breaker.acquire()
+    breaker.release('ok', elapsed)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        fail(breaker)
+    assert breaker.state == OPEN
+
+
+def test_stays_closed_below_min_calls(clock):
+    b = breaker()
+    for _ in range(3):
+        fail(b)
+    assert b.state == CLOSED
+
+
+def test_opens_at_the_error_rate_and_fails_fast(clock):
+    b = breaker()
+    succeed(b)
+    succeed(b)
+    fail(b)
+    assert b.state == CLOSED
+    fail(b)
+    assert b.state == OPEN
+
+    clock.now += 5
+    with pytest.raises(CircuitOpen) as rejected:
+        b.acquire()
+    assert rejected.value.retry_after == 10
+    assert b.stats()['rejected'] == 1
+
+
+def test_calls_outside_the_window_are_forgotten(clock):
+    b = breaker()
+    for _ in range(3):
+        fail(b)
+    clock.now += 31
+    for _ in range(3):
+        succeed(b)
+    fail(b)
+    assert b.state == CLOSED
+
+
+def test_opens_on_slow_calls(clock):
+    b = breaker()
+    for _ in range(4):
+        succeed(b, elapsed=12)
+    assert b.state == OPEN
+
+
+def test_half_open_success_closes(clock):
+    b = breaker()
+    open_breaker(b)
+    clock.now += 15
+    assert b.state == HALF_OPEN
+
+    succeed(b)
+    assert b.state == CLOSED
+    assert b.stats()['window_calls'] == 0
+
+
+def test_half_open_failure_reopens_for_twice_as_long(clock):
+    b = breaker()
+    open_breaker(b)
+    clock.now += 15
+    fail(b)
+    assert b.state == OPEN
+
+    clock.now += 15
+    assert b.state == OPEN
+    clock.now += 15
+    assert b.state == HALF_OPEN
+
+
+def test_half_open_lets_a_limited_number_of_trials_through(clock):
+    b = breaker(half_open_calls=1)
+    open_breaker(b)
+    clock.now += 15
+    b.acquire()
+    assert not b.available()
+    with pytest.raises(CircuitOpen):
+        b.acquire()
+
+    # A trial that ends without a verdict hands its slot back
+    b.release('other')
+    assert b.state == HALF_OPEN
+    assert b.available()
@@ -0,0 +1,70 @@
+import pytest
+
+from backend_common import circuit_breaker, ollama_pool
+from backend_common.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from backend_common.ollama_pool import OllamaPool
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    monkeypatch.setattr(ollama_pool, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def pool(clock):
+    pool = OllamaPool('http://ollama-test:11434', health_interval=0)
+    pool.hosts[0].breaker = CircuitBreaker('test', window=3600, min_calls=3, slow_seconds=60, slow_rate=0.8)
+    return pool
+
+
+def test_long_healthy_streams_do_not_open_the_breaker(pool, clock):
+    for _ in range(5):
+        with pool.lease('model') as lease:
+            clock.now += 2
+            lease.responded()
+            # Streaming a long summary
+            clock.now += 300
+    host = pool.hosts[0]
+    assert host.breaker.state == CLOSED
+    assert host.breaker.stats()['slow_calls'] == 0
+    # Routing still sees how long the host was busy
+    assert host.latency == pytest.approx(302)
+
+
+def test_slow_first_responses_open_the_breaker(pool, clock):
+    for _ in range(3):
+        with pool.lease('model') as lease:
+            clock.now += 90
+            lease.responded()
+    assert pool.hosts[0].breaker.state == OPEN
+
+
+def test_requests_without_a_first_response_are_judged_whole(pool, clock):
+    for _ in range(3):
+        with pool.lease('model'):
+            clock.now += 90
+    assert pool.hosts[0].breaker.state == OPEN
+
+
+def test_pick_leaves_load_and_breaker_alone(pool):
+    host = pool.pick('embed-model')
+    assert host is pool.hosts[0]
+    assert host.in_flight == 0
+    assert host.breaker.stats()['calls'] == 0
+
+
+def test_pick_raises_when_no_host_is_available(pool):
+    pool.hosts[0].down = True
+    with pytest.raises(circuit_breaker.CircuitOpen):
+        pool.pick()
@@ -0,0 +1,34 @@
+from backend_common.tiered_cache import LRUCache, SQLiteStore, TieredCache
+
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    disk = SQLiteStore(str(tmp_path / 'cache.sqlite3'))
+    TieredCache(LRUCache(), disk).set('key', {'answer': 42}, ttl=60)
+
+    # A fresh memory tier, as after a restart
+    cache = TieredCache(LRUCache(), disk)
+    assert cache.get('key') == ({'answer': 42}, 'disk')
+    assert cache.get('key') == ({'answer': 42}, 'memory')
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
+
+
+def test_misses_and_deletes(tmp_path):
+    cache = TieredCache(LRUCache(), SQLiteStore(str(tmp_path / 'cache.sqlite3')))
+    assert cache.get('key') == (None, None)
+    cache.set('key', 'value')
+    cache.delete('key')
+    assert cache.get('key') == (None, None)
+    assert cache.stats()['misses'] == 2
+
+
+def test_memory_tier_evicts_least_recently_used():
+    memory = LRUCache(max_entries=2)
+    cache = TieredCache(memory)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') == (None, None)
+    assert cache.get('a') == (1, 'memory')
+    assert cache.get('c') == (3, 'memory')
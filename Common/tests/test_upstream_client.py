@@ -0,0 +1,106 @@
+import socket
+import struct
+import threading
+
+import pytest
+import requests
+
+from backend_common.upstream_client import UpstreamClient
+
+
+@pytest.fixture
+def resetting_server():
+    """A server that reads each request, then resets the connection; yields (url, requests seen)"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+    seen = []
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            connection.recv(65536)
+            seen.append(1)
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            connection.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f'http://127.0.0.1:{server.getsockname()[1]}/api/generate', seen
+    server.close()
+
+
+def closed_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def test_post_is_not_resent_after_it_went_out(resetting_server):
+    url, seen = resetting_server
+    client = UpstreamClient(max_retries=2, retry_backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.post(url, json={})
+    assert len(seen) == 1
+
+
+def test_get_is_retried_after_it_went_out(resetting_server):
+    url, seen = resetting_server
+    client = UpstreamClient(max_retries=2, retry_backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.get(url)
+    assert len(seen) == 3
+
+
+def test_post_is_retried_when_it_could_not_connect():
+    url = f'http://127.0.0.1:{closed_port()}/api/generate'
+    client = UpstreamClient(max_retries=2, retry_backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.post(url, json={})
+    stats = client.stats()[url.rsplit('/api', 1)[0]]
+    assert (stats['requests'], stats['retries'], stats['errors']) == (3, 2, 1)
+
+
+@pytest.fixture
+def streaming_server():
+    """A server answering each request with a chunked body of three lines"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            with connection:
+                connection.recv(65536)
+                connection.sendall(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n')
+                for _ in range(3):
+                    connection.sendall(b'3\r\n{}\n\r\n')
+                connection.sendall(b'0\r\n\r\n')
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f'http://127.0.0.1:{server.getsockname()[1]}'
+    server.close()
+
+
+def test_streamed_response_is_in_flight_until_exhausted(streaming_server):
+    client = UpstreamClient()
+    response = client.post(f'{streaming_server}/api/generate', json={}, stream=True)
+    assert client.stats()[streaming_server]['in_flight'] == 1
+    assert len(list(response.iter_lines())) == 3
+    assert client.stats()[streaming_server]['in_flight'] == 0
+    response.close()
+    assert client.stats()[streaming_server]['in_flight'] == 0
+
+
+def test_streamed_response_is_in_flight_until_closed(streaming_server):
+    client = UpstreamClient()
+    response = client.post(f'{streaming_server}/api/generate', json={}, stream=True)
+    assert client.stats()[streaming_server]['in_flight'] == 1
+    response.close()
+    assert client.stats()[streaming_server]['in_flight'] == 0